@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+Benchmarks of BioSim, measuring how the simulation scales with the size of the map and with the
+size of the population, how it copes with large maps full of animals, and how fast the graphics
+are updated.
+
+Every case runs in a fresh process, so that the peak memory use (RSS) of one case does not hide
+the next. The results are written as JSON, and can be compared with a stored baseline:
+
+python bench_biosim.py --output results.json --compare baseline.json
+
+Cases that run more than 25 % slower, or use more than 25 % more memory, than the baseline are
+reported as regressions, and the script exits with status 1. The quick preset runs in a couple of
+minutes, the full preset goes up to a 2000x2000 map and ten million animals.
+
+The engine is chosen with --backend, for instance --backend numba for the array engine with the
+kernels compiled by Numba or --backend mean_field for the deterministic engine, and --precision
+single stores the animals of the array engine in compact types.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import argparse
+import datetime
+import platform
+import resource
+import json
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+"""The folder holding the biosim package, put first on the path so that the script and its
+workers run from a checkout without installing biosim"""
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from biosim.maps import CHECK_SIM_MAP
+
+HERBIVORE = {'species': 'Herbivore', 'age': 5, 'weight': 20}
+CARNIVORE = {'species': 'Carnivore', 'age': 5, 'weight': 20}
+
+CROWD = {'Herbivore': 20, 'Carnivore': 5}
+"""Number of animals of each species placed on every tile of the crowded maps"""
+
+PRESETS = {'quick': {'map_sizes': [(13, 21), (50, 50), (100, 100)],
+                     'crowded_sizes': [(100, 100)],
+                     'populations': [10 ** 2, 10 ** 3, 10 ** 4],
+                     'years': 10, 'frames': 10, 'max_seconds': 30},
+           'full': {'map_sizes': [(13, 21), (50, 50), (100, 100), (200, 200), (500, 500),
+                                  (1000, 1000), (2000, 2000)],
+                    'crowded_sizes': [(100, 100), (500, 500), (1000, 1000)],
+                    'populations': [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7],
+                    'years': 20, 'frames': 20, 'max_seconds': 600}}
+
+TOLERANCE = 0.25
+
+
+def make_map(rows, cols):
+    """
+    Makes a map of the given size, with water on the border and stripes of lowland, highland
+    and desert inside.
+
+    :param rows: Number of rows of the map.
+    :param cols: Number of columns of the map.
+    :return: The map as a string.
+    """
+    inner = 'LLLHHD' * (cols // 6 + 2)
+    lines = ['W' * cols]
+    for i in range(1, rows - 1):
+        lines.append('W' + inner[i % 6:i % 6 + cols - 2] + 'W')
+    lines.append('W' * cols)
+    return '\n'.join(lines)
+
+
+def make_lowland_map(rows, cols):
+    """
+    Makes a map of the given size, with water on the border and lowland inside.
+
+    :param rows: Number of rows of the map.
+    :param cols: Number of columns of the map.
+    :return: The map as a string.
+    """
+    lines = ['W' * cols] + ['W' + 'L' * (cols - 2) + 'W'] * (rows - 2) + ['W' * cols]
+    return '\n'.join(lines)
+
+
+def land_tiles(island_map):
+    """
+    Finds all the tiles of a map that animals can live on.
+
+    :param island_map: The map as a string.
+    :return: List of locations on the form (row, column), counted from 1 as in ini_pop.
+    """
+    return [(i + 1, j + 1) for i, line in enumerate(island_map.splitlines())
+            for j, letter in enumerate(line) if letter != 'W']
+
+
+def spread_population(island_map, num_animals):
+    """
+    Spreads a population evenly over the land of a map, with four herbivores for every carnivore
+    as in checks/check_sim.py.
+
+    :param island_map: The map as a string.
+    :param num_animals: Total number of animals.
+    :return: The population on the same form as ini_pop.
+    """
+    tiles = land_tiles(island_map)
+    num_carns = num_animals // 5
+    num_herbs = num_animals - num_carns
+    population = []
+    for k, loc in enumerate(tiles):
+        herbs = num_herbs // len(tiles) + (k < num_herbs % len(tiles))
+        carns = num_carns // len(tiles) + (k < num_carns % len(tiles))
+        if herbs or carns:
+            population.append({'loc': loc, 'pop': [HERBIVORE] * herbs + [CARNIVORE] * carns})
+    return population
+
+
+def peak_rss_mb():
+    """Returns the peak resident memory of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 2 ** 20
+    return peak / 2 ** 10
+
+
+def run_simulation(island_map, population, years, max_seconds, sim_options, crowd=None):
+    """
+    Simulates a headless island year by year, until the given number of years are simulated or
+    the time is up.
+
+    :param island_map: The map as a string.
+    :param population: The initial population on the same form as ini_pop.
+    :param years: Number of years to simulate.
+    :param max_seconds: Stop after the first year that ends later than this.
+    :param sim_options: Dictionary with extra keyword arguments to BioSim.
+    :param crowd: Dictionary with the number of animals of each species to place on every tile
+     that is not water, with BioSim.add_population_counts, or None.
+    :return: Dictionary with the measurements.
+    """
+    from biosim.simulation import BioSim
+    import numpy as np
+
+    start = time.perf_counter()
+    sim = BioSim(island_map, population, seed=123456, headless=True, **sim_options)
+    if crowd:
+        land = np.array([[letter != 'W' for letter in line] for line in island_map.splitlines()])
+        for species, number in crowd.items():
+            sim.add_population_counts(species, land * number, 5, 20)
+    setup = time.perf_counter() - start
+    animals = 0
+    start = time.perf_counter()
+    while sim.year < years and time.perf_counter() - start < max_seconds:
+        animals += sim.num_animals
+        sim.simulate(1)
+    elapsed = time.perf_counter() - start
+    return {'setup_seconds': setup,
+            'years': sim.year,
+            'seconds': elapsed,
+            'years_per_second': sim.year / elapsed,
+            'animals_per_second': animals / elapsed,
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def run_graphics(frames):
+    """
+    Times updates of the graphics for the check_sim map and population, drawn with the Agg
+    backend.
+
+    :param frames: Number of frames to draw.
+    :return: Dictionary with the measurements.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from biosim.simulation import BioSim
+
+    sim = BioSim(CHECK_SIM_MAP, spread_population(CHECK_SIM_MAP, 1000), seed=123456)
+    sim.timing = True
+    sim.simulate(frames, vis_years=1)
+    report = sim.timing_report()
+    seconds = report['total']['update_graphics']
+    return {'frames': frames,
+            'seconds': seconds,
+            'frames_per_second': frames / seconds,
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def run_case(case):
+    """
+    Runs one benchmark case.
+
+    :param case: Dictionary with the kind of case and its settings.
+    :return: Dictionary with the measurements.
+    """
+    if case['kind'] == 'graphics':
+        return run_graphics(case['frames'])
+    if case['kind'] == 'crowded':
+        return run_simulation(make_lowland_map(*case['size']), [], case['years'],
+                              case['max_seconds'], case.get('sim_options', {}), crowd=CROWD)
+    if case['kind'] == 'map':
+        island_map = make_map(*case['size'])
+        population = [{'loc': (case['size'][0] // 2, case['size'][1] // 2),
+                       'pop': [HERBIVORE] * 150 + [CARNIVORE] * 40}]
+    else:
+        island_map = CHECK_SIM_MAP
+        population = spread_population(island_map, case['animals'])
+    return run_simulation(island_map, population, case['years'], case['max_seconds'],
+                          case.get('sim_options', {}))
+
+
+def make_cases(preset, sim_options=None):
+    """
+    Lists the cases of a preset.
+
+    :param preset: Dictionary with the settings of the preset.
+    :param sim_options: Dictionary with extra keyword arguments to BioSim.
+    :return: Dictionary with the name of each case as key.
+    """
+    sim_options = sim_options or {}
+    cases = {}
+    for rows, cols in preset['map_sizes']:
+        cases['map_{}x{}'.format(cols, rows)] = {'kind': 'map', 'size': (rows, cols),
+                                                  'years': preset['years'],
+                                                  'max_seconds': preset['max_seconds'],
+                                                  'sim_options': sim_options}
+    for rows, cols in preset['crowded_sizes']:
+        cases['crowded_{}x{}'.format(cols, rows)] = {'kind': 'crowded', 'size': (rows, cols),
+                                                      'years': preset['years'],
+                                                      'max_seconds': preset['max_seconds'],
+                                                      'sim_options': sim_options}
+    for animals in preset['populations']:
+        cases['population_{}'.format(animals)] = {'kind': 'population', 'animals': animals,
+                                                  'years': preset['years'],
+                                                  'max_seconds': preset['max_seconds'],
+                                                  'sim_options': sim_options}
+    cases['graphics'] = {'kind': 'graphics', 'frames': preset['frames']}
+    return cases
+
+
+def run_cases(cases):
+    """
+    Runs every case in a fresh process, one at a time.
+
+    :param cases: Dictionary with the name of each case as key.
+    :return: Dictionary with the measurements of each case.
+    """
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for name, case in cases.items():
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[name] = executor.submit(run_case, case).result()
+        print('{:<20} {}'.format(name, ', '.join('{}={:.4g}'.format(key, value)
+                                                for key, value in results[name].items())))
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Compares results with a baseline.
+
+    :param results: Dictionary with the measurements of each case.
+    :param baseline: Dictionary with the baseline measurements of each case.
+    :param tolerance: Relative change allowed before a case counts as a regression.
+    :return: List of strings describing the regressions.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key in ('years_per_second', 'animals_per_second', 'frames_per_second'):
+            if key in result and result[key] < (1 - tolerance) * baseline[name][key]:
+                regressions.append('{}: {} fell from {:.4g} to {:.4g}'.format(
+                    name, key, baseline[name][key], result[key]))
+        if result['peak_rss_mb'] > (1 + tolerance) * baseline[name]['peak_rss_mb']:
+            regressions.append('{}: peak_rss_mb rose from {:.4g} to {:.4g}'.format(
+                name, baseline[name]['peak_rss_mb'], result['peak_rss_mb']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark BioSim.')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--cases', nargs='*', help='only run the cases with these names')
+    parser.add_argument('--output', default='results.json', help='file to write the results to')
+    parser.add_argument('--compare', help='baseline results to compare with')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--backend', default='object',
+                        help="engine of the simulation, 'object', a kernel backend of "
+                             "biosim.kernels or 'mean_field'")
+    parser.add_argument('--precision', choices=['double', 'single'], default='double',
+                        help='types the array engine stores the animals in')
+    parser.add_argument('--hunt_threshold', type=int,
+                        help='number of herbivores on a tile above which the array engine draws '
+                             'the kills in aggregate')
+    args = parser.parse_args(argv)
+
+    sim_options = {'backend': args.backend}
+    if args.precision != 'double':
+        sim_options['precision'] = args.precision
+    if args.hunt_threshold is not None:
+        sim_options['hunt_threshold'] = args.hunt_threshold
+    cases = make_cases(PRESETS[args.preset], sim_options)
+    if args.cases:
+        cases = {name: case for name, case in cases.items() if name in args.cases}
+    results = run_cases(cases)
+    with open(args.output, 'w') as f:
+        json.dump({'meta': {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                            'python': platform.python_version(),
+                            'machine': platform.platform(),
+                            'preset': args.preset,
+                            'backend': args.backend,
+                            'precision': args.precision,
+                            'hunt_threshold': args.hunt_threshold},
+                   'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            sys.exit(1)
+        print('No regressions compared with ' + args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,14 +7,48 @@ from math import exp
 import random
 
 
+def compile_parameters(parameter):
+    """
+    Builds the parameter table of a species from its parameter dictionary
+
+    The table holds all the parameters together with the constants that are derived from them,
+    so that the animals do not have to recalculate these every time they eat, breed or hunt.
+
+    :param parameter: A dictionary with the parameters of a species
+
+    :return: A dictionary with the parameters and the derived constants
+    :rtype: dict
+    """
+    table = dict(parameter)
+    table['minus_phi_weight'] = -parameter['phi_weight']
+    table['birth_weight_limit'] = parameter['zeta'] * (parameter['w_birth'] +
+                                                       parameter['sigma_birth'])
+    table['beta_F'] = parameter['beta'] * parameter['F']
+    if parameter['DeltaPhiMax']:
+        table['inv_DeltaPhiMax'] = 1 / parameter['DeltaPhiMax']
+    else:
+        table['inv_DeltaPhiMax'] = None
+    return table
+
+
 class Animal:
-    """All the shared functions between the different species"""
+    """All the shared functions between the different species
+
+    The class level ``parameter`` dictionary holds the default parameters of the species. An
+    island hands each of its animals a reference to its own copy of the parameters, so that
+    several islands can live side by side in one process without changing each other.
+
+    The animals read their parameters from ``table``, which is compiled from ``parameter`` by
+    compile_parameters and rebuilt every time the parameters are changed.
+    """
+    rng = random
+    table = None
     parameter = {'w_birth': None, 'sigma_birth': None, 'beta': None, 'eta': None,
                  'a_half': None, 'phi_age': None,
                  'w_half': None, 'phi_weight': None, 'mu': None, 'gamma': None, 'zeta': None,
                  'xi': None, 'omega': None, 'F': None, 'DeltaPhiMax': None}
 
-    def __init__(self, weight, age=0):
+    def __init__(self, weight, age=0, parameter=None, rng=None, table=None):
         """When an animal is created it gets a weight and its age
 
         Note that an instance of the animal class should never be created. Choose the herbivore or
@@ -23,12 +57,27 @@ class Animal:
         :param weight: The weight of the newly created animal as float
 
         :param age: The age of the newly created animal as int, defaults to 0
+
+        :param parameter: The parameter dictionary the animal should use, defaults to the
+            parameters of the class
+
+        :param rng: The random number generator the animal should draw from, defaults to the
+            random module
+
+        :param table: The compiled parameter table belonging to parameter, defaults to the table
+            of the class
         """
         if weight < 0 or age < 0:
             raise ValueError('Age and weight must be positive numbers.')
         self.weight = weight
         self.age = age
         self.fitness = 0.8
+        if parameter is not None:
+            self.parameter = parameter
+        if rng is not None:
+            self.rng = rng
+        if table is not None:
+            self.table = table
 
     def __eq__(self, rhs):
         """Makes the animals compare itself with other animals through fitness"""
@@ -56,7 +105,7 @@ class Animal:
 
     def lose_weight(self):
         """Change the animal weight according to its yearly loss"""
-        self.weight -= self.parameter['eta'] * self.weight
+        self.weight -= self.table['eta'] * self.weight
 
     def gain_age(self):
         """Change the animals age by one"""
@@ -72,9 +121,9 @@ class Animal:
         if self.weight <= 0.000001:
             self.fitness = 0
         else:
-            self.fitness = self._q(self.age, self.parameter['a_half'], self.parameter['phi_age']) *\
-                           self._q(self.weight, self.parameter['w_half'],
-                                   -self.parameter['phi_weight'])
+            table = self.table
+            self.fitness = self._q(self.age, table['a_half'], table['phi_age']) *\
+                self._q(self.weight, table['w_half'], table['minus_phi_weight'])
 
     def check_birth(self, n_animals):
         """
@@ -83,12 +132,12 @@ class Animal:
         :return: the weight of the newborn
         :rtype: float
         """
-        if min(1, self.parameter['gamma'] * self.fitness * (n_animals - 1)) > random.random() and \
-                self.weight >= self.parameter['zeta'] * (
-                self.parameter['w_birth'] + self.parameter['sigma_birth']):
-            weight_newborn = random.gauss(self.parameter['w_birth'], self.parameter['sigma_birth'])
-            if self.weight > weight_newborn * self.parameter['xi']:
-                self.weight -= weight_newborn * self.parameter['xi']
+        table = self.table
+        if min(1, table['gamma'] * self.fitness * (n_animals - 1)) > self.rng.random() and \
+                self.weight >= table['birth_weight_limit']:
+            weight_newborn = self.rng.gauss(table['w_birth'], table['sigma_birth'])
+            if self.weight > weight_newborn * table['xi']:
+                self.weight -= weight_newborn * table['xi']
                 return weight_newborn
             else:
                 return 0
@@ -102,8 +151,7 @@ class Animal:
 
         :return: True if the animal is supposed to die
         """
-        if self.weight <= 0.000001 or self.parameter['omega'] * (
-                1 - self.fitness) > random.random():
+        if self.weight <= 0.000001 or self.table['omega'] * (1 - self.fitness) > self.rng.random():
             return True
         else:
             return False
@@ -125,24 +173,39 @@ class Animal:
         return 1 / (1 + exp(phi * (x - x_half)))
 
     @classmethod
-    def set_animal_parameters(cls, p_dict):
+    def set_animal_parameters(cls, p_dict, parameter=None, table=None):
         """
-        Set the animal parameter for all instances of the class
+        Set the animal parameter for all instances of the class, and rebuild the parameter table
 
         :param p_dict: A dictionary with keys containing the new values for the parameter
+
+        :param parameter: The parameter dictionary to update, defaults to the class parameters
+
+        :param table: The parameter table compiled from parameter, defaults to the class table.
+            Must be given together with parameter, since the animals only read the table.
         """
-        for key in p_dict:
-            if key not in cls.parameter:
-                raise ValueError('Invalid parameter name: ' + key)
-            if p_dict[key] < 0:
-                raise ValueError('Parameter values cannot be negative')
-            if key == 'eta':
-                if p_dict['eta'] > 1:
-                    raise ValueError('eta must be on the interval [0,1]')
-            elif key == 'DeltaPhiMax':
-                if p_dict['DeltaPhiMax'] == 0:
-                    raise ValueError('DeltaPhiMax must be more than 0')
-            cls.parameter[key] = p_dict[key]
+        if parameter is None:
+            parameter = cls.parameter
+            table = cls.table
+        elif table is None:
+            raise ValueError('The parameter table must be given with the parameters it is '
+                             'compiled from')
+        try:
+            for key in p_dict:
+                if key not in cls.parameter:
+                    raise ValueError('Invalid parameter name: ' + key)
+                if p_dict[key] < 0:
+                    raise ValueError('Parameter values cannot be negative')
+                if key == 'eta':
+                    if p_dict['eta'] > 1:
+                        raise ValueError('eta must be on the interval [0,1]')
+                elif key == 'DeltaPhiMax':
+                    if p_dict['DeltaPhiMax'] == 0:
+                        raise ValueError('DeltaPhiMax must be more than 0')
+                parameter[key] = p_dict[key]
+        finally:
+            if table is not None:
+                table.update(compile_parameters(parameter))
 
     def check_migration(self):
         """Finds out if the animal will try to migrate
@@ -150,7 +213,7 @@ class Animal:
         :return: True if the animal tries to migrate
         :rtype: bool
         """
-        if self.parameter['mu'] * self.fitness > random.random():
+        if self.table['mu'] * self.fitness > self.rng.random():
             return True
         else:
             return False
@@ -163,6 +226,7 @@ class Herbivore(Animal):
                  'a_half': 40.0, 'phi_age': 0.6,
                  'w_half': 10.0, 'phi_weight': 0.1, 'mu': 0.25, 'gamma': 0.2, 'zeta': 3.5,
                  'xi': 1.2, 'omega': 0.4, 'F': 10, 'DeltaPhiMax': None}
+    table = compile_parameters(parameter)
 
     def eat(self, food):
         """Makes the animal eat from the given amount of food
@@ -173,11 +237,12 @@ class Herbivore(Animal):
         :rtype: int, float
 
         """
-        if food >= self.parameter['F']:
-            self.weight += self.parameter['beta'] * self.parameter['F']
-            return food - self.parameter['F']
+        table = self.table
+        if food >= table['F']:
+            self.weight += table['beta_F']
+            return food - table['F']
         elif food > 0:
-            self.weight += self.parameter['beta'] * food
+            self.weight += table['beta'] * food
             return 0
         else:
             return 0
@@ -191,6 +256,7 @@ class Carnivore(Animal):
                  'w_half': 4.0, 'phi_weight': 0.4, 'mu': 0.4, 'gamma': 0.8, 'zeta': 3.5,
                  'xi': 1.1,
                  'omega': 0.8, 'F': 50, 'DeltaPhiMax': 10.0}
+    table = compile_parameters(parameter)
 
     def c_eat(self, herbivore_list):
         """Makes the carnivore eat from a list of herbivores
@@ -205,22 +271,22 @@ class Carnivore(Animal):
         :return: A list of the animals eaten
         :rtype: list
         """
+        table = self.table
         food_eaten = 0
         animals_eaten = []
         if len(herbivore_list) != 0:
             for i in herbivore_list:
-                if food_eaten < self.parameter['F']:
+                if food_eaten < table['F']:
                     p = 1
                     if self.fitness <= i.fitness:
                         p = 0
-                    elif 0 < (self.fitness - i.fitness) < self.parameter['DeltaPhiMax']:
-                        p = (self.fitness - i.fitness) / self.parameter['DeltaPhiMax']
-                    if p > random.random():
-                        if food_eaten + i.weight < self.parameter['F']:
-                            self.weight += i.weight * self.parameter['beta']
+                    elif 0 < (self.fitness - i.fitness) < table['DeltaPhiMax']:
+                        p = (self.fitness - i.fitness) * table['inv_DeltaPhiMax']
+                    if p > self.rng.random():
+                        if food_eaten + i.weight < table['F']:
+                            self.weight += i.weight * table['beta']
                         else:
-                            self.weight += (self.parameter['F'] - food_eaten) * self.parameter[
-                                'beta']
+                            self.weight += (table['F'] - food_eaten) * table['beta']
                         food_eaten += i.weight
                         self.find_fitness()
                         animals_eaten.append(i)
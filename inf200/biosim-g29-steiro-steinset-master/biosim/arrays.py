@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+An island engine keeping the animals in arrays instead of objects.
+
+Each species is a Population of arrays holding the tile, age, weight and fitness of every animal.
+The phases draw the random numbers they need from a NumPy generator and hand them to the kernels
+of biosim.kernels, which do the work of the loops in Terrain and Animal. The engine has the phase
+methods, get_statistics, collect_events and density_map of Island, so BioSim can run on it, see
+the backend argument of BioSim.
+
+The engine follows the same rules as Island, but draws other random numbers, so it gives the same
+distribution of populations and not the same animals, see biosim.validation.
+"""
+
+from .island import BaseIsland, terrain_grid, population_tiles, population_counts
+from .terrain import Terrain, Water, Lowland, Highland, Desert
+from .animals import Herbivore, Carnivore, compile_parameters
+from .density import DensityPyramid
+from .histograms import StreamingHistogram, complete_specs
+from .populations import CHUNK_SIZE
+from .kernels import get_kernels, resolve_backend, species_constants, fitness_numpy
+import numpy as np
+
+FRESH_FITNESS = 0.8
+"""The fitness of an animal that has been placed on the island or born, as in Animal"""
+
+HUNT_BINS = 64
+"""Number of fitness bins per unit of fitness, or per DeltaPhiMax if smaller, in
+hunt_aggregated"""
+
+PRECISIONS = {'double': {'tiles': np.int64, 'ages': np.float64, 'weights': np.float64,
+                         'fitness': np.float64},
+              'single': {'tiles': np.int32, 'ages': np.uint16, 'weights': np.float32,
+                         'fitness': np.float32}}
+"""The types the attributes of the animals are stored in. Single precision halves the memory
+of a population, and the memory the phases have to read and write."""
+
+MAX_BIN_SIZE = 256
+"""Largest number of herbivores a carnivore hunts with one draw in hunt_aggregated"""
+
+HUNT_DRAWS = 2 ** 20
+"""Largest number of random numbers drawn at a time for the exact hunt of a tile, which bounds
+its memory whatever the number of carnivores and herbivores"""
+
+
+def hunt_aggregated(herb_fitness, herb_weights, carn_ages, carn_weights, carn_fitness, rng, F,
+                    beta, delta_phi_max, constants, bins=HUNT_BINS):
+    """
+    Makes the carnivores of a crowded tile hunt, drawing the kills of a fitness bin at a time
+    instead of one random number per carnivore and herbivore. It takes the place of the hunt
+    kernel of biosim.kernels, with a random generator instead of the draws.
+
+    The walk over the bins costs more than the exact kernel on tiles with up to about 2000
+    herbivores. With the NumPy kernels, one hunt on a tile with 1000 herbivores and 12
+    carnivores took 1.2 ms against 0.8 ms exactly, and on a tile with 50000 herbivores and 625
+    carnivores 0.03 s against 0.38 s exactly.
+
+    Each carnivore walks the herbivores in increasing order of fitness, as in Carnivore.c_eat,
+    but in bins of herbivores whose fitness differs less than min(DeltaPhiMax, 1) / bins. The
+    herbivores with kill probability 1 are killed in order, and the walk ends at the first
+    herbivore at least as fit as the carnivore. In the other bins the number of kills is a
+    binomial draw with the mean kill probability of the bin, the prey are a random subset of the
+    bin, and the carnivore stops at the prey that fills its appetite F.
+
+    The error against the exact hunt is bounded as follows:
+
+    - The kill probability of a herbivore differs less than 1 / bins from the exact one, and the
+      expected number of kills in a bin is exact.
+    - The variance of the kills of a bin is at most n / (4 bins^2) larger, for n herbivores.
+    - The prey of a bin are drawn evenly, where the exact hunt favours the least fit, and so the
+      lightest, herbivores of the bin. Narrow bins keep the weight eaten close.
+    - The fitness of the carnivore is found after each bin instead of after each kill, which
+      only matters when it kills more than once in a bin and is not yet full.
+
+    :param herb_fitness: Fitness of the herbivores of the tile, in increasing order.
+    :param herb_weights: Weights of the herbivores.
+    :param carn_ages: Ages of the carnivores of the tile, in the order they hunt.
+    :param carn_weights: Weights of the carnivores, changed in place.
+    :param carn_fitness: Fitness of the carnivores, changed in place.
+    :param rng: The NumPy random generator.
+    :param F: Appetite of a carnivore.
+    :param beta: Share of the prey eaten that becomes weight.
+    :param delta_phi_max: DeltaPhiMax.
+    :param constants: The fitness constants of carnivores.
+    :param bins: Number of fitness bins per DeltaPhiMax.
+    :return: The number of herbivores removed from the start of the list.
+    """
+    width = min(delta_phi_max, 1.) / bins
+    fitness_sums = np.concatenate([[0.], np.cumsum(herb_fitness)])
+    first = 0
+    for c in range(len(carn_fitness)):
+        food_eaten = 0.
+        kills = 0
+        start = first
+        while food_eaten < F and start < len(herb_fitness) and \
+                herb_fitness[start] < carn_fitness[c]:
+            fitness = carn_fitness[c]
+            if fitness - herb_fitness[start] >= delta_phi_max:
+                stop = np.searchsorted(herb_fitness, fitness - delta_phi_max, side='right')
+                prey = np.arange(start, stop)
+            else:
+                stop = min(np.searchsorted(herb_fitness, min(herb_fitness[start] + width, fitness)),
+                           start + MAX_BIN_SIZE)
+                mean_fitness = (fitness_sums[stop] - fitness_sums[start]) / (stop - start)
+                drawn = rng.binomial(stop - start, (fitness - mean_fitness) / delta_phi_max)
+                prey = start + np.sort(rng.choice(stop - start, drawn, replace=False))
+            eaten = food_eaten + np.cumsum(herb_weights[prey])
+            caught = min(len(prey), np.searchsorted(eaten, F) + 1)
+            if caught:
+                carn_weights[c] += beta * (min(eaten[caught - 1], F) - food_eaten)
+                food_eaten = eaten[caught - 1]
+                kills += caught
+                carn_fitness[c] = fitness_numpy(carn_ages[c], carn_weights[c], constants)
+            start = stop
+        first += kills
+    return min(first, len(herb_fitness))
+
+
+class Population:
+    """
+    The animals of one species, as arrays with one element per animal.
+    """
+
+    sizes = None
+    """Number of animals behind each element, None for one each"""
+
+    def __init__(self, precision='double'):
+        """
+        :param precision: The types of the attributes, a key of PRECISIONS.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError('Precision must be one of {}'.format(', '.join(PRECISIONS)))
+        self.precision = precision
+        dtypes = PRECISIONS[precision]
+        self.tiles = np.zeros(0, dtype=dtypes['tiles'])
+        self.ages = np.zeros(0, dtype=dtypes['ages'])
+        self.weights = np.zeros(0, dtype=dtypes['weights'])
+        self.fitness = np.zeros(0, dtype=dtypes['fitness'])
+
+    def __len__(self):
+        """Returns the number of elements, which is the number of animals unless sizes is set"""
+        return len(self.tiles)
+
+    def like(self):
+        """Returns an empty population of the same kind and precision"""
+        return type(self)(self.precision)
+
+    def append(self, tiles, ages, weights):
+        """
+        Adds animals with fresh fitness.
+
+        :param tiles: The tile of each animal.
+        :param ages: The age of each animal.
+        :param weights: The weight of each animal.
+        """
+        self.tiles = np.concatenate([self.tiles, np.asarray(tiles, dtype=self.tiles.dtype)])
+        self.ages = np.concatenate([self.ages, self._checked_ages(ages)])
+        self.weights = np.concatenate([self.weights,
+                                       np.asarray(weights, dtype=self.weights.dtype)])
+        self.fitness = np.concatenate([self.fitness, np.full(len(tiles), FRESH_FITNESS,
+                                                             dtype=self.fitness.dtype)])
+
+    def _checked_ages(self, ages):
+        """
+        Casts ages to the type they are stored in. Ages stored as integers must be whole numbers
+        within the range of the type, so that they are not cut or wrapped around.
+
+        :param ages: The age of each animal.
+        :return: The ages as an array of the type of the ages.
+        """
+        ages = np.asarray(ages)
+        if np.issubdtype(self.ages.dtype, np.integer) and len(ages):
+            limits = np.iinfo(self.ages.dtype)
+            if ages.min() < limits.min or ages.max() > limits.max:
+                raise ValueError('Ages must be between {} and {} in {} precision'.format(
+                    limits.min, limits.max, self.precision))
+            if (ages != np.floor(ages)).any():
+                raise ValueError('Ages must be whole numbers.')
+        return ages.astype(self.ages.dtype)
+
+    def take(self, index):
+        """
+        Keeps only some of the animals, in the given order.
+
+        :param index: Boolean mask or array of positions of the animals kept.
+        """
+        self.tiles = self.tiles[index]
+        self.ages = self.ages[index]
+        self.weights = self.weights[index]
+        self.fitness = self.fitness[index]
+
+    def counts(self, num_tiles):
+        """Returns the number of animals on each tile, as a flat array"""
+        return np.bincount(self.tiles, minlength=num_tiles)
+
+    def animal_values(self, name):
+        """Returns the array of the given name, ages, weights or fitness, with one value per
+        animal"""
+        return getattr(self, name)
+
+
+class ArrayIsland(BaseIsland):
+    """
+    Implements the island of Island with the animals of each species in a Population.
+    """
+
+    population_type = Population
+    hunt_threshold = None
+    """Number of herbivores on a tile above which the carnivores hunt with hunt_aggregated,
+    None to always hunt exactly. The aggregated hunt only pays off on tiles with thousands of
+    herbivores, so a threshold of about 5000 is sensible; a small one makes the hunt slower."""
+
+    def __init__(self, island_text, seed, ini_pop=None, backend='auto', hunt_threshold=None,
+                 precision='double'):
+        """
+        :param island_text: a string containing lines with the same amount of characters
+            indicating terrain type of each tile on the entire island.
+        :param seed: sets seed for random functions
+        :param ini_pop: list of animals that should be set out on the island when initiated.
+        :param backend: the kernels to use, see biosim.kernels
+        :param hunt_threshold: number of herbivores on a tile above which the kills are drawn
+            in aggregate, see hunt_aggregated. Defaults to the class attribute.
+        :param precision: the types the animals are stored in, 'double' or 'single', see
+            PRECISIONS.
+        """
+        if hunt_threshold is not None:
+            self.hunt_threshold = hunt_threshold
+        self.island_text = island_text.split()
+        self.terrain = terrain_grid(island_text)
+        self.check_valid_boundaries()
+        self.shape = self.terrain.shape
+        self.num_tiles = self.terrain.size
+        self.backend = resolve_backend(backend)
+        self.parameters = {'Herbivore': dict(Herbivore.parameter),
+                           'Carnivore': dict(Carnivore.parameter)}
+        self.tables = {species: compile_parameters(parameter)
+                       for species, parameter in self.parameters.items()}
+        self.rng = np.random.default_rng(seed)
+
+        tile_types = (Water, Lowland, Highland, Desert)
+        codes = self.terrain.ravel()
+        self.fodder = np.array([tile_types[code].F_max for code in range(len(tile_types))],
+                               dtype=float)[codes]
+        self.movable = np.array([tile_types[code].movable for code in range(len(tile_types))])[
+            codes]
+        inner = np.zeros(self.shape, dtype=bool)
+        inner[1:-1, 1:-1] = True
+        self.inner = inner.ravel()
+
+        self.precision = precision
+        self.populations = {species: self.population_type(precision) for species in self.species}
+        self.density = {species: DensityPyramid(self.shape) for species in self.species}
+        self.events = {}
+        self.reset_events()
+        if ini_pop:
+            self.spawn_animal(ini_pop)
+
+    @property
+    def kernels(self):
+        """The kernels of the backend"""
+        return get_kernels(self.backend)
+
+    def set_params(self, landscape, params):
+        """
+        Updates max value of fodder on lowland, highland or desert of this island, see Island.
+
+        :param landscape: string of one letter, either H, L or D.
+        :param params: dictionary on form {'f_max': value}
+        """
+        if landscape not in self.landscapes:
+            raise ValueError('Landscape must be L, D or H.')
+        code = 'WLHD'.index(landscape)
+        self.fodder[self.terrain.ravel() == code] = params['f_max']
+
+    def add_population_tiles(self, species, rows, cols, ages, weights):
+        """Places animals of one species on any tiles, given as arrays, with one append to the
+        population, see Island"""
+        tiles, ages, weights = population_tiles(self.shape, self.species, species, rows, cols,
+                                                ages, weights)
+        self.populations[species].append(tiles, ages, weights)
+
+    def add_population_counts(self, species, counts, age, weight):
+        """Places a number of equal animals of one species on every tile, see Island"""
+        counts = population_counts(self.shape, self.species, species, counts, age, weight)
+        tiles = np.repeat(np.arange(self.num_tiles), counts.ravel())
+        self.populations[species].append(tiles, np.full(len(tiles), float(age)),
+                                         np.full(len(tiles), float(weight)))
+
+    def reset_events(self):
+        """Returns the event counters of the tiles, as flat arrays, and starts from zero again"""
+        events = self.events
+        self.events = {name: np.zeros(self.num_tiles,
+                                      dtype=float if name == 'fodder_eaten' else np.int64)
+                       for name in Terrain.event_names}
+        return events
+
+    def _uniform(self, size):
+        """Draws uniform random numbers in the precision of the fitness, so that they are
+        compared with probabilities of the same type"""
+        return self.rng.random(size, dtype=PRECISIONS[self.precision]['fitness'])
+
+    def _count(self, name, tiles, counts=None):
+        """Adds events to the counter of the given name, one for each of the tiles unless the
+        number of events on each is given by counts"""
+        self.events[name] += np.bincount(tiles, counts, minlength=self.num_tiles).astype(np.int64)
+
+    def all_herbivores_eat(self):
+        """Make all the herbivores on the island eat, in random order on each tile"""
+        herbivores = self.populations['Herbivore']
+        if len(herbivores) == 0:
+            return
+        herbivores.take(np.lexsort((self._uniform(len(herbivores)), herbivores.tiles)))
+        table = self.tables['Herbivore']
+        eaten = self.kernels['feed'](herbivores.tiles, herbivores.ages, herbivores.weights,
+                                     herbivores.fitness, self.fodder, float(table['F']),
+                                     float(table['beta']), float(table['beta_F']),
+                                     species_constants(table))
+        self.events['fodder_eaten'] += eaten
+
+    def all_carnivores_eat(self):
+        """Make all the carnivores on the island hunt, with the weakest herbivores and the fittest
+        carnivores first on each tile"""
+        self._hunt(self.populations['Herbivore'], self.populations['Carnivore'])
+
+    def _hunt(self, herbivores, carnivores):
+        """
+        Makes the carnivores hunt the herbivores, tile by tile, and removes the prey. On tiles
+        with more than hunt_threshold herbivores the kills are drawn with hunt_aggregated.
+
+        :param herbivores: The herbivores, as single animals.
+        :param carnivores: The carnivores, as single animals.
+        """
+        if len(herbivores) == 0 or len(carnivores) == 0:
+            return
+        herbivores.take(np.lexsort((herbivores.fitness, herbivores.tiles)))
+        carnivores.take(np.lexsort((-carnivores.fitness, carnivores.tiles)))
+        herb_starts = np.searchsorted(herbivores.tiles, np.arange(self.num_tiles + 1))
+        carn_starts = np.searchsorted(carnivores.tiles, np.arange(self.num_tiles + 1))
+        hunted = np.flatnonzero((np.diff(herb_starts) > 0) & (np.diff(carn_starts) > 0))
+        table = self.tables['Carnivore']
+        hunt = self.kernels['hunt']
+        eaten = np.zeros(len(herbivores), dtype=bool)
+        for tile in hunted:
+            herbs = slice(herb_starts[tile], herb_starts[tile + 1])
+            carns = slice(carn_starts[tile], carn_starts[tile + 1])
+            ages, weights, fitness = (carnivores.ages[carns], carnivores.weights[carns],
+                                      carnivores.fitness[carns])
+            if self.hunt_threshold is not None and \
+                    herbs.stop - herbs.start > self.hunt_threshold:
+                removed = hunt_aggregated(herbivores.fitness[herbs], herbivores.weights[herbs],
+                                          ages, weights, fitness, self.rng, float(table['F']),
+                                          float(table['beta']), float(table['DeltaPhiMax']),
+                                          species_constants(table))
+            else:
+                removed = self._hunt_exact(hunt, herbivores.fitness[herbs],
+                                           herbivores.weights[herbs], ages, weights, fitness,
+                                           table)
+            eaten[herbs.start:herbs.start + removed] = True
+        self._count('kills', herbivores.tiles[eaten])
+        herbivores.take(~eaten)
+
+    def _hunt_exact(self, hunt, herb_fitness, herb_weights, carn_ages, carn_weights,
+                    carn_fitness, table):
+        """
+        Makes the carnivores of a tile hunt with the hunt kernel, a block of carnivores at a
+        time. Each block gets one row of random numbers per carnivore for the herbivores that are
+        left, and no more than HUNT_DRAWS numbers, so the memory grows with the number of
+        herbivores and not with the number of carnivores times herbivores.
+
+        :param hunt: The hunt kernel.
+        :param herb_fitness: Fitness of the herbivores of the tile, in increasing order.
+        :param herb_weights: Weights of the herbivores.
+        :param carn_ages: Ages of the carnivores of the tile, in the order they hunt.
+        :param carn_weights: Weights of the carnivores, changed in place.
+        :param carn_fitness: Fitness of the carnivores, changed in place.
+        :param table: The parameter table of carnivores.
+        :return: The number of herbivores removed from the start of the list.
+        """
+        removed = 0
+        start = 0
+        while start < len(carn_fitness) and removed < len(herb_fitness):
+            left = len(herb_fitness) - removed
+            block = slice(start, start + max(1, HUNT_DRAWS // left))
+            draws = self._uniform((len(carn_fitness[block]), left))
+            removed += hunt(herb_fitness[removed:], herb_weights[removed:], carn_ages[block],
+                            carn_weights[block], carn_fitness[block], draws, float(table['F']),
+                            float(table['beta']), float(table['inv_DeltaPhiMax']),
+                            float(table['DeltaPhiMax']), species_constants(table))
+            start = block.stop
+        return removed
+
+    def all_eat(self):
+        """Make all the herbivores and then all the carnivores eat"""
+        self.all_herbivores_eat()
+        self.all_carnivores_eat()
+
+    def all_breed(self):
+        """Make all the animals procreate, and place the newborn on the tile of the parent"""
+        for species, population in self.populations.items():
+            if len(population) < 2:
+                continue
+            table = self.tables[species]
+            counts = population.counts(self.num_tiles)[population.tiles]
+            newborn = self.kernels['breed'](
+                counts, population.weights, population.fitness, self._uniform(len(population)),
+                self.rng.normal(table['w_birth'], table['sigma_birth'], len(population)),
+                float(table['gamma']), float(table['birth_weight_limit']), float(table['xi']))
+            born = newborn > 0
+            self._count('births', population.tiles[born])
+            population.append(population.tiles[born], np.zeros(born.sum()), newborn[born])
+
+    def all_migrate(self):
+        """Make animals of both species migrate to a neighbouring tile"""
+        for species in ('Carnivore', 'Herbivore'):
+            population = self.populations[species]
+            if len(population) == 0:
+                continue
+            origins = population.tiles.copy()
+            moves = self.kernels['migrate'](
+                population.tiles, population.fitness, self._uniform(len(population)),
+                self.rng.integers(4, size=len(population)), float(self.tables[species]['mu']),
+                self.movable, self.inner, self.shape[1])
+            self._count('migrations_attempted', origins[moves > 0])
+            self._count('migrations_completed', origins[moves == 2])
+
+    def all_age(self):
+        """Make all animals on the island age by one year"""
+        for population in self.populations.values():
+            population.ages += 1
+
+    def all_lose_weight(self):
+        """Make all the animals lose weight"""
+        for species, population in self.populations.items():
+            population.weights -= self.tables[species]['eta'] * population.weights
+
+    def all_die(self):
+        """Find the fitness of all the animals, and remove those that die"""
+        for species, population in self.populations.items():
+            table = self.tables[species]
+            population.fitness[:] = fitness_numpy(population.ages, population.weights,
+                                                  species_constants(table))
+            alive = (population.weights > 0.000001) & \
+                ~(table['omega'] * (1 - population.fitness) > self._uniform(len(population)))
+            self._count('deaths', population.tiles[~alive])
+            population.take(alive)
+
+    def all_end_of_year(self):
+        """Make all the animals age, lose weight and then die, in one pass over the animals"""
+        for species in self.populations:
+            self._end_of_year(species, self.tables[species]['eta'])
+
+    def _end_of_year(self, species, eta):
+        """Runs the end of year kernel on a species, with the given weight loss"""
+        population = self.populations[species]
+        if len(population) == 0:
+            return
+        table = self.tables[species]
+        alive = self.kernels['end_of_year'](population.ages, population.weights,
+                                            population.fitness, self._uniform(len(population)),
+                                            float(eta), float(table['omega']),
+                                            species_constants(table))
+        self._count('deaths', population.tiles[~alive])
+        population.take(alive)
+
+    def collect_events(self):
+        """Gathers up the event counters of all the tiles, and resets them, see Island"""
+        return {name: counts.reshape(self.shape) for name, counts in self.reset_events().items()}
+
+    def get_statistics(self, hist_specs=None, histograms=True):
+        """Gathers up the density of each species and histograms of the animals, see Island"""
+        hist_specs = complete_specs(hist_specs)
+        names = ('age', 'fitness', 'weight')
+        herbivores = self.populations['Herbivore']
+        carnivores = self.populations['Carnivore']
+        herb_map = herbivores.counts(self.num_tiles).reshape(self.shape)
+        carn_map = carnivores.counts(self.num_tiles).reshape(self.shape)
+        self.density['Herbivore'].update(herb_map)
+        self.density['Carnivore'].update(carn_map)
+        statistics = {'herb_map': herb_map, 'carn_map': carn_map,
+                      'num_herb': int(herb_map.sum()), 'num_carn': int(carn_map.sum())}
+        if histograms:
+            for name, attribute in zip(names, ('ages', 'fitness', 'weights')):
+                histogram = StreamingHistogram.from_spec(hist_specs[name])
+                for index, population in enumerate((herbivores, carnivores)):
+                    histogram.add_array(index, getattr(population, attribute), population.sizes)
+                statistics[name] = histogram.counts
+        return statistics
+
+    def get_maps(self):
+        """Gathers up the density, the values of the animals and the number of each species, in
+        the form of Island.get_maps"""
+        statistics = self.get_statistics(histograms=False)
+        populations = (self.populations['Herbivore'], self.populations['Carnivore'])
+        return [statistics['herb_map'].tolist(), statistics['carn_map'].tolist(),
+                [list(population.animal_values('ages')) for population in populations],
+                [list(population.animal_values('fitness')) for population in populations],
+                [list(population.animal_values('weights')) for population in populations],
+                statistics['num_herb'], statistics['num_carn']]
+
+    def animal_chunks(self, chunk_size=CHUNK_SIZE):
+        """Hands out the animals a chunk at a time, species by species, see Island"""
+        for index, species in enumerate(self.species):
+            population = self.populations[species]
+            sizes = np.ones(len(population), dtype=np.int64) if population.sizes is None else \
+                population.sizes
+            # Elements holding about chunk_size animals go together, a large cohort alone
+            ends = np.searchsorted(np.cumsum(sizes), np.arange(chunk_size, sizes.sum(),
+                                                                chunk_size), side='right')
+            for elements in np.split(np.arange(len(population)), np.unique(ends)):
+                if len(elements) == 0:
+                    continue
+                repeats = sizes[elements]
+                rows, cols = np.divmod(np.repeat(population.tiles[elements], repeats),
+                                       self.shape[1])
+                yield {'row': rows + 1, 'col': cols + 1,
+                       'species': np.full(len(rows), index, dtype=np.int64),
+                       'age': np.repeat(population.ages[elements], repeats),
+                       'weight': np.repeat(population.weights[elements], repeats),
+                       'fitness': np.repeat(population.fitness[elements], repeats)}
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+An island engine keeping animals with the same state together as cohorts.
+
+A cohort is a number of animals of a species on the same tile with the same age, weight and
+fitness, stored once with a count. Placing 150 equal herbivores on a tile makes a single cohort,
+and the animals of a cohort stay together as long as nothing tells them apart:
+
+- Death and migration are binomial and multinomial draws over the animals of each cohort.
+- Feeding draws how many animals of each cohort get a full meal, the last bit of fodder or
+  nothing, since the animals of a tile eat in random order.
+- Breeding draws how many animals of each cohort give birth. Every birth has its own birth
+  weight, so the mothers and the newborn become cohorts of one.
+- Hunting goes one carnivore and one herbivore at a time, so on tiles with both species the
+  cohorts are split into single animals for the hunt, as in biosim.arrays.
+
+Cohorts that come to have the same state are joined again after every phase. The work of a
+year then grows with the number of distinct states instead of the number of animals, which
+helps most early in a run, before births have spread the weights.
+
+The engine follows the rules of Island and gives the same distribution of populations, see
+biosim.validation.
+"""
+
+from .arrays import ArrayIsland, Population
+from .island import population_counts
+from .kernels import species_constants, fitness_numpy
+import numpy as np
+
+
+def feeding_groups(num_animals, fodder, F):
+    """
+    Finds how many herbivores of a tile get each kind of meal, when they eat one at a time as in
+    Terrain.herb_eat_on_tile.
+
+    :param num_animals: Number of herbivores on the tile.
+    :param fodder: The fodder on the tile.
+    :param F: Appetite of a herbivore.
+    :return: Tuple with the number of herbivores eating F that get their fitness found again, the
+     number eating F that do not, since they ate the last of the fodder, and the fodder eaten by
+     the herbivore getting the last bit of fodder, 0 if none does.
+    """
+    if fodder <= 0:
+        return 0, 0, 0.
+    if F <= 0:
+        return num_animals, 0, 0.
+    full = min(num_animals, int(fodder // F))
+    refreshed = min(full, int(np.ceil(fodder / F)) - 1)
+    left = fodder - full * F
+    return refreshed, full - refreshed, left if full < num_animals and left > 0 else 0.
+
+
+class Cohorts(Population):
+    """
+    The animals of one species, as arrays with one element per cohort.
+    """
+
+    def __init__(self, precision='double'):
+        """
+        :param precision: The types of the attributes, a key of PRECISIONS.
+        """
+        super().__init__(precision)
+        self.sizes = np.zeros(0, dtype=np.int64)
+
+    @property
+    def num_animals(self):
+        """The number of animals in all the cohorts"""
+        return int(self.sizes.sum())
+
+    def append(self, tiles, ages, weights, sizes=None, fitness=None):
+        """
+        Adds cohorts.
+
+        :param tiles: The tile of each cohort.
+        :param ages: The age of each cohort.
+        :param weights: The weight of each cohort.
+        :param sizes: The number of animals in each cohort, defaults to one each.
+        :param fitness: The fitness of each cohort, defaults to the fitness of new animals.
+        """
+        super().append(tiles, ages, weights)
+        if fitness is not None and len(tiles):
+            self.fitness[-len(tiles):] = fitness
+        if sizes is None:
+            sizes = np.ones(len(tiles), dtype=np.int64)
+        self.sizes = np.concatenate([self.sizes, np.asarray(sizes, dtype=np.int64)])
+
+    def extend(self, other, index=None, tiles=None, sizes=None, weights=None, fitness=None):
+        """
+        Adds copies of cohorts of another population, with some of the values replaced.
+
+        :param other: The other population.
+        :param index: Positions of the cohorts copied, defaults to all.
+        :param tiles: New tiles of the copies.
+        :param sizes: New sizes of the copies.
+        :param weights: New weights of the copies.
+        :param fitness: New fitness of the copies.
+        """
+        if index is None:
+            index = slice(None)
+        self.append(other.tiles[index] if tiles is None else tiles, other.ages[index],
+                    other.weights[index] if weights is None else weights,
+                    other.sizes[index] if sizes is None else sizes,
+                    other.fitness[index] if fitness is None else fitness)
+
+    def take(self, index):
+        """
+        Keeps only some of the cohorts, in the given order.
+
+        :param index: Boolean mask or array of positions of the cohorts kept.
+        """
+        super().take(index)
+        self.sizes = self.sizes[index]
+
+    def counts(self, num_tiles):
+        """Returns the number of animals on each tile, summed over the cohorts, as a flat
+        array"""
+        return np.bincount(self.tiles, self.sizes, minlength=num_tiles).astype(np.int64)
+
+    def animal_values(self, name):
+        """Returns the array of the given name, ages, weights or fitness, with the value of each
+        cohort repeated once per animal"""
+        return np.repeat(getattr(self, name), self.sizes)
+
+    def expand(self, index):
+        """
+        Splits cohorts into single animals.
+
+        :param index: Positions of the cohorts split.
+        :return: Cohorts of one animal each.
+        """
+        animals = self.like()
+        animals.extend(self, np.repeat(index, self.sizes[index]))
+        animals.sizes[:] = 1
+        return animals
+
+    def merge(self):
+        """Removes empty cohorts, and joins cohorts with the same tile and state"""
+        self.take(self.sizes > 0)
+        if len(self) < 2:
+            return
+        self.take(np.lexsort((self.fitness, self.weights, self.ages, self.tiles)))
+        new = np.r_[True, (np.diff(self.tiles) != 0) | (np.diff(self.ages) != 0) |
+                    (np.diff(self.weights) != 0) | (np.diff(self.fitness) != 0)]
+        starts = np.flatnonzero(new)
+        sizes = np.add.reduceat(self.sizes, starts)
+        self.take(starts)
+        self.sizes = sizes
+
+
+class CohortIsland(ArrayIsland):
+    """
+    Implements the island of Island with the animals of each species in Cohorts.
+    """
+
+    population_type = Cohorts
+
+    def add_population_tiles(self, species, rows, cols, ages, weights):
+        """Places animals of one species on any tiles, joining equal animals into cohorts with
+        one merge"""
+        super().add_population_tiles(species, rows, cols, ages, weights)
+        self.populations[species].merge()
+
+    def add_population_counts(self, species, counts, age, weight):
+        """Places a number of equal animals of one species on every tile, as one cohort per
+        tile"""
+        counts = population_counts(self.shape, self.species, species, counts, age, weight)
+        tiles = np.flatnonzero(counts)
+        self.populations[species].append(tiles, np.full(len(tiles), float(age)),
+                                         np.full(len(tiles), float(weight)),
+                                         counts.ravel()[tiles])
+        self.populations[species].merge()
+
+    def all_herbivores_eat(self):
+        """Make all the herbivores on the island eat, in random order on each tile"""
+        herbivores = self.populations['Herbivore']
+        if len(herbivores) == 0:
+            return
+        table = self.tables['Herbivore']
+        F = table['F']
+        herbivores.take(np.argsort(herbivores.tiles, kind='stable'))
+        num_animals = herbivores.counts(self.num_tiles)
+        self.events['fodder_eaten'] += np.where(num_animals > 0,
+                                                np.minimum(self.fodder, num_animals * F), 0.)
+
+        # The columns are the animals of each cohort with a full meal and fitness found again,
+        # with a full meal only, and with the last bit of fodder
+        groups = np.zeros((len(herbivores), 3), dtype=np.int64)
+        plenty = self.fodder[herbivores.tiles] > num_animals[herbivores.tiles] * F
+        groups[plenty, 0] = herbivores.sizes[plenty]
+        last_bit = np.zeros(self.num_tiles)
+        starts = np.searchsorted(herbivores.tiles, np.arange(self.num_tiles + 1))
+        scarce = (num_animals > 0) & (self.fodder > 0) & (self.fodder <= num_animals * F)
+        for tile in np.flatnonzero(scarce):
+            cohorts = slice(starts[tile], starts[tile + 1])
+            sizes = herbivores.sizes[cohorts].copy()
+            refreshed, full, last_bit[tile] = feeding_groups(num_animals[tile], self.fodder[tile],
+                                                             F)
+            for column, number in enumerate((refreshed, full, int(last_bit[tile] > 0))):
+                if number == 0:
+                    continue
+                drawn = sizes.copy() if number == sizes.sum() else \
+                    self.rng.multivariate_hypergeometric(sizes, number)
+                groups[cohorts, column] = drawn
+                sizes -= drawn
+
+        fed = herbivores.like()
+        for column in range(3):
+            index = np.flatnonzero(groups[:, column])
+            if column < 2:
+                weights = herbivores.weights[index] + table['beta_F']
+            else:
+                weights = herbivores.weights[index] + \
+                    table['beta'] * last_bit[herbivores.tiles[index]]
+            fitness = None
+            if column == 0:
+                fitness = fitness_numpy(herbivores.ages[index], weights, species_constants(table))
+            fed.extend(herbivores, index, sizes=groups[index, column], weights=weights,
+                       fitness=fitness)
+        fed.extend(herbivores, sizes=herbivores.sizes - groups.sum(axis=1))
+        fed.merge()
+        self.populations['Herbivore'] = fed
+
+    def all_carnivores_eat(self):
+        """Make all the carnivores on the island hunt, splitting the cohorts on tiles with both
+        species into single animals"""
+        herbivores = self.populations['Herbivore']
+        carnivores = self.populations['Carnivore']
+        hunted = (herbivores.counts(self.num_tiles) > 0) & (carnivores.counts(self.num_tiles) > 0)
+        if not hunted.any():
+            return
+        prey = hunted[herbivores.tiles]
+        hunters = hunted[carnivores.tiles]
+        herb_animals = herbivores.expand(np.flatnonzero(prey))
+        carn_animals = carnivores.expand(np.flatnonzero(hunters))
+        herbivores.take(~prey)
+        carnivores.take(~hunters)
+        self._hunt(herb_animals, carn_animals)
+        for population, animals in ((herbivores, herb_animals), (carnivores, carn_animals)):
+            population.extend(animals)
+            population.merge()
+
+    def all_breed(self):
+        """Make all the animals procreate, drawing the number of births of each cohort"""
+        for species, population in self.populations.items():
+            if population.num_animals < 2:
+                continue
+            table = self.tables[species]
+            counts = population.counts(self.num_tiles)[population.tiles]
+            probability = np.where((counts > 1) & (population.weights >=
+                                                   table['birth_weight_limit']),
+                                   np.minimum(1., table['gamma'] * population.fitness *
+                                              (counts - 1)), 0.)
+            tries = self.rng.binomial(population.sizes, probability)
+            parents = np.repeat(np.arange(len(population)), tries)
+            newborn = self.rng.normal(table['w_birth'], table['sigma_birth'], len(parents))
+            born = (newborn > 0) & (population.weights[parents] > newborn * table['xi'])
+            parents, newborn = parents[born], newborn[born]
+            self._count('births', population.tiles[parents])
+            population.sizes -= np.bincount(parents, minlength=len(population))
+            population.extend(population, parents, sizes=np.ones(len(parents)),
+                              weights=population.weights[parents] - newborn * table['xi'])
+            population.append(population.tiles[parents], np.zeros(len(parents)), newborn)
+            population.merge()
+
+    def all_migrate(self):
+        """Make animals of both species migrate, drawing how many animals of each cohort move in
+        each direction"""
+        offsets = np.array([-self.shape[1], self.shape[1], 1, -1])
+        for species in ('Carnivore', 'Herbivore'):
+            population = self.populations[species]
+            if len(population) == 0:
+                continue
+            inner = self.inner[population.tiles]
+            probability = np.where(inner, np.clip(self.tables[species]['mu'] *
+                                                  population.fitness, 0, 1), 0.)
+            pvals = np.column_stack([probability / 4] * 4 + [1 - probability])
+            moves = self.rng.multinomial(population.sizes, pvals)[:, :4]
+            targets = np.where(inner[:, None], population.tiles[:, None] + offsets,
+                               population.tiles[:, None])
+            moved = moves * self.movable[targets]
+            self._count('migrations_attempted', population.tiles, moves.sum(axis=1))
+            self._count('migrations_completed', population.tiles, moved.sum(axis=1))
+            origins = population.like()
+            origins.extend(population)
+            population.sizes -= moved.sum(axis=1)
+            for direction in range(4):
+                index = np.flatnonzero(moved[:, direction])
+                population.extend(origins, index, tiles=targets[index, direction],
+                                  sizes=moved[index, direction])
+            population.merge()
+
+    def all_die(self):
+        """Find the fitness of all the animals, and draw the number of deaths of each cohort"""
+        for species in self.populations:
+            self._die(species)
+
+    def _end_of_year(self, species, eta):
+        """Ages the cohorts of a species, makes them lose the given share of their weight, and
+        draws the number of deaths"""
+        population = self.populations[species]
+        population.ages += 1
+        population.weights -= eta * population.weights
+        self._die(species)
+
+    def _die(self, species):
+        """Finds the fitness of the cohorts of a species, and draws the number of deaths"""
+        population = self.populations[species]
+        if len(population) == 0:
+            return
+        table = self.tables[species]
+        population.fitness[:] = fitness_numpy(population.ages, population.weights,
+                                              species_constants(table))
+        probability = np.where(population.weights <= 0.000001, 1.,
+                               np.clip(table['omega'] * (1 - population.fitness), 0, 1))
+        deaths = self.rng.binomial(population.sizes, probability)
+        self._count('deaths', population.tiles, deaths)
+        population.sizes -= deaths
+        population.take(population.sizes > 0)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+Density maps at several resolutions.
+
+A density pyramid holds the number of animals on every tile, level 0, and coarser levels where
+every cell holds the sum of a block of 2x2 cells of the level below, up to a single cell. When
+the density changes, only the cells that changed are added to the coarser levels. A figure can
+then fetch the level with no more cells than it has pixels, of the whole map or of a region.
+"""
+
+import numpy as np
+
+
+class DensityPyramid:
+    """
+    Block summed density maps of an island.
+    """
+
+    def __init__(self, shape):
+        """
+        :param shape: Tuple with the number of rows and columns of the island.
+        """
+        self.levels = [np.zeros(shape, dtype=np.int64)]
+        self.areas = [np.ones(shape, dtype=np.int64)]
+        while max(self.levels[-1].shape) > 1:
+            rows, cols = self.levels[-1].shape
+            self.levels.append(np.zeros((-(-rows // 2), -(-cols // 2)), dtype=np.int64))
+            self.areas.append(self.block_sum(self.areas[-1]))
+
+    @staticmethod
+    def block_sum(grid):
+        """
+        Sums the blocks of 2x2 cells of a grid, where the blocks at the last row and column
+        may be smaller.
+
+        :param grid: The grid.
+        :return: The grid of block sums.
+        """
+        rows, cols = grid.shape
+        padded = np.zeros((rows + rows % 2, cols + cols % 2), dtype=grid.dtype)
+        padded[:rows, :cols] = grid
+        return padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).sum(axis=(1, 3))
+
+    def update(self, density):
+        """
+        Sets the density of every tile, and adds the changes to the coarser levels.
+
+        :param density: Array with the number of animals on each tile.
+        :return: Number of tiles that changed.
+        """
+        change = np.asarray(density) - self.levels[0]
+        rows, cols = np.nonzero(change)
+        if len(rows) == 0:
+            return 0
+        change = change[rows, cols]
+        self.levels[0][rows, cols] += change
+        for level in self.levels[1:]:
+            rows, cols = rows // 2, cols // 2
+            np.add.at(level, (rows, cols), change)
+        return len(change)
+
+    def choose_level(self, max_size, region=None):
+        """
+        Finds the finest level where the region has no side of more than max_size cells.
+
+        :param max_size: The largest number of cells along a side.
+        :param region: Tuple (first row, end row, first column, end column) of tiles, as in
+            slicing, defaults to the whole island.
+        :return: The number of the level.
+        """
+        row0, row1, col0, col1 = region or (0, self.levels[0].shape[0], 0, self.levels[0].shape[1])
+        for level in range(len(self.levels)):
+            scale = 2 ** level
+            size = max(-(-row1 // scale) - row0 // scale, -(-col1 // scale) - col0 // scale)
+            if size <= max_size:
+                return level
+        return len(self.levels) - 1
+
+    def query(self, max_size=None, region=None, mean=False):
+        """
+        Fetches the densities of a region at the finest level that fits within max_size cells
+        along each side.
+
+        :param max_size: The largest number of cells along a side, defaults to level 0.
+        :param region: Tuple (first row, end row, first column, end column) of tiles, as in
+            slicing, defaults to the whole island.
+        :param mean: If True, each cell holds the mean number of animals per tile of its block,
+            else the number of animals in the block.
+        :return: The array of densities and the number of the level. A cell of level k covers a
+            block of 2**k by 2**k tiles.
+        """
+        level = 0 if max_size is None else self.choose_level(max_size, region)
+        grid = self.levels[level]
+        if region is not None:
+            row0, row1, col0, col1 = region
+            scale = 2 ** level
+            cells = (slice(row0 // scale, -(-row1 // scale)),
+                     slice(col0 // scale, -(-col1 // scale)))
+            if mean:
+                return grid[cells] / self.areas[level][cells], level
+            return grid[cells].copy(), level
+        if mean:
+            return grid / self.areas[level], level
+        return grid.copy(), level
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+Recording of simulations for rendering afterwards.
+
+Instead of drawing the figure while the island is simulated, a simulation in record mode writes a
+frame log: a file with the statistics shown in the figure, already reduced to the density maps,
+the binned histograms and the number of animals. The log is a stream of pickled dictionaries, a
+header followed by one dictionary per frame, so it can be written as the simulation runs.
+
+The frames are turned into images afterwards, split into chunks drawn by a pool of processes:
+
+python -m biosim.frames sim.frames --img_base images/sim --processes 4
+"""
+
+from .graphics import Graphics
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib.pyplot as plt
+import numpy as np
+import argparse
+import pickle
+import os
+
+
+def make_frame(year, statistics):
+    """
+    Packs the statistics of an island into a frame.
+
+    :param year: The year of the frame.
+    :param statistics: The dictionary returned by Island.get_statistics.
+    :return: Dictionary with the year, the density map of each species, and the counts of the
+     age, fitness and weight histograms with one row per species.
+    """
+    frame = {'year': year}
+    for name in ('herb_map', 'carn_map', 'age', 'fitness', 'weight'):
+        frame[name] = _compact(statistics[name])
+    return frame
+
+
+def _compact(counts):
+    """Stores counts in the smallest unsigned integer type that holds them"""
+    counts = np.asarray(counts)
+    return counts.astype(np.min_scalar_type(max(int(counts.max(initial=0)), 0)))
+
+
+class FrameRecorder:
+    """
+    Writes the frame log of a simulation.
+    """
+
+    def __init__(self, path, island_map, hist_specs=None, cmax_animals=None, ymax_animals=None):
+        """
+        :param path: Path of the frame log.
+        :param island_map: A string containing the structure of the island.
+        :param hist_specs: Dictionary with the dimensions of the histograms.
+        :param cmax_animals: Dictionary with the max values of the density maps of each species.
+        :param ymax_animals: Fixes a y value for the animal count visualization.
+        """
+        self.path = path
+        self.hist_specs = Graphics.update_histogram_specs(hist_specs)
+        self._file = open(path, 'wb')
+        self._history = []
+        pickle.dump({'island_map': island_map, 'hist_specs': self.hist_specs,
+                     'cmax_animals': cmax_animals, 'ymax_animals': ymax_animals},
+                    self._file, pickle.HIGHEST_PROTOCOL)
+
+    def record(self, year, statistics, frame=True):
+        """
+        Records the number of animals in a year, and the frame of the year if asked to.
+
+        :param year: The year.
+        :param statistics: The dictionary returned by Island.get_statistics, with histograms of
+         the dimensions in hist_specs if frame is True.
+        :param frame: If True, the frame of the year is written to the log.
+        """
+        if self.closed:
+            raise RuntimeError('The frame log {} is closed, nothing more can be recorded'.format(
+                self.path))
+        self._history.append((year, statistics['num_herb'], statistics['num_carn']))
+        if frame:
+            record = make_frame(year, statistics)
+            record['history'] = np.array(self._history, dtype=np.int64)
+            self._history = []
+            pickle.dump(record, self._file, pickle.HIGHEST_PROTOCOL)
+
+    def flush(self):
+        """Writes everything recorded so far to the file"""
+        self._file.flush()
+
+    def close(self):
+        """Closes the frame log"""
+        self._file.close()
+
+    @property
+    def closed(self):
+        """True if the frame log is closed"""
+        return self._file.closed
+
+
+def read_frame_log(path):
+    """
+    Reads a frame log.
+
+    :param path: Path of the frame log.
+    :return: The header, the list of frames, an array of the years recorded and an array with one
+     column of counts per species for these years. Every frame gets the key history_end, the
+     number of recorded years up to and including the year of the frame.
+    """
+    frames = []
+    history = []
+    with open(path, 'rb') as f:
+        header = pickle.load(f)
+        while True:
+            try:
+                frame = pickle.load(f)
+            except EOFError:
+                break
+            history.append(frame.pop('history'))
+            frame['history_end'] = sum(len(rows) for rows in history)
+            frames.append(frame)
+    history = np.concatenate(history) if history else np.zeros((0, 3), dtype=np.int64)
+    return header, frames, history[:, 0].astype(float), history[:, 1:].astype(float)
+
+
+def image_name(img_base, img_no, img_fmt):
+    """The name of image number img_no, as saved by Graphics"""
+    return '{}_{:05d}.{}'.format(img_base, img_no, img_fmt)
+
+
+def make_graphics(header, ymax_animals=None, num_years=None):
+    """
+    Makes an empty figure for drawing frames into.
+
+    :param header: The header of the frame log.
+    :param ymax_animals: Fixes a y value for the animal count visualization, defaults to the value
+     in the header.
+    :param num_years: The last year shown in the animal count visualization.
+    :return: The Graphics of the figure.
+    """
+    island_map = header['island_map']
+    empty_map = np.zeros((len(island_map.splitlines()), len(island_map.splitlines()[0])))
+    return Graphics(island_map, herb_map=empty_map, carn_map=empty_map, age_map=[[], []],
+                    fitness_map=[[], []], weight_map=[[], []], hist_specs=header['hist_specs'],
+                    animal_count_history={0: [0, 0]}, img_base=None, img_fmt=None,
+                    ymax_animals=ymax_animals or header['ymax_animals'],
+                    cmax_animals=header['cmax_animals'], num_years=num_years)
+
+
+def render_frames(header, frames, years, counts, img_base, img_fmt, first_img_no):
+    """
+    Draws frames into images, numbered from first_img_no.
+
+    :param header: The header of the frame log.
+    :param frames: The frames to draw.
+    :param years: The array of years of the whole log.
+    :param counts: The array of counts of the whole log.
+    :param img_base: The location of where the pictures should be stored.
+    :param img_fmt: The kind of image that should be stored.
+    :param first_img_no: Number of the image of the first frame.
+    :return: Number of images saved.
+    """
+    ymax_animals = header['ymax_animals']
+    if not ymax_animals and len(counts):
+        ymax_animals = max(10, 1.1 * counts.max())
+    graphics = make_graphics(header, ymax_animals=ymax_animals,
+                             num_years=years[-1] if len(years) else None)
+    try:
+        for k, frame in enumerate(frames):
+            end = frame['history_end']
+            graphics.draw_frame(frame, years[:end], counts[:end])
+            graphics.fig.savefig(image_name(img_base, first_img_no + k, img_fmt))
+    finally:
+        plt.close(graphics.fig)
+    return len(frames)
+
+
+def _use_agg():
+    """Draws the figures of a rendering process without a window"""
+    plt.switch_backend('agg')
+
+
+def _render_task(task):
+    """Unpacks a task for use with a process pool"""
+    return render_frames(*task)
+
+
+def render_frame_log(path, img_base, img_fmt='png', processes=None, chunk_size=None):
+    """
+    Draws every frame of a frame log into an image, with the images numbered as Graphics numbers
+    them, so that Graphics.make_movie_from_images can make a movie of them.
+
+    The frames are split into chunks of consecutive frames, each drawn by a process of a pool
+    into a figure of its own.
+
+    :param path: Path of the frame log.
+    :param img_base: The location of where the pictures should be stored.
+    :param img_fmt: The kind of image that should be stored, eg. png.
+    :param processes: Number of processes, 1 draws the frames in this process, None uses one
+     process per CPU.
+    :param chunk_size: Number of frames in each chunk, defaults to splitting the frames into four
+     chunks per process.
+    :return: Number of images saved.
+    """
+    header, frames, years, counts = read_frame_log(path)
+    if not frames:
+        return 0
+    if chunk_size is None:
+        workers = processes or os.cpu_count() or 1
+        chunk_size = max(1, -(-len(frames) // (4 * workers)))
+    tasks = [(header, frames[start:start + chunk_size], years, counts, img_base, img_fmt, start)
+             for start in range(0, len(frames), chunk_size)]
+    if processes == 1:
+        return sum(_render_task(task) for task in tasks)
+    with ProcessPoolExecutor(max_workers=processes, initializer=_use_agg) as executor:
+        return sum(executor.map(_render_task, tasks))
+
+
+def main(argv=None):
+    """
+    Draws the frames of a frame log into images, as given by the command line arguments.
+
+    :param argv: List of command line arguments, defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(prog='python -m biosim.frames',
+                                     description='Render a BioSim frame log into images.')
+    parser.add_argument('log', help='the frame log')
+    parser.add_argument('--img_base', required=True, help='base name of the images')
+    parser.add_argument('--img_fmt', default='png')
+    parser.add_argument('--processes', type=int, help='number of processes, defaults to one per '
+                                                      'CPU')
+    parser.add_argument('--movie', action='store_true', help='make a movie of the images')
+    args = parser.parse_args(argv)
+    images = render_frame_log(args.log, args.img_base, args.img_fmt, args.processes)
+    print('Saved {} images'.format(images))
+    if args.movie:
+        Graphics.make_movie_from_images(args.img_base, args.img_fmt)
+
+
+if __name__ == '__main__':
+    main()
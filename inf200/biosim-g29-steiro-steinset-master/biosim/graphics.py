@@ -3,18 +3,28 @@
 __author__ = 'August N Steinset and Sunniva E Daae Steiro'
 __email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
 
+from .island import terrain_grid
+from .histograms import complete_specs
 import subprocess
+import functools
 import matplotlib.pyplot as plt
+import numpy as np
 
 _FFMPEG_BINARY = 'ffmpeg'
 
 
 class Graphics:
-    """Responsible for creating all the graphics"""
+    """Responsible for creating all the graphics
+
+    All the artists that change from year to year are created once, and later only get new data.
+    Where the backend supports it, the changing artists are animated and blitted onto a cached
+    background, so that the static parts of the figure are only drawn again when an axis limit has
+    to change.
+    """
 
     def __init__(self, island_map, herb_map, carn_map, age_map, fitness_map, weight_map, hist_specs,
                  animal_count_history, img_base, img_fmt, ymax_animals=None, cmax_animals=None,
-                 num_years=None):
+                 num_years=None, stream_movie=False, histograms=None):
         """Updates the graphics with the new values from the simulation.
 
             :param island_map: A list of list containing all the terrain objects
@@ -33,11 +43,19 @@ class Graphics:
             :param ymax_animals: Sets a maximum value for the y values shown on the graph, default gives automatic
              adjustments.
             :param cmax_animals: A dictionary with species as key, contains the max values for the distribution map
+            :param stream_movie: If True, the frames are piped straight into ffmpeg while the simulation runs,
+             instead of being saved as images. make_movie then finishes the movie.
+            :param histograms: A dictionary with the keys age, fitness and weight, containing arrays
+             with one row of bin counts per species, see Island.get_statistics. If given, it is
+             drawn instead of age_map, fitness_map and weight_map.
 
                 """
         self._image_base = img_base
         self._image_fmt = img_fmt
         self._img_no = 0
+        self._stream_movie = stream_movie
+        self._encoder = None
+        self._frame_shape = None
 
         hist_specs = self.update_histogram_specs(hist_specs)
         self.f_bins = int(hist_specs['fitness']['max'] / hist_specs['fitness']['delta'])
@@ -59,46 +77,58 @@ class Graphics:
 
         # axes for herb_map
         self.ax2 = self.fig.add_subplot(3, 3, 4)
-        self.herbs = self.ax2.imshow(herb_map, vmin=0, vmax=self.cmax_animals['Herbivore'])
+        rows, cols = terrain_grid(island_map).shape
+        extent = (-0.5, cols - 0.5, rows - 0.5, -0.5)
+        self.herbs = self.ax2.imshow(herb_map, vmin=0, vmax=self.cmax_animals['Herbivore'],
+                                     extent=extent)
         self.fig.colorbar(self.herbs, ax=self.ax2, shrink=0.5)
         self.ax2.set_title('Herbivore Density')
 
         # axes for carn_map
         self.ax3 = self.fig.add_subplot(3, 3, 6)
-        self.carns = self.ax3.imshow(carn_map, vmin=0, vmax=self.cmax_animals['Carnivore'])
+        self.carns = self.ax3.imshow(carn_map, vmin=0, vmax=self.cmax_animals['Carnivore'],
+                                     extent=extent)
+        # The density maps need no more cells along a side than the axes has pixels
+        self.map_pixels = int(max(self.ax2.bbox.width, self.ax2.bbox.height))
         self.fig.colorbar(self.carns, ax=self.ax3, shrink=0.5)
         self.ax3.set_title('Carnivore Density')
 
         # axes for map
         ax1 = self.fig.add_subplot(3, 3, 5)
 
-        map_rgb = self.get_map(island_map)
-        ax1.imshow(map_rgb)
+        # The map is drawn with no more pixels than the axes has on screen
+        map_rgb = self.get_map(island_map, max_size=int(max(ax1.bbox.width, ax1.bbox.height)))
+        ax1.imshow(map_rgb, extent=extent)
         ax1.axis('off')
 
         # axes for age map
         self.ax4 = self.fig.add_subplot(3, 3, 7)
-        self.ax4.hist(age_map, histtype='step', bins=self.a_bins, range=(0, self.a_max))
-        self.ax4.set_title('Age distribution')
-        self.ax4.legend(['Carnivores', 'Herbivores'])
+        self.age_lines = self.setup_histogram(
+            self.ax4, 'Age distribution',
+            self.initial_counts(histograms, 'age', age_map, self.a_bins, self.a_max),
+            self.a_max)
 
         # axes for fitness map
         self.ax5 = self.fig.add_subplot(3, 3, 8)
-        self.ax5.hist(fitness_map, histtype='step', bins=self.f_bins, range=(0, self.f_max))
-        self.ax5.set_title('Fitness distribution')
-        self.ax5.legend(['Carnivores', 'Herbivores'])
+        self.fitness_lines = self.setup_histogram(
+            self.ax5, 'Fitness distribution',
+            self.initial_counts(histograms, 'fitness', fitness_map, self.f_bins, self.f_max),
+            self.f_max)
 
         # axes for weight map
         self.ax6 = self.fig.add_subplot(3, 3, 9)
-        self.ax6.hist(weight_map, histtype='step', bins=self.w_bins, range=(0, self.w_max))
-        self.ax6.set_title('Weight distribution')
-        self.ax6.legend(['Carnivores', 'Herbivores'])
+        self.weight_lines = self.setup_histogram(
+            self.ax6, 'Weight distribution',
+            self.initial_counts(histograms, 'weight', weight_map, self.w_bins, self.w_max),
+            self.w_max)
 
         # axes for animal_count
         self.ax7 = self.fig.add_subplot(3, 3, 1)
-        self.ax7.set_xlim([0, num_years])
-        self.ax7.set_ylim([0, self.ymax_animals])
-        self.ax7.plot((animal_count_history.keys()), animal_count_history.values())
+        years, counts = self.count_arrays(animal_count_history)
+        self.count_lines = self.ax7.plot(years, counts)
+        self.ax7.set_xlim([0, num_years if num_years else max(10, years[-1])])
+        self.ax7.set_ylim([0, self.ymax_animals if self.ymax_animals else
+                           max(10, 1.5 * counts.max())])
         self.ax7.set_title('Number of animals')
         self.ax7.legend(['Herbivores', 'Carnivores'])
 
@@ -110,7 +140,19 @@ class Graphics:
                              horizontalalignment='center',
                              verticalalignment='center',
                              transform=axt.transAxes)
-        plt.draw()
+
+        self._animated = {self.ax2: [self.herbs], self.ax3: [self.carns],
+                          self.ax4: self.age_lines, self.ax5: self.fitness_lines,
+                          self.ax6: self.weight_lines, self.ax7: self.count_lines,
+                          axt: [self.year]}
+        self._backgrounds = None
+        self._blit = self.fig.canvas.supports_blit
+        if self._blit:
+            for artists in self._animated.values():
+                for artist in artists:
+                    artist.set_animated(True)
+            self.fig.canvas.mpl_connect('resize_event', self.forget_background)
+        self.redraw(full=True)
         self.save()
         plt.pause(1e-6)
 
@@ -131,22 +173,60 @@ class Graphics:
         :param img_years: How often an image of island should be saved.
         """
         if year % vis_years == 0:
-            self.year.set_text("Year: %d" % year)
-            self.update_herb_map(herb_map)
-            self.update_carn_map(carn_map)
-            self.update_age_map(age_map)
-            self.update_fitness_map(fitness_map)
-            self.update_weight_map(weight_map)
-            self.update_num_animals(animal_count_history)
-            plt.draw()
-            if year % img_years == 0:
-                self.save()
+            self.show_year(year, herb_map, carn_map, age_map, fitness_map, weight_map,
+                           animal_count_history, save=year % img_years == 0)
+
+    def show_year(self, year, herb_map, carn_map, age_map, fitness_map, weight_map,
+                  animal_count_history, save=False):
+        """Draws the values of a year, see update_graphics for the parameters
+
+        :param save: If True, an image of the figure is saved
+        """
+        self.year.set_text("Year: %d" % year)
+        self.update_herb_map(herb_map)
+        self.update_carn_map(carn_map)
+        rescaled = [self.update_age_map(age_map),
+                    self.update_fitness_map(fitness_map),
+                    self.update_weight_map(weight_map),
+                    self.update_num_animals(animal_count_history)]
+        self.redraw(full=any(rescaled))
+        if save:
+            self.save()
+        plt.pause(1e-6)
+
+    def draw_frame(self, frame, years, counts):
+        """Draws a frame of statistics recorded during a simulation, see biosim.frames
+
+        :param frame: Dictionary with the year, the density maps and the binned histograms
+        :param years: An array of the years up to the year of the frame
+        :param counts: An array with one column of counts per species for these years
+        """
+        self.year.set_text("Year: %d" % frame['year'])
+        self.update_herb_map(frame['herb_map'])
+        self.update_carn_map(frame['carn_map'])
+        rescaled = [self.update_histogram(self.ax4, self.age_lines, frame['age']),
+                    self.update_histogram(self.ax5, self.fitness_lines, frame['fitness']),
+                    self.update_histogram(self.ax6, self.weight_lines, frame['weight']),
+                    self.update_counts(years, counts)]
+        self.redraw(full=any(rescaled))
+
+    def show_frame(self, frame, years, counts, save=False):
+        """Draws a frame, see draw_frame, and lets the window show it
+
+        :param save: If True, an image of the figure is saved
+        """
+        self.draw_frame(frame, years, counts)
+        if save:
+            self.save()
         plt.pause(1e-6)
 
     def save(self):
-        """Save the graphic as an image"""
-        if self._image_base is not None or self._image_fmt is not None:
-            plt.savefig('{}_{:05d}.{}'.format(self._image_base, self._img_no, self._image_fmt))
+        """Save the graphic as an image, or as a frame of the movie when streaming"""
+        if self._stream_movie:
+            if self._image_base is not None:
+                self.write_frame()
+        elif self._image_base is not None or self._image_fmt is not None:
+            self.fig.savefig('{}_{:05d}.{}'.format(self._image_base, self._img_no, self._image_fmt))
             self._img_no += 1
 
     @staticmethod
@@ -156,36 +236,88 @@ class Graphics:
         :param new_hist_specs: Changes to the histogram specifications.
 
         :return hist_specs: The final, complete histogram specifications"""
-        hist_specs = {'fitness': {'max': 1.0, 'delta': 0.05},
-                      'age': {'max': 60.0, 'delta': 2},
-                      'weight': {'max': 60, 'delta': 2}}
-        if new_hist_specs is not None:
-            for key in new_hist_specs:
-                hist_specs[key] = new_hist_specs[key]
-            return hist_specs
-        else:
-            return hist_specs
+        return complete_specs(new_hist_specs)
+
+    def movie_command(self, width, height):
+        """The ffmpeg command reading raw RGBA frames of the given size from stdin
+
+        :param width: Width of the frames in pixels
+        :param height: Height of the frames in pixels
+        :return: The command as a list
+        """
+        # Parameters chosen according to http://trac.ffmpeg.org/wiki/Encode/H.264,
+        # section "Compatibility". H.264 needs an even width and height.
+        return [_FFMPEG_BINARY,
+                '-f', 'rawvideo',
+                '-pix_fmt', 'rgba',
+                '-s', '{}x{}'.format(width, height),
+                '-i', '-',
+                '-y',
+                '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                '-profile:v', 'baseline',
+                '-level', '3.0',
+                '-pix_fmt', 'yuv420p',
+                '{}.{}'.format(self._image_base, 'output.mp4')]
+
+    def write_frame(self):
+        """Pipes the current picture of the canvas into the encoder, starting it at the first frame"""
+        canvas = self.fig.canvas
+        if not self._blit:
+            canvas.draw()
+        frame = canvas.buffer_rgba()
+        if self._encoder is None:
+            self._frame_shape = frame.shape
+            try:
+                self._encoder = subprocess.Popen(self.movie_command(frame.shape[1], frame.shape[0]),
+                                                 stdin=subprocess.PIPE)
+            except OSError as err:
+                raise RuntimeError('ERROR: could not start ffmpeg: {}'.format(err))
+        elif frame.shape != self._frame_shape:
+            raise RuntimeError('The figure changed size while the movie was streamed')
+        try:
+            self._encoder.stdin.write(frame)
+        except BrokenPipeError:
+            raise RuntimeError('ERROR: ffmpeg stopped with code {}'.format(self._encoder.wait()))
+        self._img_no += 1
 
     def make_movie(self):
         """
         Sees trough all the images at a given location and makes
-        an mp4 movie of them called output.mp4
+        an mp4 movie of them called output.mp4. When streaming, the encoder is
+        told that there are no more frames, and the movie is finished.
+        """
+        if self._stream_movie:
+            if self._encoder is None:
+                raise RuntimeError('No frames have been streamed to the movie')
+            self._encoder.stdin.close()
+            code = self._encoder.wait()
+            self._encoder = None
+            if code != 0:
+                raise RuntimeError('ERROR: ffmpeg failed with code {}'.format(code))
+            return
+        self.make_movie_from_images(self._image_base)
+
+    @staticmethod
+    def make_movie_from_images(img_base, img_fmt='png'):
+        """Makes an mp4 movie called <img_base>.output.mp4 of the numbered images at img_base
+
+        :param img_base: The location of the pictures
+        :param img_fmt: The kind of the pictures
         """
         try:
-            # Parameters chosen according to http://trac.ffmpeg.org/wiki/Encode/H.264,
-            # section "Compatibility"
             subprocess.check_call([_FFMPEG_BINARY,
-                                   '-i', '{}_%05d.png'.format(self._image_base),
+                                   '-i', '{}_%05d.{}'.format(img_base, img_fmt),
                                    '-y',
                                    '-profile:v', 'baseline',
                                    '-level', '3.0',
                                    '-pix_fmt', 'yuv420p',
-                                   '{}.{}'.format(self._image_base, 'output.mp4')])
+                                   '{}.{}'.format(img_base, 'output.mp4')])
         except subprocess.CalledProcessError as err:
             raise RuntimeError('ERROR: ffmpeg failed with: {}'.format(err))
 
     def update_herb_map(self, herb_map):
-        """Updates the herbivore density map"""
+        """Updates the herbivore density map, which may be coarser than the island, see
+        Island.density_map"""
         self.herbs.set_data(herb_map)
 
     def update_carn_map(self, carn_map):
@@ -193,41 +325,186 @@ class Graphics:
         self.carns.set_data(carn_map)
 
     def update_age_map(self, age_map):
-        """Updates the age distribution histogram"""
-        self.ax4.cla()
-        self.ax4.hist(age_map, histtype='step', bins=self.a_bins, range=(0, self.a_max))
-        self.ax4.set_title('Age distribution')
-        self.ax4.legend(['Carnivores', 'Herbivores'])
+        """Updates the age distribution histogram
+
+        :return: True if the axis limits changed, so that the whole figure must be drawn again
+        """
+        return self.update_histogram(self.ax4, self.age_lines,
+                                     self.histogram_counts(age_map, self.a_bins, self.a_max))
 
     def update_fitness_map(self, fitness_map):
-        """Updates the fitness distribution histogram"""
-        self.ax5.cla()
-        self.ax5.hist(fitness_map, histtype='step', bins=self.f_bins, range=(0, self.f_max))
-        self.ax5.set_title('Fitness distribution')
-        self.ax5.legend(['Carnivores', 'Herbivores'])
+        """Updates the fitness distribution histogram
+
+        :return: True if the axis limits changed, so that the whole figure must be drawn again
+        """
+        return self.update_histogram(self.ax5, self.fitness_lines,
+                                     self.histogram_counts(fitness_map, self.f_bins, self.f_max))
 
     def update_weight_map(self, weight_map):
-        """Updates the weight distribution histogram"""
-        self.ax6.cla()
-        self.ax6.hist(weight_map, histtype='step', bins=self.w_bins, range=(0, self.w_max))
-        self.ax6.set_title('Weight distribution')
-        self.ax6.legend(['Carnivores', 'Herbivores'])
+        """Updates the weight distribution histogram
+
+        :return: True if the axis limits changed, so that the whole figure must be drawn again
+        """
+        return self.update_histogram(self.ax6, self.weight_lines,
+                                     self.histogram_counts(weight_map, self.w_bins, self.w_max))
 
     def update_num_animals(self, animal_count_history):
-        """Updates the population counter"""
-        self.ax7.cla()
-        self.ax7.plot(animal_count_history.keys(), animal_count_history.values())
-        self.ax7.set_title('Number of animals')
-        self.ax7.set_ylim([0, self.ymax_animals])
-        self.ax7.legend(['Herbivores', 'Carnivores'])
+        """Updates the population counter
+
+        :return: True if the axis limits changed, so that the whole figure must be drawn again
+        """
+        return self.update_counts(*self.count_arrays(animal_count_history))
+
+    def update_counts(self, years, counts):
+        """Updates the population counter from arrays of years and counts
+
+        :param years: An array of the years
+        :param counts: An array with one column of counts per species
+        :return: True if the axis limits changed, so that the whole figure must be drawn again
+        """
+        for k, line in enumerate(self.count_lines):
+            line.set_data(years, counts[:, k])
+        rescaled = False
+        x_max = self.ax7.get_xlim()[1]
+        if years[-1] > x_max:
+            self.ax7.set_xlim([0, max(2 * x_max, years[-1])])
+            rescaled = True
+        y_max = self.ax7.get_ylim()[1]
+        if not self.ymax_animals and counts.max() > y_max:
+            self.ax7.set_ylim([0, max(2 * y_max, counts.max())])
+            rescaled = True
+        return rescaled
+
+    @staticmethod
+    def count_arrays(animal_count_history):
+        """Turns the population history into arrays
+
+        :param animal_count_history: A dictionary where every year is a key containing a list with
+            the population of all herbivores and carnivores on the island.
+        :return: An array of the years and an array with one column of counts per species
+        """
+        years = np.fromiter(animal_count_history.keys(), dtype=float)
+        counts = np.array(list(animal_count_history.values()), dtype=float).reshape(-1, 2)
+        return years, counts
+
+    @classmethod
+    def initial_counts(cls, histograms, name, values, bins, max_value):
+        """The counts of the first histogram, given as counts or as values
+
+        :param histograms: Dictionary with the counts of each histogram, or None
+        :param name: The name of the histogram
+        :param values: A list with a list of values for each species, used if histograms is None
+        :param bins: Number of bins
+        :param max_value: The upper edge of the last bin
+        :return: An array with one row of counts per species
+        """
+        if histograms is not None:
+            return np.asarray(histograms[name])
+        return cls.histogram_counts(values, bins, max_value)
+
+    @staticmethod
+    def histogram_counts(values, bins, max_value):
+        """Counts the values of each species in equally wide bins from 0 to max_value
+
+        :param values: A list with a list of values for each species
+        :param bins: Number of bins
+        :param max_value: The upper edge of the last bin
+        :return: An array with one row of counts per species
+        """
+        edges = np.linspace(0, max_value, bins + 1)
+        return np.array([np.histogram(species_values, bins=edges)[0] for species_values in values])
 
     @staticmethod
-    def get_map(uncolored_map):
-        rgb_value = {'W': (0.0, 0.0, 1.0),  # blue
-                     'L': (0.0, 0.6, 0.0),  # dark green
-                     'H': (0.5, 1.0, 0.5),  # light green
-                     'D': (1.0, 1.0, 0.5)}  # light yellow
-
-        map_rgb = [[rgb_value[column] for column in row]
-                   for row in uncolored_map.splitlines()]
-        return map_rgb
+    def setup_histogram(ax, title, counts, max_value):
+        """Creates the step lines of a histogram with one line per species
+
+        :param ax: The axes of the histogram
+        :param title: The title of the histogram
+        :param counts: An array with one row of counts per species, see histogram_counts
+        :param max_value: The upper edge of the last bin
+        :return: A list with the step line of each species
+        """
+        edges = np.linspace(0, max_value, counts.shape[1] + 1)
+        lines = []
+        for species_counts, label in zip(counts, ['Herbivores', 'Carnivores']):
+            lines.extend(ax.step(edges, np.append(species_counts, species_counts[-1]),
+                                 where='post', label=label))
+        ax.set_xlim([0, max_value])
+        ax.set_ylim([0, max(1, 1.5 * counts.max())])
+        ax.set_title(title)
+        ax.legend()
+        return lines
+
+    @staticmethod
+    def update_histogram(ax, lines, counts):
+        """Pushes new counts into the step lines of a histogram
+
+        The y axis is only rescaled when the highest count leaves the range between a quarter of
+        the axis and the top of the axis.
+
+        :param ax: The axes of the histogram
+        :param lines: The step lines of the histogram
+        :param counts: An array with one row of counts per species, see histogram_counts
+        :return: True if the axis limits changed, so that the whole figure must be drawn again
+        """
+        for species_counts, line in zip(counts, lines):
+            line.set_ydata(np.append(species_counts, species_counts[-1]))
+        top = counts.max()
+        y_max = ax.get_ylim()[1]
+        if top > y_max or (y_max > 1 and top < y_max / 4):
+            ax.set_ylim([0, max(1, 1.5 * top)])
+            return True
+        return False
+
+    def forget_background(self, event=None):
+        """Throws away the cached background, so that the whole figure is drawn next time"""
+        self._backgrounds = None
+
+    def redraw(self, full=False):
+        """Draws the changing artists onto the cached background of their axes
+
+        :param full: If True, or if there is no cached background, the whole figure is drawn and
+            the background is cached again.
+        """
+        canvas = self.fig.canvas
+        if not self._blit:
+            canvas.draw_idle()
+            return
+        if full or self._backgrounds is None:
+            canvas.draw()
+            self._backgrounds = {ax: canvas.copy_from_bbox(ax.bbox) for ax in self._animated}
+        for ax, artists in self._animated.items():
+            canvas.restore_region(self._backgrounds[ax])
+            for artist in artists:
+                ax.draw_artist(artist)
+            canvas.blit(ax.bbox)
+
+    @staticmethod
+    def get_map(uncolored_map, max_size=None):
+        """Colors the terrain of the map
+
+        :param uncolored_map: The map as a string
+        :param max_size: If given, the map is downsampled by taking every n-th tile, so that no
+            side of the image has more than max_size pixels
+        :return: An array with the RGB color of each pixel
+        """
+        return _map_rgb(uncolored_map, max_size)
+
+
+# Colors of the terrain in the order of TERRAIN_LETTERS
+_TERRAIN_RGB = np.array([(0.0, 0.0, 1.0),  # blue
+                         (0.0, 0.6, 0.0),  # dark green
+                         (0.5, 1.0, 0.5),  # light green
+                         (1.0, 1.0, 0.5)])  # light yellow
+
+
+@functools.lru_cache(maxsize=8)
+def _map_rgb(uncolored_map, max_size):
+    """Cached lookup of the colors of the terrain codes, see Graphics.get_map"""
+    codes = terrain_grid(uncolored_map)
+    if max_size:
+        step = -(-max(codes.shape) // max_size)
+        codes = codes[::step, ::step]
+    map_rgb = _TERRAIN_RGB[codes]
+    map_rgb.flags.writeable = False
+    return map_rgb
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+Histograms of the animals, counted while the animals are visited.
+
+The values of the animals are collected into a buffer of fixed size, and the buffer is counted
+into the bins each time it is full, so the memory used does not grow with the number of animals.
+The counts are the same as those of numpy.histogram of all the values at once.
+"""
+
+import numpy as np
+
+HIST_SPECS = {'fitness': {'max': 1.0, 'delta': 0.05},
+              'age': {'max': 60.0, 'delta': 2},
+              'weight': {'max': 60, 'delta': 2}}
+
+
+def complete_specs(new_hist_specs=None):
+    """
+    Fills in the histogram specifications that are not given with the defaults.
+
+    :param new_hist_specs: Changes to the histogram specifications, on the form
+     {attribute: {'max': value, 'delta': value}}.
+    :return: The complete histogram specifications.
+    """
+    hist_specs = {name: dict(spec) for name, spec in HIST_SPECS.items()}
+    if new_hist_specs is not None:
+        hist_specs.update(new_hist_specs)
+    return hist_specs
+
+
+class StreamingHistogram:
+    """
+    Counts values of each species into equally wide bins from 0 to max_value.
+    """
+
+    def __init__(self, bins, max_value, num_species=2, chunk_size=65536):
+        """
+        :param bins: Number of bins.
+        :param max_value: The upper edge of the last bin.
+        :param num_species: Number of species counted.
+        :param chunk_size: Number of values of a species kept before they are counted.
+        """
+        self.edges = np.linspace(0, max_value, bins + 1)
+        self.chunk_size = chunk_size
+        self._counts = np.zeros((num_species, bins), dtype=np.int64)
+        self._buffers = [[] for _ in range(num_species)]
+
+    @classmethod
+    def from_spec(cls, spec, **kwargs):
+        """
+        Makes a histogram from a histogram specification.
+
+        :param spec: Dictionary with the keys max and delta.
+        :return: The histogram.
+        """
+        return cls(int(spec['max'] / spec['delta']), spec['max'], **kwargs)
+
+    def add(self, species, values):
+        """
+        Adds values of a species.
+
+        :param species: Index of the species.
+        :param values: Iterable of values.
+        """
+        buffer = self._buffers[species]
+        buffer.extend(values)
+        if len(buffer) >= self.chunk_size:
+            self._flush(species)
+
+    def add_array(self, species, values, counts=None):
+        """
+        Counts an array of values of a species into the bins at once.
+
+        :param species: Index of the species.
+        :param values: Array of values.
+        :param counts: Array with the number of animals having each value, defaults to one each.
+        """
+        self._counts[species] += np.rint(np.histogram(values, bins=self.edges, weights=counts)[0]
+                                         ).astype(np.int64)
+
+    def _flush(self, species):
+        """Counts the buffered values of a species into the bins"""
+        buffer = self._buffers[species]
+        if buffer:
+            self._counts[species] += np.histogram(buffer, bins=self.edges)[0]
+            buffer.clear()
+
+    @property
+    def counts(self):
+        """Array with one row of counts per species"""
+        for species in range(len(self._buffers)):
+            self._flush(species)
+        return self._counts
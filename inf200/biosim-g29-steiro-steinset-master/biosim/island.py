@@ -3,15 +3,184 @@
 __author__ = 'August N Steinset and Sunniva E Daae Steiro'
 __email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
 
-from .terrain import Lowland, Highland, Desert, Water
+from .terrain import Terrain, Lowland, Highland, Desert, Water
+from .animals import Herbivore, Carnivore, compile_parameters
+from .density import DensityPyramid
+from .histograms import StreamingHistogram, complete_specs
+from .populations import CHUNK_SIZE, make_chunk
+import numpy as np
+import functools
 import random
 
+TERRAIN_LETTERS = 'WLHD'
+_LETTER_CODES = np.full(256, 255, dtype=np.uint8)
+_LETTER_CODES[np.frombuffer(TERRAIN_LETTERS.encode('ascii'), dtype=np.uint8)] = np.arange(
+    len(TERRAIN_LETTERS))
 
-class Island:
+
+@functools.lru_cache(maxsize=8)
+def terrain_grid(island_text):
+    """
+    Turns a map into a compact grid of terrain codes. The grids of the last few maps are cached,
+    so that the island and the graphics of a simulation share the same grid.
+
+    :param island_text: a string containing lines with the same amount of characters indicating
+        terrain type of each tile on the entire island.
+    :return: A read only array of the index of the terrain of each tile in TERRAIN_LETTERS.
+    """
+    lines = island_text.split()
+    if any(len(line) != len(lines[0]) for line in lines):
+        raise ValueError('All lines of the map must be of same length.')
+    letters = np.frombuffer(''.join(lines).encode('ascii', 'replace'), dtype=np.uint8)
+    codes = _LETTER_CODES[letters].reshape(len(lines), len(lines[0]))
+    if (codes == 255).any():
+        raise ValueError("Terrain type undefined")
+    codes.flags.writeable = False
+    return codes
+
+
+def population_tiles(shape, species_names, species, rows, cols, ages, weights):
+    """
+    Checks animals of one species given as arrays, with the tile of each animal, before they are
+    placed.
+
+    :param shape: The shape of the island.
+    :param species_names: The species of the island.
+    :param species: The name of the species.
+    :param rows: Sequence with the row of each animal, counted from 1 as in ini_pop.
+    :param cols: Sequence with the column of each animal, counted from 1.
+    :param ages: Sequence with the age of each animal.
+    :param weights: Sequence with the weight of each animal.
+    :return: Tuple with the flat index of the tile of each animal, counted from 0 row by row, and
+     the ages and weights as float arrays, where the ages are whole numbers.
+    """
+    if species not in species_names:
+        raise ValueError('There is no species called {}'.format(species))
+    rows = np.asarray(rows, dtype=np.int64).ravel()
+    cols = np.asarray(cols, dtype=np.int64).ravel()
+    ages = np.asarray(ages, dtype=float).ravel()
+    weights = np.asarray(weights, dtype=float).ravel()
+    if not len(rows) == len(cols) == len(ages) == len(weights):
+        raise ValueError('There must be a row, a column, an age and a weight for every animal.')
+    outside = (rows < 1) | (rows > shape[0]) | (cols < 1) | (cols > shape[1])
+    if outside.any():
+        k = outside.argmax()
+        raise IndexError('Location {} is not on the island'.format((int(rows[k]), int(cols[k]))))
+    if len(ages) and (ages.min() < 0 or weights.min() < 0):
+        raise ValueError('Age and weight must be positive numbers.')
+    if (ages != np.floor(ages)).any():
+        raise ValueError('Ages must be whole numbers.')
+    return (rows - 1) * shape[1] + cols - 1, ages, weights
+
+
+def population_counts(shape, species_names, species, counts, age, weight):
+    """
+    Checks a number of equal animals of one species for every tile, before they are placed.
+
+    :param shape: The shape of the island.
+    :param species_names: The species of the island.
+    :param species: The name of the species.
+    :param counts: Array of the shape of the island with the number of animals on each tile.
+    :param age: The age of the animals.
+    :param weight: The weight of the animals.
+    :return: The counts as an integer array.
+    """
+    if species not in species_names:
+        raise ValueError('There is no species called {}'.format(species))
+    counts = np.asarray(counts)
+    if counts.shape != tuple(shape):
+        raise ValueError('The counts must have the shape of the island, {}'.format(tuple(shape)))
+    if (counts < 0).any() or (counts != np.rint(counts)).any():
+        raise ValueError('The counts must be whole positive numbers.')
+    if age < 0 or weight < 0:
+        raise ValueError('Age and weight must be positive numbers.')
+    if age != int(age):
+        raise ValueError('Ages must be whole numbers.')
+    return counts.astype(np.int64)
+
+
+class BaseIsland:
+    """
+    The methods shared by Island and the array engines, see biosim.arrays. An engine sets
+    island_text, parameters, tables and density before using them.
+    """
+
+    species = {'Herbivore': Herbivore, 'Carnivore': Carnivore}
+    landscapes = {'L': Lowland, 'H': Highland, 'D': Desert}
+
+    def check_valid_boundaries(self):
+        """Checks that all boarders of the given map are only water, raises valueError if not."""
+        if self.island_text[0] != len(self.island_text[0]) * 'W' or self.island_text[-1] != len(
+                self.island_text[0]) * 'W':
+            raise ValueError('Boarders must be water')
+        for k in range(len(self.island_text)):
+            if self.island_text[k][0] != 'W' or self.island_text[k][-1] != 'W':
+                raise ValueError('Boarders must be water')
+
+    def change_parameter(self, species, p_dict):
+        """
+        Updates parameter values for a species on this island, and rebuilds the parameter table
+        the animals read from. Raises error if species input is incorrect.
+        :param species: string, either 'Herbivore' or 'Carnivore'
+        :param p_dict: dictionary on form {'zeta': 3.2, 'xi': 1.8}, with parameter
+        name as key, and value as new parameter value
+        """
+        if species not in self.species:
+            raise ValueError("Tried to set parameter for a species that does not exist")
+        self.species[species].set_animal_parameters(p_dict, self.parameters[species],
+                                                    self.tables[species])
+
+    def spawn_animal(self, ini_pop):
+        """Places new animals on the island, all the animals of a species at once with
+        add_population_tiles.
+
+        :param ini_pop: list of dictionaries with the location and a list of animals, on the form
+         [{'loc': (row, col), 'pop': [{'species': species, 'age': age, 'weight': weight}]}]
+        """
+        for species in self.species:
+            animals = [(entry['loc'], animal) for entry in ini_pop for animal in entry['pop']
+                       if animal['species'] == species]
+            if animals:
+                self.add_population_tiles(species, [loc[0] for loc, _ in animals],
+                                          [loc[1] for loc, _ in animals],
+                                          [animal['age'] for _, animal in animals],
+                                          [animal['weight'] for _, animal in animals])
+
+    def add_population_arrays(self, loc, species, ages, weights):
+        """Places animals of one species on a tile, given as arrays instead of dictionaries.
+
+        :param loc: The location of the tile, (row, column) counted from 1 as in ini_pop.
+        :param species: The name of the species.
+        :param ages: Sequence with the age of each animal.
+        :param weights: Sequence with the weight of each animal.
+        """
+        number = np.size(ages)
+        self.add_population_tiles(species, np.full(number, loc[0]), np.full(number, loc[1]),
+                                  ages, weights)
+
+    def density_map(self, species, max_size=None, region=None, mean=False):
+        """Fetches the density of a species as of the last call to get_maps or get_statistics, at
+        the finest resolution with no more than max_size cells along each side, see
+        DensityPyramid.query
+
+        :param species: string, either 'Herbivore' or 'Carnivore'
+        :param max_size: the largest number of cells along a side, defaults to one cell per tile
+        :param region: tuple (first row, end row, first column, end column) of tiles counted
+            from 0, as in slicing, defaults to the whole island
+        :param mean: if True, each cell holds the mean number of animals per tile of its block
+        returns: the array of densities, and the number of the level of the pyramid
+        """
+        return self.density[species].query(max_size, region, mean)
+
+
+class Island(BaseIsland):
     """
     Implements an island consisting of a certain amount of tiles of different characteristics
     that are set through the Terrain class. This class calls upon all animals on the island to
     do different activities.
+
+    Every island owns its own animal parameters, fodder amounts and random number generator, so
+    that several islands can be simulated in the same process without affecting each other.
     """
 
     num_herbivores = 0
@@ -27,99 +196,95 @@ class Island:
         """
         self.island_text = island_text.split()
         self.island = []
+        self.parameters = {'Herbivore': dict(Herbivore.parameter),
+                           'Carnivore': dict(Carnivore.parameter)}
+        self.tables = {species: compile_parameters(parameter)
+                       for species, parameter in self.parameters.items()}
+        self.rng = random.Random(seed)
 
-        for i, v in enumerate(self.island_text):
-            self.island.append([])
-            for j in v:
-                if j == "L":
-                    self.island[i].append(Lowland())
-                elif j == "W":
-                    self.island[i].append(Water())
-                elif j == "H":
-                    self.island[i].append(Highland())
-                elif j == "D":
-                    self.island[i].append(Desert())
-                else:
-                    raise ValueError("Terrain type undefined")
-
-        # Tests that map lines are consistent
-        for i in range(len(self.island) - 1):
-            if len(self.island[i]) != len(self.island[i + 1]):
-                raise ValueError('All lines of the map must be of same length.')
+        self.terrain = terrain_grid(island_text)
+        tile_types = (Water, Lowland, Highland, Desert)
+        for row in self.terrain:
+            self.island.append([tile_types[code](self.parameters, self.rng, self.tables)
+                                for code in row])
+        self.density = {species: DensityPyramid(self.terrain.shape) for species in self.species}
 
         self.check_valid_boundaries()
 
-        random.seed(seed)
         if ini_pop:
-            for i in ini_pop:
-                self.island[i['loc'][0] - 1][i['loc'][1] - 1].spawn_animal(i['pop'])
-
-    def check_valid_boundaries(self):
-        """Checks that all boarders of the given map are only water, raises valueError if not."""
-        if self.island_text[0] != len(self.island_text[0]) * 'W' or self.island_text[-1] != len(
-                self.island_text[0]) * 'W':
-            raise ValueError('Boarders must be water')
-        for k in range(len(self.island_text)):
-            if self.island_text[k][0] != 'W' or self.island_text[k][-1] != 'W':
-                raise ValueError('Boarders must be water')
+            self.spawn_animal(ini_pop)
 
-    @staticmethod
-    def set_params(landscape, params):
+    def set_params(self, landscape, params):
         """
-        Updates max value of fodder on lowland, highland and desert
+        Updates max value of fodder on lowland, highland and desert of this island
         :param landscape: string of one letter, either H, L or D.
         :param params: dictionary on form {'f_max': value}, where value is an integer
         representing amount of fodder
         """
-        if landscape not in ['H', 'L', 'D']:
+        if landscape not in self.landscapes:
             raise ValueError('Landscape must be L, D or H.')
-        elif landscape == 'L':
-            Lowland().set_params(params)
-        elif landscape == 'H':
-            Highland().set_params(params)
-        elif landscape == 'D':
-            Desert().set_params(params)
+        for row in self.island:
+            for tile in row:
+                if isinstance(tile, self.landscapes[landscape]):
+                    tile.set_params(params)
 
-    @staticmethod
-    def change_parameter(species, p_dict):
-        """
-        Updates parameter values for a species. Raises error if species input is incorrect.
-        :param species: string, either 'Herbivore' or 'Carnivore'
-        :param p_dict: dictionary on form {'zeta': 3.2, 'xi': 1.8}, with parameter
-        name as key, and value as new parameter value
+    def add_population_tiles(self, species, rows, cols, ages, weights):
+        """Places animals of one species on any tiles, given as arrays with the tile of each
+        animal, one tile at a time with Terrain.spawn_arrays. The ages are given to the animals
+        as integers.
+
+        :param species: The name of the species.
+        :param rows: Sequence with the row of each animal, counted from 1 as in ini_pop.
+        :param cols: Sequence with the column of each animal, counted from 1.
+        :param ages: Sequence with the age of each animal.
+        :param weights: Sequence with the weight of each animal.
         """
-        terrain = Lowland()
-        terrain.spawn_animal([{'species': 'Herbivore',
-                               'age': 5,
-                               'weight': 20}, {'species': 'Carnivore',
-                                               'age': 5,
-                                               'weight': 20}])
-        if species == 'Herbivore':
-            terrain.herbivores_on_tile[0].set_animal_parameters(p_dict)
-        elif species == 'Carnivore':
-            terrain.carnivores_on_tile[0].set_animal_parameters(p_dict)
-        else:
-            raise ValueError("Tried to set parameter for a species that does not exist")
+        tiles, ages, weights = population_tiles(self.terrain.shape, self.species, species, rows,
+                                                cols, ages, weights)
+        order = np.argsort(tiles, kind='stable')
+        starts = np.flatnonzero(np.diff(tiles[order])) + 1
+        for animals in np.split(order, starts) if len(order) else []:
+            row, col = divmod(int(tiles[animals[0]]), self.terrain.shape[1])
+            self.island[row][col].spawn_arrays(species, ages[animals].astype(int).tolist(),
+                                               weights[animals].tolist())
 
-    def spawn_animal(self, ini_pop):
-        """Places new animals on the island.
+    def add_population_counts(self, species, counts, age, weight):
+        """Places a number of equal animals of one species on every tile.
 
-        :param ini_pop: dictionary of animals
+        :param species: The name of the species.
+        :param counts: Array of the shape of the island with the number of animals on each tile.
+        :param age: The age of the animals.
+        :param weight: The weight of the animals.
         """
-        for i in ini_pop:
-            self.island[i['loc'][0] - 1][i['loc'][1] - 1].spawn_animal(i['pop'])
+        counts = population_counts(self.terrain.shape, self.species, species, counts, age,
+                                   weight)
+        for row, col in np.argwhere(counts):
+            number = int(counts[row, col])
+            self.island[row][col].spawn_arrays(species, [int(age)] * number, [weight] * number)
 
     def all_eat(self):
-        """Make all the animals eat"""
-        for i, a in enumerate(self.island):
-            for j in range(len(a)):
-                self.island[i][j].eat_on_tile()
+        """Make all the animals eat. Tiles without animals are left out, since nothing happens
+        there."""
+        for row in self.island:
+            for tile in row:
+                if tile.herbivores_on_tile or tile.carnivores_on_tile:
+                    tile.eat_on_tile()
+
+    def all_herbivores_eat(self):
+        """Make all the herbivores on the island eat. Tiles where nothing can happen, without
+        herbivores or without fodder for more than one herbivore to be shuffled, are left out."""
+        for row in self.island:
+            for tile in row:
+                herbivores = len(tile.herbivores_on_tile)
+                if herbivores > 1 or (herbivores == 1 and tile.F_max > 0):
+                    tile.herb_eat_on_tile()
 
     def all_carnivores_eat(self):
         """Make all the carnivore on the island eat"""
-        for i, a in enumerate(self.island):
-            for j in range(len(a)):
-                self.island[i][j].carn_eat_on_tile()
+        for row in self.island:
+            for tile in row:
+                if tile.herbivores_on_tile or tile.carnivores_on_tile:
+                    tile.carn_eat_on_tile()
 
     def all_lose_weight(self):
         """ Make all the animals lose weight """
@@ -139,6 +304,16 @@ class Island:
             for j in range(len(a)):
                 self.island[i][j].die_on_tile()
 
+    def all_end_of_year(self):
+        """
+        Make all the animals age, lose weight and then die, in one pass over each tile. Gives
+        the same result as all_age, all_lose_weight and all_die.
+        """
+        for row in self.island:
+            for tile in row:
+                if tile.herbivores_on_tile or tile.carnivores_on_tile:
+                    tile.end_of_year_on_tile()
+
     def all_breed(self):
         """Make all the animals procreate. Iterates through all the tiles of the island"""
         for i, a in enumerate(self.island):
@@ -194,6 +369,21 @@ class Island:
         self.all_migrate_carn()
         self.all_migrate_herb()
 
+    def collect_events(self):
+        """Gathers up the event counters of all the tiles, and resets them
+
+        returns: dictionary with the event names of Terrain as keys, containing arrays with the
+        number of events on each tile since the last time the events were collected
+        """
+        events = {name: np.zeros((len(self.island), len(self.island[0])),
+                                 dtype=float if name == 'fodder_eaten' else int)
+                  for name in Terrain.event_names}
+        for i, a in enumerate(self.island):
+            for j in range(len(a)):
+                for name, count in self.island[i][j].reset_events().items():
+                    events[name][i, j] = count
+        return events
+
     def get_maps(self):
         """Gathers up all the valuable information of the island
 
@@ -224,5 +414,64 @@ class Island:
                 age_list[1].extend(self.island[i][j].get_values_carn()[0])
                 fitness_list[1].extend(self.island[i][j].get_values_carn()[1])
                 weight_list[1].extend(self.island[i][j].get_values_carn()[2])
+        self.density['Herbivore'].update(herbivores_map)
+        self.density['Carnivore'].update(carnivores_map)
         return [herbivores_map, carnivores_map, age_list,
                 fitness_list, weight_list, num_herb, num_carn]
+
+    def animal_chunks(self, chunk_size=CHUNK_SIZE):
+        """Hands out the animals of the island a chunk at a time, tile by tile, for writing a
+        population file, see biosim.populations.
+
+        :param chunk_size: Number of animals in a chunk.
+        :return: Generator of chunks, see make_chunk.
+        """
+        rows = []
+        for i, row in enumerate(self.island):
+            for j, tile in enumerate(row):
+                for index, animals in enumerate((tile.herbivores_on_tile,
+                                                 tile.carnivores_on_tile)):
+                    for animal in animals:
+                        rows.append((i + 1, j + 1, index, animal.age, animal.weight,
+                                     animal.fitness))
+                        if len(rows) == chunk_size:
+                            yield make_chunk(rows)
+                            rows = []
+        if rows:
+            yield make_chunk(rows)
+
+    def get_statistics(self, hist_specs=None, histograms=True):
+        """Gathers up the density of each species and histograms of the animals, visiting every
+        animal once, without keeping lists of the values of all the animals
+
+        :param hist_specs: dictionary with the dimensions of the histograms, on the form
+            {attribute: {max, delta}}, where missing attributes get the default dimensions
+        :param histograms: if False, only the animals are counted
+        returns: dictionary with the arrays herb_map and carn_map of the number of animals on each
+            tile, the arrays age, fitness and weight with one row of bin counts per species unless
+            histograms is False, and the total numbers num_herb and num_carn
+        """
+        hist_specs = complete_specs(hist_specs)
+        names = ('age', 'fitness', 'weight')
+        if histograms:
+            histograms = [StreamingHistogram.from_spec(hist_specs[name]) for name in names]
+        herb_map = np.zeros(self.terrain.shape, dtype=np.int64)
+        carn_map = np.zeros(self.terrain.shape, dtype=np.int64)
+        for i, row in enumerate(self.island):
+            for j, tile in enumerate(row):
+                herb_map[i, j] = tile.count_herbivores()
+                carn_map[i, j] = tile.count_carnivores()
+                if histograms and herb_map[i, j]:
+                    for histogram, values in zip(histograms, tile.get_values_herb()):
+                        histogram.add(0, values)
+                if histograms and carn_map[i, j]:
+                    for histogram, values in zip(histograms, tile.get_values_carn()):
+                        histogram.add(1, values)
+        self.density['Herbivore'].update(herb_map)
+        self.density['Carnivore'].update(carn_map)
+        statistics = {'herb_map': herb_map, 'carn_map': carn_map,
+                      'num_herb': int(herb_map.sum()), 'num_carn': int(carn_map.sum())}
+        if histograms:
+            for name, histogram in zip(names, histograms):
+                statistics[name] = histogram.counts
+        return statistics
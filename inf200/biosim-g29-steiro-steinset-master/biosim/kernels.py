@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+Kernels of the array backed engine, see biosim.arrays.
+
+Every kernel comes in two versions taking the same arguments and giving the same results: a loop
+over the animals, written in the part of Python that Numba compiles, and a NumPy version working
+on whole arrays. The random numbers are drawn by the engine and handed to the kernels, so all
+backends give the same animals for the same seed, up to rounding.
+
+The backends are
+
+- 'numba': the loops compiled by Numba, if Numba is installed.
+- 'numpy': the NumPy versions. The hunt has no NumPy version without a loop, since each kill
+  changes the fitness of the carnivore, so it loops over the kills instead of the herbivores.
+- 'python': the loops run by Python, only meant for testing the other backends.
+- 'auto': 'numba' if Numba is installed, else 'numpy'.
+
+The parameters of a species are handed to the kernels as tuples of floats, see species_constants.
+"""
+
+import functools
+import math
+import warnings
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ('auto', 'numba', 'numpy', 'python')
+
+
+def species_constants(table):
+    """
+    Picks the constants the kernels need from the parameter table of a species.
+
+    :param table: The parameter table, see biosim.animals.compile_parameters.
+    :return: Tuple with the fitness constants (a_half, phi_age, w_half, minus_phi_weight).
+    """
+    return (float(table['a_half']), float(table['phi_age']), float(table['w_half']),
+            float(table['minus_phi_weight']))
+
+
+def fitness_numpy(ages, weights, constants):
+    """
+    Calculates the fitness of animals, as Animal.find_fitness.
+
+    :param ages: Array of ages.
+    :param weights: Array of weights.
+    :param constants: The fitness constants of the species, see species_constants.
+    :return: Array of fitness.
+    """
+    a_half, phi_age, w_half, minus_phi_weight = constants
+    with np.errstate(over='ignore'):
+        fitness = (1 / (1 + np.exp(phi_age * (ages - a_half)))) * \
+            (1 / (1 + np.exp(minus_phi_weight * (weights - w_half))))
+    return np.where(weights <= 0.000001, 0., fitness)
+
+
+def feed_loop(tiles, ages, weights, fitness, fodder, F, beta, beta_F, constants):
+    """
+    Makes the herbivores eat, as Terrain.herb_eat_on_tile. The fitness of a herbivore is only
+    found again if there is fodder left after it has eaten.
+
+    :param tiles: The tile of each herbivore, sorted, with the herbivores of a tile in the order
+     they eat.
+    :param ages: Ages of the herbivores.
+    :param weights: Weights of the herbivores, changed in place.
+    :param fitness: Fitness of the herbivores, changed in place.
+    :param fodder: The fodder on each tile.
+    :param F: Appetite of a herbivore.
+    :param beta: Share of the fodder eaten that becomes weight.
+    :param beta_F: beta * F.
+    :param constants: The fitness constants of herbivores.
+    :return: Array with the fodder eaten on each tile.
+    """
+    a_half, phi_age, w_half, minus_phi_weight = constants
+    eaten = np.zeros(len(fodder))
+    tile = -1
+    food = 0.
+    for k in range(len(tiles)):
+        if tiles[k] != tile:
+            tile = tiles[k]
+            food = fodder[tile]
+        if food >= F:
+            weights[k] += beta_F
+            food -= F
+        elif food > 0:
+            weights[k] += beta * food
+            food = 0.
+        else:
+            continue
+        eaten[tile] = fodder[tile] - food
+        if food > 0:
+            if weights[k] <= 0.000001:
+                fitness[k] = 0.
+            else:
+                fitness[k] = (1 / (1 + math.exp(phi_age * (ages[k] - a_half)))) * \
+                    (1 / (1 + math.exp(minus_phi_weight * (weights[k] - w_half))))
+    return eaten
+
+
+def feed_numpy(tiles, ages, weights, fitness, fodder, F, beta, beta_F, constants):
+    """NumPy version of feed_loop"""
+    eaten = np.zeros(len(fodder))
+    if len(tiles) == 0:
+        return eaten
+    starts = np.flatnonzero(np.r_[True, tiles[1:] != tiles[:-1]])
+    rank = np.arange(len(tiles)) - np.repeat(starts, np.diff(np.r_[starts, len(tiles)]))
+    before = fodder[tiles] - rank * F
+    full = before >= F
+    part = (before > 0) & ~full
+    weights[full] += beta_F
+    weights[part] += beta * before[part]
+    refresh = before > F
+    fitness[refresh] = fitness_numpy(ages[refresh], weights[refresh], constants)
+    counts = np.bincount(tiles, minlength=len(fodder))
+    eaten[counts > 0] = np.minimum(fodder, counts * F)[counts > 0]
+    return eaten
+
+
+def hunt_loop(herb_fitness, herb_weights, carn_ages, carn_weights, carn_fitness, draws, F, beta,
+              inv_delta_phi_max, delta_phi_max, constants):
+    """
+    Makes the carnivores of a tile hunt, as Terrain.carn_eat_on_tile. After each carnivore has
+    hunted, as many herbivores as it killed are taken from the start of the list, which is how
+    the object engine removes the prey.
+
+    :param herb_fitness: Fitness of the herbivores of the tile, in increasing order.
+    :param herb_weights: Weights of the herbivores.
+    :param carn_ages: Ages of the carnivores of the tile, in the order they hunt.
+    :param carn_weights: Weights of the carnivores, changed in place.
+    :param carn_fitness: Fitness of the carnivores, in decreasing order, changed in place.
+    :param draws: Array of uniform random numbers, one row per carnivore and one column per
+     herbivore.
+    :param F: Appetite of a carnivore.
+    :param beta: Share of the prey eaten that becomes weight.
+    :param inv_delta_phi_max: 1 / DeltaPhiMax.
+    :param delta_phi_max: DeltaPhiMax.
+    :param constants: The fitness constants of carnivores.
+    :return: The number of herbivores removed from the start of the list.
+    """
+    a_half, phi_age, w_half, minus_phi_weight = constants
+    first = 0
+    for c in range(len(carn_fitness)):
+        food_eaten = 0.
+        kills = 0
+        for h in range(first, len(herb_fitness)):
+            if food_eaten >= F:
+                break
+            difference = carn_fitness[c] - herb_fitness[h]
+            p = 1.
+            if difference <= 0:
+                p = 0.
+            elif difference < delta_phi_max:
+                p = difference * inv_delta_phi_max
+            if p > draws[c, h]:
+                if food_eaten + herb_weights[h] < F:
+                    carn_weights[c] += herb_weights[h] * beta
+                else:
+                    carn_weights[c] += (F - food_eaten) * beta
+                food_eaten += herb_weights[h]
+                if carn_weights[c] <= 0.000001:
+                    carn_fitness[c] = 0.
+                else:
+                    carn_fitness[c] = (1 / (1 + math.exp(phi_age * (carn_ages[c] - a_half)))) * \
+                        (1 / (1 + math.exp(minus_phi_weight * (carn_weights[c] - w_half))))
+                kills += 1
+        first += kills
+    return first
+
+
+def hunt_numpy(herb_fitness, herb_weights, carn_ages, carn_weights, carn_fitness, draws, F, beta,
+               inv_delta_phi_max, delta_phi_max, constants):
+    """Version of hunt_loop looping over the kills, finding the next kill of a carnivore with
+    NumPy"""
+    a_half, phi_age, w_half, minus_phi_weight = constants
+    first = 0
+    for c in range(len(carn_fitness)):
+        food_eaten = 0.
+        kills = 0
+        h = first
+        while h < len(herb_fitness) and food_eaten < F:
+            difference = carn_fitness[c] - herb_fitness[h:]
+            p = difference * inv_delta_phi_max
+            p[difference >= delta_phi_max] = 1.
+            p[difference <= 0] = 0.
+            hits = p > draws[c, h:]
+            hit = hits.argmax()
+            if not hits[hit]:
+                break
+            h += hit
+            if food_eaten + herb_weights[h] < F:
+                carn_weights[c] += herb_weights[h] * beta
+            else:
+                carn_weights[c] += (F - food_eaten) * beta
+            food_eaten += herb_weights[h]
+            if carn_weights[c] <= 0.000001:
+                carn_fitness[c] = 0.
+            else:
+                carn_fitness[c] = (1 / (1 + math.exp(phi_age * (carn_ages[c] - a_half)))) * \
+                    (1 / (1 + math.exp(minus_phi_weight * (carn_weights[c] - w_half))))
+            kills += 1
+            h += 1
+        first += kills
+    return first
+
+
+def breed_loop(counts, weights, fitness, uniform, newborn_draws, gamma, weight_limit, xi):
+    """
+    Finds the animals giving birth, as Animal.check_birth, and makes them lose weight.
+
+    :param counts: The number of animals of the species on the tile of each animal, at the start
+     of the breeding.
+    :param weights: Weights of the animals, changed in place.
+    :param fitness: Fitness of the animals.
+    :param uniform: A uniform random number for each animal.
+    :param newborn_draws: A drawn birth weight for each animal.
+    :param gamma: Birth probability constant.
+    :param weight_limit: The least weight of an animal giving birth, zeta * (w_birth + sigma_birth).
+    :param xi: Weight lost per weight of the newborn.
+    :return: Array with the weight of the newborn of each animal, 0 if none.
+    """
+    newborn = np.zeros(len(weights))
+    for k in range(len(weights)):
+        if counts[k] < 2:
+            continue
+        if min(1., gamma * fitness[k] * (counts[k] - 1)) > uniform[k] and \
+                weights[k] >= weight_limit:
+            if newborn_draws[k] > 0 and weights[k] > newborn_draws[k] * xi:
+                weights[k] -= newborn_draws[k] * xi
+                newborn[k] = newborn_draws[k]
+    return newborn
+
+
+def breed_numpy(counts, weights, fitness, uniform, newborn_draws, gamma, weight_limit, xi):
+    """NumPy version of breed_loop"""
+    births = (counts > 1) & (np.minimum(1., gamma * fitness * (counts - 1)) > uniform) & \
+        (weights >= weight_limit) & (newborn_draws > 0) & (weights > newborn_draws * xi)
+    newborn = np.where(births, newborn_draws, 0.)
+    weights[births] -= newborn[births] * xi
+    return newborn
+
+
+def migrate_loop(tiles, fitness, uniform, directions, mu, movable, inner, cols):
+    """
+    Moves the animals trying to migrate, as Terrain.migration_herb, to the neighbouring tile
+    drawn for them if animals can live there.
+
+    :param tiles: The tile of each animal, changed in place.
+    :param fitness: Fitness of the animals.
+    :param uniform: A uniform random number for each animal.
+    :param directions: A drawn direction for each animal, 0 up, 1 down, 2 right and 3 left.
+    :param mu: Migration constant.
+    :param movable: True for each tile animals can move to.
+    :param inner: True for each tile animals can move from, that is, not on the border.
+    :param cols: Number of columns of the island.
+    :return: Array which is 1 for animals that tried to move, and 2 for those that moved.
+    """
+    offsets = np.array([-cols, cols, 1, -1])
+    moves = np.zeros(len(tiles), dtype=np.int8)
+    for k in range(len(tiles)):
+        if inner[tiles[k]] and mu * fitness[k] > uniform[k]:
+            target = tiles[k] + offsets[directions[k]]
+            if movable[target]:
+                tiles[k] = target
+                moves[k] = 2
+            else:
+                moves[k] = 1
+    return moves
+
+
+def migrate_numpy(tiles, fitness, uniform, directions, mu, movable, inner, cols):
+    """NumPy version of migrate_loop"""
+    offsets = np.array([-cols, cols, 1, -1])
+    tries = inner[tiles] & (mu * fitness > uniform)
+    targets = np.where(tries, tiles + offsets[directions], tiles)
+    moved = tries & movable[targets]
+    tiles[moved] = targets[moved]
+    return tries.astype(np.int8) + moved
+
+
+def end_of_year_loop(ages, weights, fitness, uniform, eta, omega, constants):
+    """
+    Makes the animals age and lose weight, finds their fitness and checks if they die, as
+    Terrain.end_of_year_on_tile.
+
+    :param ages: Ages of the animals, changed in place.
+    :param weights: Weights of the animals, changed in place.
+    :param fitness: Fitness of the animals, changed in place.
+    :param uniform: A uniform random number for each animal.
+    :param eta: Share of the weight lost.
+    :param omega: Death probability constant.
+    :param constants: The fitness constants of the species.
+    :return: Boolean array which is True for the animals that survive.
+    """
+    a_half, phi_age, w_half, minus_phi_weight = constants
+    alive = np.zeros(len(ages), dtype=np.bool_)
+    for k in range(len(ages)):
+        ages[k] += 1
+        weights[k] -= eta * weights[k]
+        if weights[k] <= 0.000001:
+            fitness[k] = 0.
+            continue
+        fitness[k] = (1 / (1 + math.exp(phi_age * (ages[k] - a_half)))) * \
+            (1 / (1 + math.exp(minus_phi_weight * (weights[k] - w_half))))
+        alive[k] = not omega * (1 - fitness[k]) > uniform[k]
+    return alive
+
+
+def end_of_year_numpy(ages, weights, fitness, uniform, eta, omega, constants):
+    """NumPy version of end_of_year_loop"""
+    ages += 1
+    weights -= eta * weights
+    fitness[:] = fitness_numpy(ages, weights, constants)
+    return (weights > 0.000001) & ~(omega * (1 - fitness) > uniform)
+
+
+LOOP_KERNELS = {'feed': feed_loop, 'hunt': hunt_loop, 'breed': breed_loop,
+                'migrate': migrate_loop, 'end_of_year': end_of_year_loop}
+NUMPY_KERNELS = {'feed': feed_numpy, 'hunt': hunt_numpy, 'breed': breed_numpy,
+                 'migrate': migrate_numpy, 'end_of_year': end_of_year_numpy}
+
+
+@functools.lru_cache(maxsize=None)
+def _numba_kernels():
+    """Compiles the loop kernels with Numba, the first time they are asked for"""
+    return {name: numba.njit(cache=True)(kernel) for name, kernel in LOOP_KERNELS.items()}
+
+
+def resolve_backend(backend='auto'):
+    """
+    Finds the backend that will be used when the given backend is asked for. If Numba is asked
+    for but not installed, a warning is given and the NumPy backend is used.
+
+    :param backend: One of BACKENDS.
+    :return: 'numba', 'numpy' or 'python'.
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Unknown kernel backend {}, choose one of {}'.format(backend, BACKENDS))
+    if backend in ('auto', 'numba'):
+        if numba is not None:
+            return 'numba'
+        if backend == 'numba':
+            warnings.warn('Numba is not installed, the NumPy kernels are used instead')
+        return 'numpy'
+    return backend
+
+
+def get_kernels(backend):
+    """
+    Fetches the kernels of a backend.
+
+    :param backend: 'numba', 'numpy' or 'python', see resolve_backend.
+    :return: Dictionary with the kernels feed, hunt, breed, migrate and end_of_year.
+    """
+    if backend == 'numba':
+        return _numba_kernels()
+    if backend == 'python':
+        return LOOP_KERNELS
+    return NUMPY_KERNELS
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+Maps shared by the profiler, the validation harness and the benchmarks.
+"""
+
+import textwrap
+
+CHECK_SIM_MAP = textwrap.dedent("""\
+    WWWWWWWWWWWWWWWWWWWWW
+    WWWWWWWWHWWWWLLLLLLLW
+    WHHHHHLLLLWWLLLLLLLWW
+    WHHHHHHHHHWWLLLLLLWWW
+    WHHHHHLLLLLLLLLLLLWWW
+    WHHHHHLLLDDLLLHLLLWWW
+    WHHLLLLLDDDLLLHHHHWWW
+    WWHHHHLLLDDLLLHWWWWWW
+    WHHHLLLLLDDLLLLLLLWWW
+    WHHHHLLLLDDLLLLWWWWWW
+    WWHHHHLLLLLLLLWWWWWWW
+    WWWHHHHLLLLLLLWWWWWWW
+    WWWWWWWWWWWWWWWWWWWWW""")
+"""The map of checks/check_sim.py"""
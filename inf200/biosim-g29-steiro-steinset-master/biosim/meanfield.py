@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+A deterministic engine following the expected number of animals.
+
+Instead of animals, the engine keeps the expected number and the mean weight of the animals of
+every age on every tile, one age class per year of age up to max_age, where the oldest animals
+are gathered. Every phase moves these expected values forward with the rules of the animals, as
+array updates over the whole island:
+
+- Feeding: the herbivores of a tile share the fodder eaten, min(f_max, N F), equally.
+- Hunting: the age classes of a tile are gathered in bins of fitness, HUNT_BINS per unit of
+  fitness, or per DeltaPhiMax if smaller. A carnivore of a bin kills a herbivore of a bin with
+  the probability of Carnivore.c_eat at the mean fitness of the bins, and stops when the
+  expected prey reaches its appetite F. A herbivore survives the year if it survives every
+  carnivore of the tile. The order of the hunt, and the change of the fitness of the carnivores
+  while they hunt, are left out.
+- Breeding: an age class heavy enough to give birth gets N p newborn of weight w_birth, with
+  the birth probability p of Animal.check_birth, and loses xi w_birth p of its mean weight.
+- Migration: a share mu phi of each age class moves, a quarter in each direction, where
+  animals can live.
+- Ageing, losing weight and dying: the classes move one year up, lose eta of the weight, and a
+  share omega (1 - phi) dies.
+
+Only the tiles that hold animals are stored, one row per tile, and only the age classes up to
+the oldest one that holds animals, so the memory and the work follow the occupied part of the
+island. Expected numbers below MIN_NUMBER are set to zero, and tiles without animals are dropped.
+Since there is no randomness, a year costs the same array operations whatever the number of
+animals. On a 100x100 map of lowland with 20 herbivores and 5 carnivores on every tile, a year
+took 0.05 s over the first ten years and 0.17 s once the animals fill about 45 age classes of
+herbivores and 28 of carnivores, see benchmarks/readme.md. The expected values are not what a
+single stochastic run gives, and small populations never die out, only shrink, so the engine is
+meant for screening parameters before running the stochastic engines.
+"""
+
+from .arrays import ArrayIsland
+from .island import population_tiles, population_counts
+from .histograms import StreamingHistogram, complete_specs
+from .terrain import Terrain
+from .kernels import species_constants, fitness_numpy
+from .populations import CHUNK_SIZE
+import numpy as np
+
+MIN_NUMBER = 1e-6
+"""Expected numbers of animals in an age class on a tile below which the class is emptied"""
+
+HUNT_BINS = 128
+"""Number of fitness bins per unit of fitness, or per DeltaPhiMax if smaller, that the age
+classes of a tile are gathered in for the hunt"""
+
+HUNT_ELEMENTS = 2 ** 20
+"""Largest number of tiles times age classes of carnivores times age classes of herbivores hunted
+at a time, which bounds the memory of the hunt"""
+
+
+class MeanFieldIsland(ArrayIsland):
+    """
+    Implements the island of Island as the expected number and mean weight of the animals of
+    every age class on every tile that holds animals.
+
+    For each species, tiles holds the flat index of the tiles with animals, sorted, and numbers
+    and weights hold the expected number and the mean weight of the animals, with a row for each
+    of these tiles and a column for every age class up to the oldest one holding animals.
+    """
+
+    def __init__(self, island_text, seed=None, ini_pop=None, max_age=100):
+        """
+        :param island_text: a string containing lines with the same amount of characters
+            indicating terrain type of each tile on the entire island.
+        :param seed: not used, since the engine draws no random numbers.
+        :param ini_pop: list of animals that should be set out on the island when initiated.
+        :param max_age: the age of the oldest age class, which also holds all older animals.
+        """
+        super().__init__(island_text, seed, backend='numpy')
+        self.populations = {}
+        self.ages = np.arange(max_age + 1, dtype=float)
+        self.tiles = {species: np.zeros(0, dtype=np.int64) for species in self.species}
+        self.numbers = {species: np.zeros((0, 1)) for species in self.species}
+        self.weights = {species: np.zeros((0, 1)) for species in self.species}
+        if ini_pop:
+            self.spawn_animal(ini_pop)
+
+    def fitness(self, species):
+        """Returns the fitness of every age class of a species on every tile it is on"""
+        weights = self.weights[species]
+        return fitness_numpy(self.ages[:weights.shape[1]], weights,
+                             species_constants(self.tables[species]))
+
+    def age_classes(self, species):
+        """
+        Returns the expected number and the mean weight of the animals of a species in every age
+        class on every tile, with zeros where there are no animals.
+
+        :param species: The species.
+        :return: Tuple with the numbers and the weights, as arrays with a row for every tile and
+         a column for every age class.
+        """
+        numbers = np.zeros((self.num_tiles, len(self.ages)))
+        weights = np.zeros((self.num_tiles, len(self.ages)))
+        num_classes = self.numbers[species].shape[1]
+        numbers[self.tiles[species], :num_classes] = self.numbers[species]
+        weights[self.tiles[species], :num_classes] = self.weights[species]
+        return numbers, weights
+
+    def _rows(self, species, tiles, num_classes=1):
+        """
+        Makes room for animals of a species on the given tiles and in the first num_classes age
+        classes, and finds their rows.
+
+        :param species: The species.
+        :param tiles: Flat index of each tile.
+        :param num_classes: Number of age classes needed.
+        :return: The row of each tile.
+        """
+        old_tiles = self.tiles[species]
+        occupied = np.zeros(self.num_tiles, dtype=bool)
+        occupied[old_tiles] = True
+        occupied[tiles] = True
+        new_tiles = np.flatnonzero(occupied)
+        old_shape = self.numbers[species].shape
+        width = min(max(old_shape[1], num_classes), len(self.ages))
+        if len(new_tiles) > len(old_tiles) or width > old_shape[1]:
+            rows = np.searchsorted(new_tiles, old_tiles)
+            for values in (self.numbers, self.weights):
+                grown = np.zeros((len(new_tiles), width))
+                grown[rows, :old_shape[1]] = values[species]
+                values[species] = grown
+            self.tiles[species] = new_tiles
+        return np.searchsorted(new_tiles, tiles)
+
+    def _add(self, species, tiles, classes, numbers, weights):
+        """
+        Adds animals to age classes, mixing their weight into the mean weight of the class.
+
+        :param species: The species.
+        :param tiles: Flat index of the tile of each group of animals.
+        :param classes: Age class of each group.
+        :param numbers: Number of animals in each group.
+        :param weights: Weight of the animals of each group.
+        """
+        classes = np.asarray(classes, dtype=np.int64)
+        if len(classes) == 0:
+            return
+        numbers = np.asarray(numbers, dtype=float)
+        rows = self._rows(species, tiles, classes.max() + 1)
+        shape = self.numbers[species].shape
+        cells, groups = np.unique(np.ravel_multi_index((rows, classes), shape),
+                                  return_inverse=True)
+        cells = np.unravel_index(cells, shape)
+        total = self.numbers[species][cells] + np.bincount(groups.ravel(), numbers)
+        mass = self.numbers[species][cells] * self.weights[species][cells] + np.bincount(
+            groups.ravel(), numbers * np.asarray(weights, dtype=float))
+        self.numbers[species][cells] = total
+        self.weights[species][cells] = self._mean_weight(mass, total)
+
+    @staticmethod
+    def _mean_weight(mass, numbers):
+        """Divides the total weight of each class by its number of animals, 0 for empty
+        classes"""
+        return np.divide(mass, numbers, out=np.zeros_like(mass), where=numbers > 0)
+
+    def add_population_tiles(self, species, rows, cols, ages, weights):
+        """Places animals of one species on any tiles, in the age class of their age, see
+        Island"""
+        tiles, ages, weights = population_tiles(self.shape, self.species, species, rows, cols,
+                                                ages, weights)
+        self._add(species, tiles, np.minimum(ages, len(self.ages) - 1).astype(int),
+                  np.ones(len(ages)), weights)
+
+    def add_population_counts(self, species, counts, age, weight):
+        """Places a number of equal animals of one species on every tile, see Island"""
+        counts = population_counts(self.shape, self.species, species, counts, age, weight)
+        tiles = np.flatnonzero(counts)
+        self._add(species, tiles, np.full(len(tiles), min(int(age), len(self.ages) - 1)),
+                  counts.ravel()[tiles], np.full(len(tiles), weight))
+
+    def all_herbivores_eat(self):
+        """Make the herbivores of each tile share the fodder eaten equally"""
+        numbers = self.numbers['Herbivore']
+        tiles = self.tiles['Herbivore']
+        total = numbers.sum(axis=1)
+        table = self.tables['Herbivore']
+        eaten = np.where(total > 0, np.minimum(self.fodder[tiles], total * table['F']), 0.)
+        share = np.divide(eaten, total, out=np.zeros_like(eaten), where=total > 0)
+        self.weights['Herbivore'] += np.where(numbers > 0, table['beta'] * share[:, None], 0.)
+        self.events['fodder_eaten'][tiles] += eaten
+
+    def _fitness_bins(self, species, rows, width):
+        """
+        Gathers the age classes of a species on the given rows in bins of fitness.
+
+        :param species: The species.
+        :param rows: The rows to gather.
+        :param width: The width of a bin.
+        :return: Tuple with the number, the total weight and the mean fitness of the animals in
+         every bin of every row, with a column for every bin that holds animals on any of the
+         rows, and the flat index in these arrays of the bin of every age class of the rows.
+        """
+        numbers = self.numbers[species][rows]
+        weights = self.weights[species][rows]
+        fitness = fitness_numpy(self.ages[:numbers.shape[1]], weights,
+                                species_constants(self.tables[species]))
+        bins = (fitness * (1 / width)).astype(np.int64)
+        # Counting the bins is faster than sorting them, unless they are very narrow
+        columns = np.unique(bins[numbers > 0]) if bins.max() >= bins.size else \
+            np.flatnonzero(np.bincount(bins[numbers > 0], minlength=bins.max() + 1))
+        cells = np.minimum(np.searchsorted(columns, bins), len(columns) - 1)
+        del bins
+        cells += np.arange(len(numbers))[:, None] * len(columns)
+        shape = (len(numbers), len(columns))
+        fitness *= numbers
+        counts, mass, fitness_sums = (
+            np.bincount(cells.ravel(), values.ravel(), minlength=shape[0] * shape[1]
+                        ).reshape(shape) for values in (numbers, numbers * weights, fitness))
+        return counts, mass, self._mean_weight(fitness_sums, counts), cells
+
+    def all_carnivores_eat(self):
+        """Make the carnivores hunt, removing the expected number of herbivores killed. The
+        tiles are hunted a block at a time, so that the arrays of the hunt stay small."""
+        tiles, herb_rows, carn_rows = np.intersect1d(
+            self.tiles['Herbivore'], self.tiles['Carnivore'], assume_unique=True,
+            return_indices=True)
+        every_herb = len(tiles) == len(self.tiles['Herbivore'])
+        every_carn = len(tiles) == len(self.tiles['Carnivore'])
+        table = self.tables['Carnivore']
+        width = min(table['DeltaPhiMax'], 1.) / HUNT_BINS
+        chunk = max(1, HUNT_ELEMENTS // (self.numbers['Herbivore'].shape[1] *
+                                         self.numbers['Carnivore'].shape[1]))
+        for start in range(0, len(tiles), chunk):
+            part = slice(start, start + chunk)
+            self.events['kills'][tiles[part]] += self._hunt(
+                part if every_herb else herb_rows[part], part if every_carn else carn_rows[part],
+                table, width)
+        self._clean('Herbivore')
+
+    def _hunt(self, herb_rows, carn_rows, table, width):
+        """
+        Makes the carnivores of some tiles hunt the herbivores of the same tiles.
+
+        :param herb_rows: The rows of the herbivores of the tiles.
+        :param carn_rows: The rows of the carnivores of the tiles, in the same order.
+        :param table: The parameter table of carnivores.
+        :param width: The width of the fitness bins.
+        :return: The expected number of herbivores killed on each tile.
+        """
+        prey, prey_mass, prey_fitness, herb_cells = self._fitness_bins('Herbivore', herb_rows,
+                                                                       width)
+        hunters, _, hunter_fitness, carn_cells = self._fitness_bins('Carnivore', carn_rows, width)
+        hunter_fitness[hunters == 0] = 0.
+        attempts = hunter_fitness[:, :, None] - prey_fitness[:, None, :]
+        attempts *= table['inv_DeltaPhiMax']
+        np.clip(attempts, 0, 1, out=attempts)
+        # Expected prey of a carnivore hunting every herbivore of the tile, and the share of the
+        # herbivores it goes through before its appetite is met
+        reach = np.einsum('jch,jh->jc', attempts, prey_mass)
+        satiation = np.divide(table['F'], reach, out=np.ones_like(reach),
+                              where=reach > table['F'])
+        attempts *= satiation[:, :, None]
+        with np.errstate(divide='ignore'):
+            misses = np.log1p(-attempts)
+        survival = np.exp(np.einsum('jc,jch->jh', hunters, misses))
+        killed = prey * (1 - survival)
+        wanted = np.einsum('jc,jch->jh', hunters, attempts) * prey
+        caught = np.divide(killed, wanted, out=np.zeros_like(killed), where=wanted > 0)
+        meal = np.einsum('jch,jh->jc', attempts, caught * prey_mass)
+        gain = (table['beta'] * np.minimum(meal, table['F'])).ravel()[carn_cells]
+        gain[self.numbers['Carnivore'][carn_rows] == 0] = 0.
+        self.numbers['Herbivore'][herb_rows] *= survival.ravel()[herb_cells]
+        self.weights['Carnivore'][carn_rows] += gain
+        return killed.sum(axis=1)
+
+    def all_breed(self):
+        """Make the age classes heavy enough to give birth to their expected number of newborn"""
+        for species in self.species:
+            numbers = self.numbers[species]
+            weights = self.weights[species]
+            table = self.tables[species]
+            probability = self.fitness(species)
+            probability *= table['gamma'] * (numbers.sum(axis=1, keepdims=True) - 1)
+            np.clip(probability, 0, 1, out=probability)
+            probability[weights < table['birth_weight_limit']] = 0.
+            probability[weights <= table['w_birth'] * table['xi']] = 0.
+            newborn = np.einsum('ij,ij->i', numbers, probability)
+            if not newborn.any():
+                continue
+            probability *= table['xi'] * table['w_birth']
+            weights -= probability
+            rows = np.flatnonzero(newborn)
+            tiles = self.tiles[species]
+            self.events['births'][tiles] += newborn
+            self._add(species, tiles[rows], np.zeros(len(rows), dtype=int), newborn[rows],
+                      np.full(len(rows), table['w_birth']))
+
+    def all_migrate(self):
+        """Make a share of each age class move to the neighbouring tiles animals can live on.
+        Rows are made for the tiles the animals reach, and every row gathers the animals
+        arriving from its four neighbours in place."""
+        offsets = (-self.shape[1], self.shape[1], 1, -1)
+        for species in ('Carnivore', 'Herbivore'):
+            origins = self.tiles[species]
+            # The animals leaving each row in each direction, with a last row of zeros for the
+            # neighbours that no animals come from
+            leaving = np.zeros((len(origins) + 1, self.numbers[species].shape[1]))
+            share = self.fitness(species)
+            share *= self.tables[species]['mu']
+            np.clip(share, 0, 1, out=share)
+            share /= 4
+            np.multiply(self.numbers[species], share, out=leaving[:-1])
+            del share
+            leaving[:-1][~self.inner[origins]] = 0.
+            moving = leaving[:-1].any(axis=1)
+            if not moving.any():
+                continue
+            leaving_mass = np.zeros_like(leaving)
+            np.multiply(leaving[:-1], self.weights[species], out=leaving_mass[:-1])
+            targets = [np.clip(origins + offset, 0, self.num_tiles - 1) for offset in offsets]
+            num_open = sum(self.movable[target] for target in targets)[:, None]
+            self._rows(species, np.concatenate([target[moving & self.movable[target]]
+                                                for target in targets]))
+            tiles = self.tiles[species]
+            numbers = self.numbers[species]
+            mass = self.weights[species]
+            mass *= numbers
+            rows = slice(None) if len(tiles) == len(origins) else np.searchsorted(tiles, origins)
+            moves = np.empty_like(numbers)
+            departures = moves[:len(origins)]
+            np.multiply(leaving[:-1], num_open, out=departures)
+            self.events['migrations_attempted'][origins] += 4 * leaving[:-1].sum(axis=1)
+            self.events['migrations_completed'][origins] += departures.sum(axis=1)
+            numbers[rows] -= departures
+            np.multiply(leaving_mass[:-1], num_open, out=departures)
+            mass[rows] -= departures
+            receiving = self.movable[tiles]
+            for offset in offsets:
+                sources = tiles - offset
+                found = np.minimum(np.searchsorted(origins, sources), len(origins) - 1)
+                sources = np.where(receiving & (origins[found] == sources), found, len(origins))
+                numbers += np.take(leaving, sources, axis=0, out=moves, mode='clip')
+                mass += np.take(leaving_mass, sources, axis=0, out=moves, mode='clip')
+            np.divide(mass, numbers, out=mass, where=numbers > 0)
+            self._clean(species)
+
+    def all_age(self):
+        """Move every age class one year up, gathering the oldest animals in the last class"""
+        for species in self.species:
+            if self.numbers[species][:, -1].any():
+                self._rows(species, [], self.numbers[species].shape[1] + 1)
+            numbers = self.numbers[species]
+            weights = self.weights[species]
+            oldest_numbers = numbers[:, -2:].sum(axis=1)
+            oldest_mass = (numbers[:, -2:] * weights[:, -2:]).sum(axis=1)
+            numbers[:, 1:] = numbers[:, :-1]
+            weights[:, 1:] = weights[:, :-1]
+            numbers[:, 0] = 0.
+            weights[:, 0] = 0.
+            if numbers.shape[1] == len(self.ages):
+                numbers[:, -1] = oldest_numbers
+                weights[:, -1] = self._mean_weight(oldest_mass, oldest_numbers)
+
+    def all_lose_weight(self):
+        """Make all the age classes lose weight"""
+        for species in self.species:
+            self.weights[species] -= self.tables[species]['eta'] * self.weights[species]
+
+    def all_die(self):
+        """Remove the expected number of animals dying in every age class"""
+        for species in self.species:
+            table = self.tables[species]
+            deaths = self.fitness(species)
+            np.subtract(1, deaths, out=deaths)
+            deaths *= table['omega']
+            np.clip(deaths, 0, 1, out=deaths)
+            deaths[self.weights[species] <= 0.000001] = 1.
+            deaths *= self.numbers[species]
+            self.numbers[species] -= deaths
+            self.events['deaths'][self.tiles[species]] += deaths.sum(axis=1)
+            self._clean(species)
+
+    def all_end_of_year(self):
+        """Make all the age classes age, lose weight and then die"""
+        self.all_age()
+        self.all_lose_weight()
+        self.all_die()
+
+    def _clean(self, species):
+        """Empties the age classes with fewer than MIN_NUMBER expected animals, and drops the
+        tiles and the oldest age classes left without animals"""
+        numbers = self.numbers[species]
+        empty = numbers < MIN_NUMBER
+        numbers[empty] = 0.
+        self.weights[species][empty] = 0.
+        rows = ~empty.all(axis=1)
+        classes = np.flatnonzero(~empty.all(axis=0))
+        width = classes[-1] + 1 if len(classes) else 1
+        if not rows.all() or width < numbers.shape[1]:
+            self.tiles[species] = self.tiles[species][rows]
+            self.numbers[species] = np.ascontiguousarray(numbers[rows, :width])
+            self.weights[species] = np.ascontiguousarray(self.weights[species][rows, :width])
+
+    def reset_events(self):
+        """Returns the expected number of events on each tile, as flat arrays, and starts from
+        zero again"""
+        events = self.events
+        self.events = {name: np.zeros(self.num_tiles) for name in Terrain.event_names}
+        return events
+
+    def _tile_totals(self, species):
+        """Returns the expected number of animals of a species on every tile, as a flat
+        array"""
+        totals = np.zeros(self.num_tiles)
+        totals[self.tiles[species]] = self.numbers[species].sum(axis=1)
+        return totals
+
+    def get_statistics(self, hist_specs=None, histograms=True):
+        """Gathers up the expected density of each species, rounded to whole animals, and
+        histograms of the age classes, see Island. The unrounded expected numbers of herbivores
+        and carnivores are given as census, which BioSim leaves out phases and fast-forwards
+        empty islands by, since an island can hold animals that round to none."""
+        hist_specs = complete_specs(hist_specs)
+        herb_total = self._tile_totals('Herbivore')
+        carn_total = self._tile_totals('Carnivore')
+        herb_map = np.rint(herb_total).astype(np.int64).reshape(self.shape)
+        carn_map = np.rint(carn_total).astype(np.int64).reshape(self.shape)
+        self.density['Herbivore'].update(herb_map)
+        self.density['Carnivore'].update(carn_map)
+        statistics = {'herb_map': herb_map, 'carn_map': carn_map,
+                      'num_herb': int(round(herb_total.sum())),
+                      'num_carn': int(round(carn_total.sum())),
+                      'census': (float(herb_total.sum()), float(carn_total.sum()))}
+        if histograms:
+            for name in ('age', 'fitness', 'weight'):
+                histogram = StreamingHistogram.from_spec(hist_specs[name])
+                for index, species in enumerate(self.species):
+                    numbers = self.numbers[species]
+                    values = {'age': np.broadcast_to(self.ages[:numbers.shape[1]], numbers.shape),
+                              'fitness': self.fitness(species),
+                              'weight': self.weights[species]}[name]
+                    histogram.add_array(index, values.ravel(), numbers.ravel())
+                statistics[name] = histogram.counts
+        return statistics
+
+    def animal_chunks(self, chunk_size=CHUNK_SIZE):
+        """Hands out the age classes, repeated for the rounded expected number of animals, a chunk
+        at a time, see Island"""
+        for index, species in enumerate(self.species):
+            num_classes = self.numbers[species].shape[1]
+            sizes = np.rint(self.numbers[species]).astype(np.int64).ravel()
+            fitness = self.fitness(species).ravel()
+            weights = self.weights[species].ravel()
+            occupied = np.flatnonzero(sizes)
+            ends = np.searchsorted(np.cumsum(sizes[occupied]), np.arange(
+                chunk_size, sizes.sum(), chunk_size), side='right')
+            for elements in np.split(occupied, np.unique(ends)):
+                if len(elements) == 0:
+                    continue
+                repeats = sizes[elements]
+                rows, classes = np.divmod(np.repeat(elements, repeats), num_classes)
+                rows, cols = np.divmod(self.tiles[species][rows], self.shape[1])
+                yield {'row': rows + 1, 'col': cols + 1,
+                       'species': np.full(len(rows), index, dtype=np.int64),
+                       'age': self.ages[classes],
+                       'weight': np.repeat(weights[elements], repeats),
+                       'fitness': np.repeat(fitness[elements], repeats)}
+
+    def get_maps(self):
+        """Gathers up the density, the values of the age classes, repeated for the rounded
+        expected number of animals, and the number of each species, in the form of
+        Island.get_maps"""
+        statistics = self.get_statistics(histograms=False)
+        values = [[], [], []]
+        for species in self.species:
+            numbers = self.numbers[species]
+            repeats = np.rint(numbers).astype(int).ravel()
+            ages = np.broadcast_to(self.ages[:numbers.shape[1]], numbers.shape)
+            for index, array in enumerate((ages, self.fitness(species), self.weights[species])):
+                values[index].append(list(np.repeat(array.ravel(), repeats)))
+        return [statistics['herb_map'].tolist(), statistics['carn_map'].tolist(), *values,
+                statistics['num_herb'], statistics['num_carn']]
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+The phases of a simulated year.
+
+A year is a pipeline of phases, each calling a method of the island. A scenario is made by
+swapping, skipping or scheduling phases of the standard year, for example
+
+pipeline = standard_year().swap('all_eat', Hunt()).schedule('all_breed', range(0, 1000, 2))
+
+Before a phase is called, the pipeline checks whether the phase can change the island, given the
+number of animals of each species at the start of the year, and leaves it out if it cannot. A
+phase that may add animals makes the numbers unknown for the rest of the year.
+"""
+
+from time import perf_counter
+import copy
+
+
+class Phase:
+    """
+    A step of the year, calling the method of the island given by the class attribute method.
+    """
+
+    method = None
+    may_add_animals = False
+
+    def __init__(self, name=None, years=None, args=()):
+        """
+        :param name: Name of the phase, used for timing, defaults to the name of the method.
+        :param years: The years the phase runs in, either a container of years or a function of
+         the year returning True or False. Defaults to every year.
+        :param args: Arguments to the method.
+        """
+        self.name = name or self.method
+        self.years = years
+        self.args = args
+
+    def active(self, year):
+        """Returns True if the phase runs in the given year"""
+        if self.years is None:
+            return True
+        if callable(self.years):
+            return self.years(year)
+        return year in self.years
+
+    def is_noop(self, num_herb, num_carn):
+        """
+        Returns True if the phase cannot change an island with at most the given numbers of
+        animals.
+
+        :param num_herb: Number of herbivores.
+        :param num_carn: Number of carnivores.
+        """
+        return num_herb == 0 and num_carn == 0
+
+    def bind(self, island):
+        """Returns the function calling the method of the given island"""
+        method = getattr(island, self.method)
+        if not self.args:
+            return method
+        return lambda: method(*self.args)
+
+    def scheduled(self, years):
+        """Returns a copy of the phase running in the given years"""
+        phase = copy.copy(self)
+        phase.years = years
+        return phase
+
+    def __repr__(self):
+        """Shows the class and the name of the phase"""
+        return '{}({!r})'.format(type(self).__name__, self.name)
+
+
+class Eat(Phase):
+    """The herbivores and then the carnivores of every tile eat, tile by tile"""
+    method = 'all_eat'
+
+
+class Feed(Phase):
+    """Only the herbivores eat"""
+    method = 'all_herbivores_eat'
+
+    def is_noop(self, num_herb, num_carn):
+        """Returns True if there are no herbivores to eat"""
+        return num_herb == 0
+
+
+class Hunt(Phase):
+    """Only the carnivores eat. The herbivores are still sorted by fitness without carnivores."""
+    method = 'all_carnivores_eat'
+
+
+class Breed(Phase):
+    """The animals give birth"""
+    method = 'all_breed'
+    may_add_animals = True
+
+    def is_noop(self, num_herb, num_carn):
+        """Returns True if neither species has a mate to breed with. The numbers can be
+        expected numbers, as in biosim.meanfield, where more than one animal can breed."""
+        return num_herb <= 1 and num_carn <= 1
+
+
+class Migrate(Phase):
+    """The animals migrate"""
+    method = 'all_migrate'
+
+
+class Age(Phase):
+    """The animals get one year older"""
+    method = 'all_age'
+
+
+class LoseWeight(Phase):
+    """The animals lose weight"""
+    method = 'all_lose_weight'
+
+
+class Die(Phase):
+    """The animals that die are removed"""
+    method = 'all_die'
+
+
+class EndOfYear(Phase):
+    """The animals age, lose weight and those that die are removed, in one pass over each tile"""
+    method = 'all_end_of_year'
+
+
+class AddPopulation(Phase):
+    """Places new animals on the island, given as args=(population,) on the same form as ini_pop"""
+    method = 'spawn_animal'
+    may_add_animals = True
+
+    def __init__(self, population=None, years=None, name='add_population', args=None):
+        """
+        :param population: The animals to add, on the same form as ini_pop.
+        :param years: The years the animals are added in, see Phase.
+        :param name: Name of the phase.
+        :param args: Arguments to spawn_animal, instead of (population,).
+        """
+        super().__init__(name, years, args if args is not None else (population,))
+
+    def is_noop(self, num_herb, num_carn):
+        """Returns False, since animals are added whatever the numbers"""
+        return False
+
+
+class Pipeline:
+    """
+    An ordered list of phases making up a year.
+    """
+
+    def __init__(self, phases):
+        """
+        :param phases: List of Phase objects, in the order they run.
+        """
+        self.phases = list(phases)
+        self.elided = {}
+
+    @property
+    def names(self):
+        """The names of the phases, in order"""
+        return [phase.name for phase in self.phases]
+
+    def _index(self, name):
+        """Finds the position of the phase with the given name"""
+        if name not in self.names:
+            raise ValueError('The pipeline has no phase called {}'.format(name))
+        return self.names.index(name)
+
+    def swap(self, name, phase):
+        """Returns a copy of the pipeline, where the phase with the given name is replaced"""
+        phases = list(self.phases)
+        phases[self._index(name)] = phase
+        return Pipeline(phases)
+
+    def skip(self, name):
+        """Returns a copy of the pipeline without the phase with the given name"""
+        phases = list(self.phases)
+        del phases[self._index(name)]
+        return Pipeline(phases)
+
+    def insert(self, before, phase):
+        """Returns a copy of the pipeline, with a phase added before the phase with the given
+        name, or at the end if before is None"""
+        phases = list(self.phases)
+        phases.insert(len(phases) if before is None else self._index(before), phase)
+        return Pipeline(phases)
+
+    def schedule(self, name, years):
+        """Returns a copy of the pipeline, where the phase with the given name only runs in the
+        given years, see Phase"""
+        return self.swap(name, self.phases[self._index(name)].scheduled(years))
+
+    def compile(self, island):
+        """
+        Binds the phases to an island.
+
+        :param island: The island, or any engine with the methods of the phases.
+        :return: List of tuples with each phase and the function to call.
+        """
+        return [(phase, phase.bind(island)) for phase in self.phases]
+
+    def run(self, compiled, year, census=None, times=None):
+        """
+        Runs the phases of a year, leaving out phases that are not scheduled for the year or
+        cannot change the island.
+
+        :param compiled: The list returned by compile.
+        :param year: The year simulated.
+        :param census: Tuple with the number, or expected number, of herbivores and carnivores at
+         the start of the year, or None if not known, in which case no phase is left out as a
+         no-op.
+        :param times: Dictionary to store the seconds spent in each phase in, or None.
+        """
+        for phase, function in compiled:
+            if not phase.active(year):
+                continue
+            if census is not None and phase.is_noop(*census):
+                self.elided[phase.name] = self.elided.get(phase.name, 0) + 1
+                continue
+            if times is not None:
+                start = perf_counter()
+                function()
+                times[phase.name] = perf_counter() - start
+            else:
+                function()
+            if phase.may_add_animals:
+                census = None
+
+
+def standard_year():
+    """The year of BioSim.simulate. Ageing, losing weight and dying run fused as EndOfYear, which
+    gives the same result as Age, LoseWeight and Die in a row."""
+    return Pipeline([Eat(), Breed(), Migrate(), EndOfYear()])
+
+
+def eruption_year():
+    """The year of BioSim.simulate_eruption, where the herbivores find no fodder"""
+    return standard_year().swap('all_eat', Hunt())
+
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+Population files, with one line per animal.
+
+A population file holds the row, column, species, age, weight and fitness of every animal, with
+the row and column counted from 1 as in ini_pop. Two formats are used, chosen by the suffix of
+the path:
+
+- .csv: a text file with a header line, for use in other programs, with the species by name.
+- .npz: a zip archive of .npy arrays, one per column and chunk, named <chunk>/<column>.npy,
+  with the species as 0 for herbivores and 1 for carnivores.
+
+Both are written and read in chunks, so a population of millions of animals never has to be in
+memory as a list of dictionaries. The engines hand out their animals in chunks with
+animal_chunks. When a file is loaded the animals are placed with add_population_tiles, and get
+the fitness of new animals like any other added animals; the fitness column is only for analysis.
+A file can also be counted straight into the statistics of get_statistics with file_statistics.
+"""
+
+from .histograms import StreamingHistogram, complete_specs
+import numpy as np
+import itertools
+import zipfile
+
+COLUMNS = ('row', 'col', 'species', 'age', 'weight', 'fitness')
+SPECIES = ('Herbivore', 'Carnivore')
+CHUNK_SIZE = 100000
+"""Number of animals in a chunk"""
+
+
+def make_chunk(rows):
+    """
+    Turns a list of animals into a chunk.
+
+    :param rows: List of tuples with the values of COLUMNS, the species as 0 or 1.
+    :return: Dictionary with an array for each column.
+    """
+    values = np.array(rows, dtype=float).reshape(-1, len(COLUMNS))
+    chunk = {name: values[:, index] for index, name in enumerate(COLUMNS)}
+    for name in ('row', 'col', 'species'):
+        chunk[name] = chunk[name].astype(np.int64)
+    return chunk
+
+
+def _file_format(path):
+    """Finds the format of a population file from its suffix"""
+    suffix = str(path).rsplit('.', 1)[-1].lower()
+    if suffix not in ('csv', 'npz'):
+        raise ValueError('A population file must end in .csv or .npz, not {}'.format(path))
+    return suffix
+
+
+def write_population(path, chunks):
+    """
+    Writes a population file, one chunk at a time.
+
+    :param path: Path of the file, ending in .csv or .npz.
+    :param chunks: Iterable of chunks, see make_chunk, for example the animal_chunks of an island.
+    :return: The number of animals written.
+    """
+    num_animals = 0
+    if _file_format(path) == 'csv':
+        with open(path, 'w') as f:
+            f.write(','.join(COLUMNS) + '\n')
+            for chunk in chunks:
+                species = np.array(SPECIES)[chunk['species']]
+                f.writelines('{},{},{},{!r},{!r},{!r}\n'.format(*line) for line in zip(
+                    chunk['row'].tolist(), chunk['col'].tolist(), species.tolist(),
+                    chunk['age'].tolist(), chunk['weight'].tolist(), chunk['fitness'].tolist()))
+                num_animals += len(species)
+    else:
+        with zipfile.ZipFile(path, 'w') as archive:
+            for number, chunk in enumerate(chunks):
+                for name in COLUMNS:
+                    with archive.open('{:06d}/{}.npy'.format(number, name), 'w',
+                                      force_zip64=True) as f:
+                        np.lib.format.write_array(f, np.ascontiguousarray(chunk[name]))
+                num_animals += len(chunk['row'])
+    return num_animals
+
+
+def read_population(path, chunk_size=CHUNK_SIZE):
+    """
+    Reads a population file, one chunk at a time.
+
+    :param path: Path of the file, ending in .csv or .npz.
+    :param chunk_size: Number of lines read at a time from a CSV file. The chunks of an npz file
+     are read as they were written.
+    :return: Generator of chunks, see make_chunk.
+    """
+    if _file_format(path) == 'csv':
+        codes = {name: code for code, name in enumerate(SPECIES)}
+        with open(path) as f:
+            header = f.readline().strip().split(',')
+            if header != list(COLUMNS):
+                raise ValueError('The header of {} must be {}'.format(path, ','.join(COLUMNS)))
+            while True:
+                lines = list(itertools.islice(f, chunk_size))
+                if not lines:
+                    return
+                rows = []
+                for line in lines:
+                    row, col, species, age, weight, fitness = line.split(',')
+                    if species not in codes:
+                        raise ValueError('There is no species called {}'.format(species))
+                    rows.append((int(row), int(col), codes[species], float(age), float(weight),
+                                 float(fitness)))
+                yield make_chunk(rows)
+    else:
+        with zipfile.ZipFile(path) as archive:
+            numbers = sorted({name.split('/')[0] for name in archive.namelist()})
+            for number in numbers:
+                chunk = {}
+                for name in COLUMNS:
+                    with archive.open('{}/{}.npy'.format(number, name)) as f:
+                        chunk[name] = np.lib.format.read_array(f)
+                yield chunk
+
+
+def add_population_file(island, path, chunk_size=CHUNK_SIZE):
+    """
+    Places the animals of a population file on an island, with one add_population_tiles for each
+    species of a chunk.
+
+    :param island: The island, or any engine with add_population_tiles.
+    :param path: Path of the file.
+    :param chunk_size: Number of lines read at a time from a CSV file.
+    :return: The number of animals placed.
+    """
+    num_animals = 0
+    for chunk in read_population(path, chunk_size):
+        for index, species in enumerate(SPECIES):
+            animals = chunk['species'] == index
+            if animals.any():
+                island.add_population_tiles(species, chunk['row'][animals],
+                                            chunk['col'][animals], chunk['age'][animals],
+                                            chunk['weight'][animals])
+        num_animals += len(chunk['row'])
+    return num_animals
+
+
+def file_statistics(path, shape, hist_specs=None, chunk_size=CHUNK_SIZE):
+    """
+    Counts a population file into the density maps, numbers and histograms of
+    Island.get_statistics, without placing the animals on an island.
+
+    :param path: Path of the file.
+    :param shape: The shape of the island.
+    :param hist_specs: Dictionary with the dimensions of the histograms.
+    :param chunk_size: Number of lines read at a time from a CSV file.
+    :return: Dictionary on the form of Island.get_statistics.
+    """
+    hist_specs = complete_specs(hist_specs)
+    maps = np.zeros((len(SPECIES),) + tuple(shape), dtype=np.int64)
+    histograms = {name: StreamingHistogram.from_spec(hist_specs[name])
+                  for name in ('age', 'fitness', 'weight')}
+    for chunk in read_population(path, chunk_size):
+        np.add.at(maps, (chunk['species'], chunk['row'] - 1, chunk['col'] - 1), 1)
+        for index in range(len(SPECIES)):
+            animals = chunk['species'] == index
+            for name, histogram in histograms.items():
+                histogram.add_array(index, chunk[name][animals])
+    statistics = {'herb_map': maps[0], 'carn_map': maps[1], 'num_herb': int(maps[0].sum()),
+                  'num_carn': int(maps[1].sum())}
+    statistics.update((name, histogram.counts) for name, histogram in histograms.items())
+    return statistics
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+Profiling of headless simulations.
+
+Run a simulation under a profiler from the command line with
+
+python -m biosim.profile --years 50 --output biosim_profile
+
+The sampling profiler writes a collapsed stack file, <output>.collapsed, that can be turned into
+a flame graph by flamegraph.pl or speedscope. With --profiler cprofile the cProfile statistics
+are written to <output>.prof instead. In both cases the time spent in each phase of the
+simulated years is written to <output>.phases.json.
+"""
+
+from .maps import CHECK_SIM_MAP
+import argparse
+import json
+import os
+import sys
+import threading
+
+DEFAULT_POPULATION = [{'loc': (5, 10),
+                       'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                               for _ in range(150)]},
+                      {'loc': (3, 2),
+                       'pop': [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                               for _ in range(40)]}]
+
+
+class SamplingProfiler:
+    """
+    Samples the call stack of a thread at a fixed interval, and counts how often every stack is
+    seen. The counts are written in the collapsed stack format used by flame graph tools.
+    """
+
+    def __init__(self, interval=0.001):
+        """
+        :param interval: Seconds between each sample.
+        """
+        self.interval = interval
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._target = None
+
+    def start(self, thread_id=None):
+        """
+        Starts sampling in a background thread.
+
+        :param thread_id: Identifier of the thread to sample, defaults to the calling thread.
+        """
+        self._target = thread_id if thread_id is not None else threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling and waits for the sampling thread to finish"""
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        """Records the current stack of the sampled thread until stopped"""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename),
+                                                 code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def write_collapsed(self, path):
+        """
+        Writes the sampled stacks to a file, one line per stack on the form
+        'outer;inner;innermost count'.
+
+        :param path: Path of the file to write.
+        """
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('{} {}\n'.format(stack, count))
+
+
+def format_report(report):
+    """
+    Makes a readable table of a timing report from BioSim.timing_report.
+
+    :param report: Dictionary with the timing report.
+    :return: The table as a string.
+    """
+    lines = ['{:<20}{:>12}{:>14}{:>8}'.format('phase', 'total [s]', 'per year [s]', 'share')]
+    for phase in sorted(report['total'], key=report['total'].get, reverse=True):
+        lines.append('{:<20}{:>12.4f}{:>14.6f}{:>7.1%}'.format(phase, report['total'][phase],
+                                                               report['mean'][phase],
+                                                               report['share'][phase]))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """
+    Runs a headless simulation under a profiler, as given by the command line arguments.
+
+    :param argv: List of command line arguments, defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(prog='python -m biosim.profile',
+                                     description='Profile a headless BioSim simulation.')
+    parser.add_argument('--map', help='file containing the island map, defaults to the map of '
+                                      'checks/check_sim.py')
+    parser.add_argument('--pop', help='JSON file containing the initial population, on the '
+                                      'same form as ini_pop')
+    parser.add_argument('--years', type=int, default=50, help='number of years to simulate')
+    parser.add_argument('--seed', type=int, default=123456, help='seed of the simulation')
+    parser.add_argument('--profiler', choices=['sampling', 'cprofile'], default='sampling')
+    parser.add_argument('--interval', type=float, default=0.001,
+                        help='seconds between each sample of the sampling profiler')
+    parser.add_argument('--output', default='biosim_profile',
+                        help='base name of the files written')
+    args = parser.parse_args(argv)
+    from .simulation import BioSim
+
+    island_map = CHECK_SIM_MAP
+    if args.map:
+        with open(args.map) as f:
+            island_map = f.read().strip()
+    population = DEFAULT_POPULATION
+    if args.pop:
+        with open(args.pop) as f:
+            population = json.load(f)
+
+    sim = BioSim(island_map, population, args.seed, headless=True)
+    report = sim.profile(args.years, output=args.output, profiler=args.profiler,
+                         interval=args.interval)
+    print(format_report(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,59 @@ __author__ = 'August N Steinset and Sunniva E Daae Steiro'
 __email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
 
 from .island import Island
+from .arrays import ArrayIsland
+from .cohorts import CohortIsland
+from .meanfield import MeanFieldIsland
 from .graphics import Graphics
+from .frames import FrameRecorder, render_frame_log
+from .histograms import complete_specs
+from .pipeline import standard_year, eruption_year
+from .populations import CHUNK_SIZE, add_population_file, write_population
+from .viewer import FrameViewer
+from .profile import SamplingProfiler
+from time import perf_counter
+import cProfile
+import json
 import pickle
 import ast
+import os
+
+
+class VisualizationBudget:
+    """
+    Decides when to update the figure, so that drawing it takes at most a given share of the wall
+    time. The figure is updated when the time since the last update is long enough for the
+    last measured cost of drawing to be within the share.
+    """
+
+    def __init__(self, share):
+        """
+        :param share: The share of the wall time for drawing, between 0 and 1.
+        """
+        if not 0 < share < 1:
+            raise ValueError('The share of time for drawing must be between 0 and 1')
+        self.share = share
+        self.draw_seconds = None
+        self.last_drawn = perf_counter()
+
+    def due(self):
+        """Returns True if it is time to update the figure"""
+        if self.draw_seconds is None:
+            return True
+        since_drawn = perf_counter() - self.last_drawn
+        return since_drawn * self.share >= self.draw_seconds * (1 - self.share)
+
+    def drawn(self, seconds):
+        """
+        Tells the budget that the figure was updated.
+
+        :param seconds: Seconds spent updating the figure.
+        """
+        if self.draw_seconds is None:
+            self.draw_seconds = seconds
+        else:
+            self.draw_seconds = (self.draw_seconds + seconds) / 2
+        self.last_drawn = perf_counter()
 
 
 class BioSim:
@@ -15,7 +65,10 @@ class BioSim:
     """
 
     def __init__(self, island_map, ini_pop, seed, hist_specs=None, img_base=None,
-                 img_fmt=None, ymax_animals=None, cmax_animals=None):
+                 img_fmt=None, ymax_animals=None, cmax_animals=None, timing=False,
+                 timing_callback=None, headless=False, stream_movie=False, frame_log=None,
+                 viewer_process=False, backend='object', cohorts=False, hunt_threshold=None,
+                 precision='double'):
         """Creates a simulation
 
         :param island_map: A string containing the structure of the island.
@@ -27,18 +80,90 @@ class BioSim:
         :param img_fmt: Format of the saved images.
         :param ymax_animals: Fixes a y value for the animal count visualization.
         :param cmax_animals: Fixes the values of the color gradient of the visualization.
+        :param timing: If True, the time spent in every phase of every simulated year is measured.
+        :param timing_callback: A function called after every timed year with the year and a
+         dictionary of the time spent in each phase. Giving a callback turns on timing.
+        :param headless: If True, the simulation runs without any graphics.
+        :param stream_movie: If True, the images are piped straight into ffmpeg instead of being saved
+         one by one, and make_movie finishes the movie at <img_base>.output.mp4.
+        :param frame_log: Path of a frame log. If given, the simulation runs in record mode: instead
+         of drawing the figure, the statistics of every image are written to the frame log, and the
+         images are drawn afterwards by render, see biosim.frames.
+        :param viewer_process: If True, the figure is drawn by a separate process, which the
+         simulation sends a frame every vis_years without waiting for it, see biosim.viewer. The
+         viewer saves no images, but can be combined with a frame_log for that.
+        :param backend: 'object' to simulate the animals as objects with Island, or one of the
+         kernel backends 'auto', 'numba', 'numpy' and 'python' to simulate them as arrays with
+         ArrayIsland, see biosim.arrays and biosim.kernels, or 'mean_field' to follow the
+         expected number of animals without randomness, with MeanFieldIsland, see
+         biosim.meanfield.
+        :param cohorts: If True, animals with the same state on a tile are simulated together as a
+         cohort, with CohortIsland, see biosim.cohorts. The cohorts hunt with the kernels of
+         backend, or of 'auto' if backend is 'object'.
+        :param hunt_threshold: Number of herbivores on a tile above which the kills of the hunt are
+         drawn in aggregate, see biosim.arrays.hunt_aggregated. Only for the array and cohort
+         engines. Aggregation is slower than the exact hunt unless a tile holds thousands of
+         herbivores, so use a threshold of about 5000, or None for islands like check_sim.
+        :param precision: 'double' to store the ages, weights and fitness of the animals as 64 bit
+         floats, or 'single' for 16 bit ages and 32 bit weights and fitness, see
+         biosim.arrays.PRECISIONS. Only for the array and cohort engines.
         """
-        self.island = Island(island_map, seed, ini_pop)
-        self.maps = self.island.get_maps()
+        if viewer_process and frame_log is None and (img_base is not None or
+                                                      img_fmt is not None):
+            raise ValueError('The viewer process saves no images, give a frame_log to record them')
+        array_engine = backend != 'mean_field' and (cohorts or backend != 'object')
+        if hunt_threshold is not None and not array_engine:
+            raise ValueError('Aggregated hunting needs the array or cohort engine')
+        if precision != 'double' and not array_engine:
+            raise ValueError('Single precision needs the array or cohort engine')
+        if backend == 'mean_field':
+            self.island = MeanFieldIsland(island_map, seed, ini_pop)
+        elif cohorts:
+            self.island = CohortIsland(island_map, seed, ini_pop,
+                                       backend='auto' if backend == 'object' else backend,
+                                       hunt_threshold=hunt_threshold, precision=precision)
+        elif backend == 'object':
+            self.island = Island(island_map, seed, ini_pop)
+        else:
+            self.island = ArrayIsland(island_map, seed, ini_pop, backend=backend,
+                                      hunt_threshold=hunt_threshold, precision=precision)
+        self._hist_specs = complete_specs(hist_specs)
+        statistics = self.island.get_statistics(self._hist_specs)
         self._year = 0
-        self._num_animals_per_species = {'Herbivore': self.maps[5], 'Carnivore': self.maps[6]}
-        self._num_animals = self.maps[5] + self.maps[6]
-        self._animal_count_history = {0: [self.maps[5], self.maps[6]]}
-        self.graphics = Graphics(island_map, herb_map=self.maps[0], carn_map=self.maps[1], age_map=self.maps[2],
-                                 fitness_map=self.maps[3], weight_map=self.maps[4], hist_specs=hist_specs,
-                                 animal_count_history=self._animal_count_history,
-                                 img_base=img_base, img_fmt=img_fmt, cmax_animals=cmax_animals,
-                                 ymax_animals=ymax_animals)
+        self._num_animals_per_species = {'Herbivore': statistics['num_herb'],
+                                         'Carnivore': statistics['num_carn']}
+        self._num_animals = statistics['num_herb'] + statistics['num_carn']
+        self._animal_count_history = {0: [statistics['num_herb'], statistics['num_carn']]}
+        self._census = statistics.get('census', (statistics['num_herb'], statistics['num_carn']))
+        self._event_history = {}
+        self._event_maps = self.island.collect_events()
+        self.timing = timing or timing_callback is not None
+        self.timing_callback = timing_callback
+        self._phase_times = {}
+        self._vis_budget = None
+        self._img_base = img_base
+        self._img_fmt = img_fmt
+        self.recorder = None
+        if frame_log is not None:
+            self.recorder = FrameRecorder(frame_log, island_map, hist_specs=self._hist_specs,
+                                          cmax_animals=cmax_animals, ymax_animals=ymax_animals)
+            self.recorder.record(0, statistics)
+        self.viewer = None
+        if viewer_process and not headless:
+            self.viewer = FrameViewer(island_map, hist_specs=self._hist_specs,
+                                      cmax_animals=cmax_animals, ymax_animals=ymax_animals)
+            self.viewer.show(0, statistics)
+        if headless or frame_log is not None or viewer_process:
+            self.graphics = None
+        else:
+            self.graphics = Graphics(island_map, herb_map=statistics['herb_map'],
+                                     carn_map=statistics['carn_map'], age_map=None,
+                                     fitness_map=None, weight_map=None,
+                                     hist_specs=self._hist_specs,
+                                     animal_count_history=self._animal_count_history,
+                                     img_base=img_base, img_fmt=img_fmt, cmax_animals=cmax_animals,
+                                     ymax_animals=ymax_animals, stream_movie=stream_movie,
+                                     histograms=statistics)
 
     def save(self):
         """Saves the current simulation in three different files in the saves folder"""
@@ -58,6 +183,7 @@ class BioSim:
             self._animal_count_history = ast.literal_eval(f.read())
         with open('../saves/save_year.txt', 'r') as f:
             self._year = ast.literal_eval(f.read())
+        self._census = None
 
     def set_animal_parameters(self, species, p_dict):
         """
@@ -82,12 +208,98 @@ class BioSim:
         Adds a population of animals to a chosen tile on the island.
 
         :param population: list containing dictionaries of animals with location,
-         weight, age and species.
+         weight, age and species, or the path of a population file, see biosim.populations.
+        """
+        if isinstance(population, (str, os.PathLike)):
+            add_population_file(self.island, population)
+        else:
+            self.island.spawn_animal(population)
+        self._census = None
+
+    def save_population(self, path, chunk_size=CHUNK_SIZE):
+        """
+        Writes every animal on the island to a population file, see biosim.populations.
+
+        :param path: Path of the file, ending in .csv or .npz.
+        :param chunk_size: Number of animals written at a time.
+        :return: The number of animals written.
+        """
+        return write_population(path, self.island.animal_chunks(chunk_size))
+
+    def add_population_arrays(self, loc, species, ages, weights):
+        """
+        Adds animals of one species to a tile, given as arrays instead of dictionaries.
+
+        :param loc: The location of the tile, (row, column) counted from 1 as in ini_pop.
+        :param species: The name of the species.
+        :param ages: Sequence with the age of each animal.
+        :param weights: Sequence with the weight of each animal.
+        """
+        self.island.add_population_arrays(loc, species, ages, weights)
+        self._census = None
+
+    def add_population_tiles(self, species, rows, cols, ages, weights):
+        """
+        Adds animals of one species to any tiles, given as arrays with the tile of each animal.
+
+        :param species: The name of the species.
+        :param rows: Sequence with the row of each animal, counted from 1 as in ini_pop.
+        :param cols: Sequence with the column of each animal, counted from 1.
+        :param ages: Sequence with the age of each animal.
+        :param weights: Sequence with the weight of each animal.
+        """
+        self.island.add_population_tiles(species, rows, cols, ages, weights)
+        self._census = None
+
+    def add_population_counts(self, species, counts, age, weight):
+        """
+        Adds a number of equal animals of one species to every tile.
+
+        :param species: The name of the species.
+        :param counts: Array of the shape of the map with the number of animals on each tile.
+        :param age: The age of the animals.
+        :param weight: The weight of the animals.
+        """
+        self.island.add_population_counts(species, counts, age, weight)
+        self._census = None
+
+    def close(self):
+        """Closes the window of the viewer process and the frame log, if there are any"""
+        if self.viewer is not None:
+            self.viewer.close()
+        if self.recorder is not None and not self.recorder.closed:
+            self.recorder.close()
+
+    def render(self, img_base=None, img_fmt=None, processes=None):
+        """
+        Ends the recording of a simulation in record mode, and draws the recorded frames into
+        images in parallel.
+
+        :param img_base: The location of where the pictures should be stored, defaults to img_base
+         given to the simulation.
+        :param img_fmt: Format of the saved images, defaults to img_fmt given to the simulation, or
+         png.
+        :param processes: Number of processes drawing the images, None uses one per CPU.
+        :return: Number of images saved.
         """
-        self.island.spawn_animal(population)
+        if self.recorder is None:
+            raise RuntimeError('Only a simulation with a frame log can be rendered')
+        img_base = img_base or self._img_base
+        if img_base is None:
+            raise ValueError('No location given for the images')
+        if not self.recorder.closed:
+            self.recorder.close()
+        return render_frame_log(self.recorder.path, img_base, img_fmt or self._img_fmt or 'png',
+                                processes)
 
     def make_movie(self):
         """Create a MPEG4 movie from visualization images saved"""
+        if self.recorder is not None:
+            self.render()
+            Graphics.make_movie_from_images(self._img_base, self._img_fmt or 'png')
+            return
+        if self.graphics is None:
+            raise RuntimeError('A headless simulation has no images to make a movie from')
         self.graphics.make_movie()
 
     @property
@@ -105,56 +317,254 @@ class BioSim:
         """Number of animals per species in island"""
         return self._num_animals_per_species
 
-    def simulate(self, num_years, vis_years=1, img_years=None):
+    @property
+    def event_history(self):
+        """Dictionary with the simulated years as keys, containing the number of births, deaths,
+        kills, migrations attempted and completed, and the fodder eaten on the island that year"""
+        return self._event_history
+
+    @property
+    def event_maps(self):
+        """Dictionary with the same events as event_history as keys, containing arrays with the
+        number of events on each tile summed over all the simulated years"""
+        return self._event_maps
+
+    @property
+    def phase_times(self):
+        """Dictionary with the timed years as keys, containing the seconds spent in each phase"""
+        return self._phase_times
+
+    def timing_report(self, years=None):
+        """
+        Sums up the time spent in each phase over all the timed years.
+
+        :param years: The years to sum over, defaults to all the timed years.
+        :return: dictionary with the number of timed years, and the total seconds, mean seconds per
+         year and share of the total time for each phase.
+        """
+        if years is None:
+            years = list(self._phase_times)
+        total = {}
+        for year in years:
+            for phase, seconds in self._phase_times[year].items():
+                total[phase] = total.get(phase, 0) + seconds
+        years = len(years)
+        all_phases = sum(total.values())
+        return {'years': years,
+                'total': total,
+                'mean': {phase: seconds / years for phase, seconds in total.items()},
+                'share': {phase: seconds / all_phases if all_phases else 0
+                          for phase, seconds in total.items()}}
+
+    def profile(self, num_years, output=None, profiler='sampling', interval=0.001):
+        """Simulates a number of years without graphics under a profiler, with every phase timed
+
+        :param num_years: Number of years simulated.
+        :param output: Base name of the files written. The sampling profiler writes the sampled
+         stacks in collapsed stack format to <output>.collapsed, cProfile writes its statistics to
+         <output>.prof, and the timing report is written to <output>.phases.json. Nothing is
+         written if output is None.
+        :param profiler: Either 'sampling' or 'cprofile'.
+        :param interval: Seconds between each sample of the sampling profiler.
+        :return: The timing report of the profiled years, see timing_report.
+        """
+        if profiler not in ('sampling', 'cprofile'):
+            raise ValueError('Profiler must be sampling or cprofile')
+        graphics, recorder, viewer = self.graphics, self.recorder, self.viewer
+        timing, first_year = self.timing, self.year + 1
+        self.graphics = self.recorder = self.viewer = None
+        self.timing = True
+        try:
+            if profiler == 'sampling':
+                sampler = SamplingProfiler(interval)
+                sampler.start()
+                try:
+                    self.simulate(num_years)
+                finally:
+                    sampler.stop()
+            else:
+                sampler = cProfile.Profile()
+                sampler.runcall(self.simulate, num_years)
+        finally:
+            self.graphics, self.recorder, self.viewer = graphics, recorder, viewer
+            self.timing = timing
+        report = self.timing_report([year for year in range(first_year, self.year + 1)
+                                     if year in self._phase_times])
+        if output is not None:
+            if profiler == 'sampling':
+                sampler.write_collapsed(output + '.collapsed')
+            else:
+                sampler.dump_stats(output + '.prof')
+            with open(output + '.phases.json', 'w') as f:
+                json.dump(report, f, indent=2)
+        return report
+
+    def simulate(self, num_years, vis_years=1, img_years=None, vis_share=None, pipeline=None):
         """Simulates life on the island
 
         :param num_years: Number of years simulated.
         :param vis_years:  Number of years between each visualization update.
         :param img_years: number of years between each time an image is saved.
+        :param vis_share: If given, vis_years is ignored, and the figure is updated as often as
+         drawing it takes at most this share of the wall time, eg. 0.1. Images are then only saved,
+         exactly every img_years, if img_years is given.
+        :param pipeline: The phases of a year, see biosim.pipeline, defaults to standard_year().
+
+        Once the island is empty, the years until a phase may add animals again are fast-forwarded
+        without running the phases, see _fast_forward.
         """
-        if not img_years:
+        if self.recorder is not None and self.recorder.closed:
+            raise RuntimeError('The frame log was closed by render or close, so the simulation '
+                               'cannot go on in record mode')
+        if pipeline is None:
+            pipeline = standard_year()
+        budget = self._visualization_budget(vis_share)
+        if not img_years and budget is None:
             img_years = vis_years
-        for i in range(num_years):
-            self.island.all_eat()
-            self.island.all_breed()
-            self.island.all_migrate()
-            self.island.all_age()
-            self.island.all_lose_weight()
-            self.island.all_die()
-            self._year += 1
-            maps = self.island.get_maps()
-            self._num_animals_per_species['Herbivore'] = maps[5]
-            self._num_animals_per_species['Carnivore'] = maps[6]
-            self._num_animals = self.num_animals_per_species['Herbivore'] + self.num_animals_per_species['Carnivore']
-            self._animal_count_history[self.year] = [maps[5], maps[6]]
-            self.graphics.update_graphics(self.year, herb_map=maps[0], carn_map=maps[1], age_map=maps[2],
-                                          fitness_map=maps[3], weight_map=maps[4],
-                                          animal_count_history=self._animal_count_history, vis_years=vis_years,
-                                          img_years=img_years)
-
-    def simulate_eruption(self, num_years, vis_years=1, img_years=None):
+        compiled = pipeline.compile(self.island)
+        final_year = self.year + num_years
+        while self.year < final_year:
+            if self._census == (0, 0):
+                quiet_until = self._quiet_until(pipeline, final_year)
+                if quiet_until > self.year:
+                    self._fast_forward(quiet_until, vis_years, img_years, budget)
+                    continue
+            self._simulate_year(pipeline, compiled, vis_years, img_years, budget)
+
+    def _quiet_until(self, pipeline, final_year):
+        """
+        Finds the last year an empty island stays empty, which is the year before a phase that can
+        change an empty island runs, such as AddPopulation.
+
+        :param pipeline: The Pipeline of the years.
+        :param final_year: The last year simulated.
+        :return: The last year that can be fast-forwarded, at most final_year.
+        """
+        adding = [phase for phase in pipeline.phases if not phase.is_noop(0, 0)]
+        for year in range(self.year + 1, final_year + 1):
+            if any(phase.active(year) for phase in adding):
+                return year - 1
+        return final_year
+
+    def _fast_forward(self, last_year, vis_years, img_years, budget=None):
+        """Moves an empty island on to last_year without running the phases. Nothing happens
+        on an empty island, so the counts and events of the years are filled in at once, and only
+        the frames that are asked for are drawn, all from the same statistics. The viewer and the
+        recorder are still told the number of animals of every year.
+
+        :param last_year: The year to move on to.
+        :param vis_years:  Number of years between each visualization update.
+        :param img_years: number of years between each time an image is saved, or None.
+        :param budget: A VisualizationBudget deciding when to update the figure, or None.
+        """
+        years = range(self.year + 1, last_year + 1)
+        self._animal_count_history.update((year, [0, 0]) for year in years)
+        no_events = {name: counts.dtype.type(0).item() for name, counts in self._event_maps.items()}
+        self._event_history.update((year, dict(no_events)) for year in years)
+        statistics = None
+        for year in years:
+            self._year = year
+            save = bool(img_years) and year % img_years == 0
+            show = year % vis_years == 0 if budget is None else save or budget.due()
+            drawn = show and self.graphics is not None
+            if not (drawn or self.viewer is not None or self.recorder is not None):
+                continue
+            if statistics is None:
+                statistics = self.island.get_statistics(self._hist_specs)
+            self._report_year(statistics, show, save, budget)
+        self._year = last_year
+
+    def simulate_eruption(self, num_years, vis_years=1, img_years=None, vis_share=None):
         """Simulates life on the island without access to new food for the herbivores
 
         :param num_years: Number of years simulated.
         :param vis_years:  Number of years between each visualization update.
         :param img_years: number of years between each time an image is saved.
+        :param vis_share: Share of the wall time for drawing, see simulate.
         """
-        if not img_years:
-            img_years = vis_years
-        for i in range(num_years):
-            self.island.all_carnivores_eat()
-            self.island.all_breed()
-            self.island.all_migrate()
-            self.island.all_age()
-            self.island.all_lose_weight()
-            self.island.all_die()
-            self._year += 1
-            maps = self.island.get_maps()
-            self._num_animals_per_species['Herbivore'] = maps[5]
-            self._num_animals_per_species['Carnivore'] = maps[6]
-            self._num_animals = self.num_animals_per_species['Herbivore'] + self.num_animals_per_species['Carnivore']
-            self._animal_count_history[self.year] = [maps[5], maps[6]]
-            self.graphics.update_graphics(self.year, herb_map=maps[0], carn_map=maps[1], age_map=maps[2],
-                                          fitness_map=maps[3], weight_map=maps[4],
-                                          animal_count_history=self._animal_count_history, vis_years=vis_years,
-                                          img_years=img_years)
+        self.simulate(num_years, vis_years, img_years, vis_share, pipeline=eruption_year())
+
+    def _visualization_budget(self, vis_share):
+        """The VisualizationBudget for a share of the wall time, kept between calls to simulate
+        so that the cost of drawing is not measured again"""
+        if vis_share is None:
+            return None
+        if self._vis_budget is None or self._vis_budget.share != vis_share:
+            self._vis_budget = VisualizationBudget(vis_share)
+        return self._vis_budget
+
+    def _simulate_year(self, pipeline, compiled, vis_years, img_years, budget=None):
+        """Simulates one year by running the phases of the pipeline, then updates the statistics
+        and the graphics. Every step is timed when timing is turned on.
+
+        :param pipeline: The Pipeline of the year.
+        :param compiled: The phases of the pipeline bound to the island, see Pipeline.compile.
+        :param vis_years:  Number of years between each visualization update.
+        :param img_years: number of years between each time an image is saved, or None.
+        :param budget: A VisualizationBudget deciding when to update the figure instead of
+         vis_years, or None.
+        """
+        timing = self.timing
+        times = {}
+        pipeline.run(compiled, self.year + 1, self._census, times if timing else None)
+        self._year += 1
+        save = bool(img_years) and self.year % img_years == 0
+        if budget is None:
+            show = self.year % vis_years == 0
+        else:
+            show = save or budget.due()
+        drawn = show and (self.graphics is not None or self.viewer is not None)
+        recorded = save and self.recorder is not None
+        if timing:
+            start = perf_counter()
+        statistics = self.island.get_statistics(self._hist_specs, histograms=drawn or recorded)
+        events = self.island.collect_events()
+        if timing:
+            times['get_statistics'] = perf_counter() - start
+        self._event_history[self.year] = {name: counts.sum().item() for name, counts in events.items()}
+        for name, counts in events.items():
+            self._event_maps[name] += counts
+        num_herb, num_carn = statistics['num_herb'], statistics['num_carn']
+        self._num_animals_per_species['Herbivore'] = num_herb
+        self._num_animals_per_species['Carnivore'] = num_carn
+        self._num_animals = num_herb + num_carn
+        self._animal_count_history[self.year] = [num_herb, num_carn]
+        self._census = statistics.get('census', (num_herb, num_carn))
+        self._report_year(statistics, show, save, budget, times if timing else None)
+        if timing:
+            self._phase_times[self.year] = times
+            if self.timing_callback is not None:
+                self.timing_callback(self.year, times)
+
+    def _report_year(self, statistics, show, save, budget=None, times=None):
+        """Hands the statistics of the year to the graphics, the viewer and the recorder.
+
+        :param statistics: The statistics of the year, see Island.get_statistics.
+        :param show: If True, the figure is updated.
+        :param save: If True, an image is saved or a frame recorded.
+        :param budget: A VisualizationBudget to tell the time spent drawing, or None.
+        :param times: Dictionary to store the seconds spent drawing and recording in, or None.
+        """
+        timing = times is not None
+        if self.graphics is not None or self.viewer is not None:
+            start = perf_counter()
+            if self.viewer is not None:
+                self.viewer.show(self.year, statistics, frame=show)
+            elif show:
+                pixels = self.graphics.map_pixels
+                frame = dict(statistics, year=self.year,
+                             herb_map=self.island.density_map('Herbivore', pixels, mean=True)[0],
+                             carn_map=self.island.density_map('Carnivore', pixels, mean=True)[0])
+                self.graphics.show_frame(frame, *Graphics.count_arrays(self._animal_count_history),
+                                         save=save)
+            seconds = perf_counter() - start
+            if budget is not None and show:
+                budget.drawn(seconds)
+            if timing:
+                times['send_frame' if self.viewer is not None else 'update_graphics'] = seconds
+        if self.recorder is not None:
+            if timing:
+                start = perf_counter()
+            self.recorder.record(self.year, statistics, frame=save)
+            if timing:
+                times['record_frame'] = perf_counter() - start
@@ -4,6 +4,7 @@ __author__ = 'August N Steinset and Sunniva E Daae Steiro'
 __email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
 
 from .animals import Herbivore, Carnivore
+from math import exp
 import random
 
 
@@ -11,14 +12,48 @@ class Terrain:
     """
     Implements a terrain tile containing herbivores and carnivores,
     as well as info about amount of food on the tile.
+
+    The tile counts the births, natural deaths, predation kills, migrations attempted and
+    completed, and the fodder eaten on it in the ``events`` dictionary. The counters are updated
+    once per tile and phase, and reset by reset_events.
     """
+    event_names = ('births', 'deaths', 'kills', 'migrations_attempted', 'migrations_completed',
+                   'fodder_eaten')
+    rng = random
+    parameters = {'Herbivore': Herbivore.parameter, 'Carnivore': Carnivore.parameter}
+    tables = {'Herbivore': Herbivore.table, 'Carnivore': Carnivore.table}
+
+    def __init__(self, parameters=None, rng=None, tables=None):
+        """
+        Creates an empty tile
 
-    def __init__(self):
+        :param parameters: dictionary with species as key and the parameter dictionary the
+            animals on the tile should use as value, defaults to the class parameters of the animals
+        :param rng: the random number generator used on the tile, defaults to the random module
+        :param tables: dictionary with species as key and the compiled parameter table belonging
+            to parameters as value, defaults to the class tables of the animals
+        """
+        if parameters is not None:
+            self.parameters = parameters
+        if rng is not None:
+            self.rng = rng
+        if tables is not None:
+            self.tables = tables
         self.terrain_type = None
+        self.F_max = type(self).F_max
         self.herbivores_on_tile = []
         self.carnivores_on_tile = []
         self.animals_on_tile = [self.herbivores_on_tile, self.carnivores_on_tile]
         self.all_animals = self.herbivores_on_tile + self.carnivores_on_tile
+        self.events = dict.fromkeys(self.event_names, 0)
+
+    def reset_events(self):
+        """
+        Returns the event counters of the tile and starts counting from zero again.
+        """
+        events = self.events
+        self.events = dict.fromkeys(self.event_names, 0)
+        return events
 
     def spawn_animal(self, spawn):
         """
@@ -26,11 +61,27 @@ class Terrain:
 
         :param spawn: list of animals with tuple containing the keys: species, weight and age
         """
-        for i in spawn:
-            if i['species'] == 'Herbivore':
-                self.herbivores_on_tile.append(Herbivore(i['weight'], i['age']))
-            elif i['species'] == 'Carnivore':
-                self.carnivores_on_tile.append(Carnivore(i['weight'], i['age']))
+        for species in ('Herbivore', 'Carnivore'):
+            animals = [i for i in spawn if i['species'] == species]
+            if animals:
+                self.spawn_arrays(species, [i['age'] for i in animals],
+                                  [i['weight'] for i in animals])
+
+    def spawn_arrays(self, species, ages, weights):
+        """
+        Places a number of animals of one species on the current tile
+
+        :param species: 'Herbivore' or 'Carnivore'
+        :param ages: sequence with the age of each animal
+        :param weights: sequence with the weight of each animal
+        """
+        if species == 'Herbivore':
+            animal_type, animals = Herbivore, self.herbivores_on_tile
+        else:
+            animal_type, animals = Carnivore, self.carnivores_on_tile
+        parameter, table = self.parameters[species], self.tables[species]
+        animals.extend([animal_type(weight, age, parameter, self.rng, table)
+                        for age, weight in zip(ages, weights)])
 
     def eat_on_tile(self):
         """
@@ -43,19 +94,23 @@ class Terrain:
         """Makes all the present carnivore try to eat"""
         self.herbivores_on_tile.sort()
         self.carnivores_on_tile.sort(reverse=True)
+        n_herbs = len(self.herbivores_on_tile)
         for k in range(len(self.carnivores_on_tile)):
             eaten = (self.carnivores_on_tile[k].c_eat(self.herbivores_on_tile))
             for i in reversed(range(len(eaten))):
                 self.herbivores_on_tile.remove(self.herbivores_on_tile[i])
+        self.events['kills'] += n_herbs - len(self.herbivores_on_tile)
 
     def herb_eat_on_tile(self):
+        """Makes the herbivores eat from the fodder of the tile in random order"""
         total_food = self.F_max
-        random.shuffle(self.herbivores_on_tile)
+        self.rng.shuffle(self.herbivores_on_tile)
         for k in range(len(self.herbivores_on_tile)):
             total_food = self.herbivores_on_tile[k].eat(total_food)
             if total_food == 0:
                 break
             self.herbivores_on_tile[k].find_fitness()
+        self.events['fodder_eaten'] += self.F_max - total_food
 
     def migration_herb(self, legal_moves):
         """
@@ -70,15 +125,20 @@ class Terrain:
         right = []
         migrate_list = [up, down, right, left]
         remaining_herbivores = []
+        blocked = 0
         for k in range(len(self.herbivores_on_tile)):
             if self.herbivores_on_tile[k].check_migration():
-                index = random.randrange(len(legal_moves))
+                index = self.rng.randrange(len(legal_moves))
                 if legal_moves[index]:
                     migrate_list[index].append(self.herbivores_on_tile[k])
                 else:
                     remaining_herbivores.append(self.herbivores_on_tile[k])
+                    blocked += 1
             else:
                 remaining_herbivores.append(self.herbivores_on_tile[k])
+        moved = len(self.herbivores_on_tile) - len(remaining_herbivores)
+        self.events['migrations_attempted'] += moved + blocked
+        self.events['migrations_completed'] += moved
         self.herbivores_on_tile = remaining_herbivores
         return migrate_list
 
@@ -94,15 +154,20 @@ class Terrain:
         right = []
         migrate_list = [up, down, right, left]
         remaining_carnivores = []
+        blocked = 0
         for k in range(len(self.carnivores_on_tile)):
             if self.carnivores_on_tile[k].check_migration():
-                index = random.randrange(len(legal_moves))
+                index = self.rng.randrange(len(legal_moves))
                 if legal_moves[index]:
                     migrate_list[index].append(self.carnivores_on_tile[k])
                 else:
                     remaining_carnivores.append(self.carnivores_on_tile[k])
+                    blocked += 1
             else:
                 remaining_carnivores.append(self.carnivores_on_tile[k])
+        moved = len(self.carnivores_on_tile) - len(remaining_carnivores)
+        self.events['migrations_attempted'] += moved + blocked
+        self.events['migrations_completed'] += moved
         self.carnivores_on_tile = remaining_carnivores
         return migrate_list
 
@@ -111,23 +176,30 @@ class Terrain:
         Makes all animals on a tile breed, if number of animals is high enough,
         and adds the newborn to the list of its species on the tile.
         """
+        n_before = self.count_animals()
         n_herbs = self.count_herbivores()
         if n_herbs > 1:
             for k in range(n_herbs):
                 birth_weight = self.herbivores_on_tile[k].check_birth(n_herbs)
                 if not birth_weight <= 0:
-                    self.herbivores_on_tile.append(Herbivore(birth_weight))
+                    self.herbivores_on_tile.append(Herbivore(birth_weight, 0,
+                                                             self.parameters['Herbivore'],
+                                                             self.rng, self.tables['Herbivore']))
         n_carns = self.count_carnivores()
         if n_carns > 1:
             for k in range(n_carns):
                 birth_weight = self.carnivores_on_tile[k].check_birth(n_carns)
                 if birth_weight != 0:
-                    self.carnivores_on_tile.append(Carnivore(birth_weight))
+                    self.carnivores_on_tile.append(Carnivore(birth_weight, 0,
+                                                             self.parameters['Carnivore'],
+                                                             self.rng, self.tables['Carnivore']))
+        self.events['births'] += self.count_animals() - n_before
 
     def die_on_tile(self):
         """
         Removes all animals on the tile that are dying.
         """
+        n_before = self.count_animals()
         alive_herb = []
         alive_carn = []
         for k in reversed(range(len(self.herbivores_on_tile))):
@@ -140,6 +212,41 @@ class Terrain:
                 alive_carn.append(self.carnivores_on_tile[k])
         self.herbivores_on_tile = alive_herb
         self.carnivores_on_tile = alive_carn
+        self.events['deaths'] += n_before - self.count_animals()
+
+    def end_of_year_on_tile(self):
+        """
+        Makes the animals on the tile age, lose weight and then removes those that die, in one
+        pass over the animals. Gives the same result as age_on_tile, lose_weight_on_tile and
+        die_on_tile, drawing the same random numbers in the same order.
+        """
+        n_before = self.count_animals()
+        self.herbivores_on_tile = self._end_of_year(self.herbivores_on_tile)
+        self.carnivores_on_tile = self._end_of_year(self.carnivores_on_tile)
+        self.events['deaths'] += n_before - self.count_animals()
+
+    @staticmethod
+    def _end_of_year(animals):
+        """
+        Ages the animals of a species by one year, makes them lose weight, finds their fitness and
+        checks whether they die, as in die_on_tile from the last animal to the first.
+
+        :param animals: List of the animals of a species on the tile.
+        :return: List of the animals that survive, in reversed order.
+        """
+        alive = []
+        for animal in reversed(animals):
+            table = animal.table
+            animal.age += 1
+            animal.weight -= table['eta'] * animal.weight
+            if animal.weight <= 0.000001:
+                animal.fitness = 0
+                continue
+            animal.fitness = (1 / (1 + exp(table['phi_age'] * (animal.age - table['a_half'])))) *\
+                (1 / (1 + exp(table['minus_phi_weight'] * (animal.weight - table['w_half']))))
+            if not table['omega'] * (1 - animal.fitness) > animal.rng.random():
+                alive.append(animal)
+        return alive
 
     def age_on_tile(self):
         """
@@ -205,14 +312,13 @@ class Terrain:
             weight_list.append(i.weight)
         return [age_list, fitness_list, weight_list]
 
-    @classmethod
-    def set_params(cls, params):
+    def set_params(self, params):
         """
-        Changes the maximum value of fodder on a tile.
+        Changes the maximum value of fodder on the tile.
 
         :param params: dictionary containing terrain type as key, fodder amount as attribute
         """
-        cls.F_max = params['f_max']
+        self.F_max = params['f_max']
 
 
 class Lowland(Terrain):
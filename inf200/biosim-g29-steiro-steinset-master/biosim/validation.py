@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+Statistical comparison of simulation engines.
+
+A faster engine cannot give the same animals as Island for the same seed, but it should give
+the same distribution of populations. The harness runs every standard scenario for many seeds
+with a reference engine and a candidate engine, and compares the population of each species in
+the checked years with a two sample Kolmogorov-Smirnov test and a two sample z-test of the means.
+The significance level is Bonferroni corrected for the number of tests in a scenario.
+
+An engine is a class taking the arguments (island_text, seed, ini_pop) and providing the phase
+methods and get_maps of Island. Compare the object engine with itself by
+
+python -m biosim.validation --candidate biosim.island:Island
+"""
+
+from .island import Island
+from .maps import CHECK_SIM_MAP
+from concurrent.futures import ProcessPoolExecutor
+from scipy import stats
+import numpy as np
+import argparse
+import importlib
+import math
+
+SCENARIOS = {
+    'single_tile_herbivores': {
+        'map': 'WWW\nWLW\nWWW',
+        'ini_pop': [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                            for _ in range(50)]}],
+        'years': 30,
+        'check_years': [5, 10, 20, 30]},
+    'single_tile_both': {
+        'map': 'WWW\nWLW\nWWW',
+        'ini_pop': [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                            for _ in range(50)] +
+                                           [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                                            for _ in range(20)]}],
+        'years': 30,
+        'check_years': [5, 10, 20, 30]},
+    'check_sim': {
+        'map': CHECK_SIM_MAP,
+        'ini_pop': [{'loc': (5, 10), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                             for _ in range(150)]}],
+        'added': {10: [{'loc': (3, 2), 'pop': [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                                               for _ in range(40)]}]},
+        'parameters': {'Herbivore': {'zeta': 3.2, 'xi': 1.8},
+                       'Carnivore': {'a_half': 70, 'phi_age': 0.5, 'omega': 0.3, 'F': 65,
+                                     'DeltaPhiMax': 9.}},
+        'landscape': {'L': {'f_max': 700}},
+        'years': 30,
+        'check_years': [10, 20, 30]}}
+
+SPECIES = ('Herbivore', 'Carnivore')
+
+CANDIDATE_SEED_OFFSET = 1000000
+
+
+def run_scenario(engine, scenario, seed):
+    """
+    Simulates a scenario with an engine, and records the number of animals of each species.
+
+    :param engine: The engine class.
+    :param scenario: Dictionary describing the scenario, see SCENARIOS.
+    :param seed: Seed of the simulation.
+    :return: Array with one row per year, starting with year 0, and one column per species.
+    """
+    island = engine(scenario['map'], seed, scenario['ini_pop'])
+    for species, p_dict in scenario.get('parameters', {}).items():
+        island.change_parameter(species, p_dict)
+    for landscape, params in scenario.get('landscape', {}).items():
+        island.set_params(landscape, params)
+    counts = np.zeros((scenario['years'] + 1, len(SPECIES)), dtype=int)
+    counts[0] = island.get_maps()[5:7]
+    for year in range(1, scenario['years'] + 1):
+        if year - 1 in scenario.get('added', {}):
+            island.spawn_animal(scenario['added'][year - 1])
+        island.all_eat()
+        island.all_breed()
+        island.all_migrate()
+        island.all_age()
+        island.all_lose_weight()
+        island.all_die()
+        counts[year] = island.get_maps()[5:7]
+    return counts
+
+
+def _run_task(task):
+    """Unpacks a task for use with a process pool"""
+    return run_scenario(*task)
+
+
+def run_ensemble(engine, scenario, seeds, processes=None):
+    """
+    Simulates a scenario once for every seed.
+
+    :param engine: The engine class.
+    :param scenario: Dictionary describing the scenario.
+    :param seeds: The seeds to simulate.
+    :param processes: Number of processes to run the simulations in, 1 runs them in this
+     process, None uses one process per CPU.
+    :return: Array with the counts of every run, with shape (seeds, years + 1, species).
+    """
+    tasks = [(engine, scenario, seed) for seed in seeds]
+    if processes == 1:
+        return np.array([_run_task(task) for task in tasks])
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return np.array(list(executor.map(_run_task, tasks)))
+
+
+def z_test(sample1, sample2):
+    """
+    Two sample z-test of equal means.
+
+    :param sample1: First sample.
+    :param sample2: Second sample.
+    :return: The two sided p-value.
+    """
+    var = np.var(sample1, ddof=1) / len(sample1) + np.var(sample2, ddof=1) / len(sample2)
+    difference = np.mean(sample1) - np.mean(sample2)
+    if var == 0:
+        return 1.0 if difference == 0 else 0.0
+    return 2 * stats.norm.cdf(-abs(difference) / math.sqrt(var))
+
+
+def compare_counts(reference, candidate, check_years, alpha=0.01):
+    """
+    Compares the populations of two ensembles in the checked years.
+
+    :param reference: Counts from run_ensemble with the reference engine.
+    :param candidate: Counts from run_ensemble with the candidate engine.
+    :param check_years: The years to compare.
+    :param alpha: Significance level for the whole scenario.
+    :return: Dictionary with the outcome and the tests of the scenario.
+    """
+    tests = []
+    for year in check_years:
+        for k, species in enumerate(SPECIES):
+            ref, cand = reference[:, year, k], candidate[:, year, k]
+            tests.append({'species': species, 'year': year,
+                          'reference_mean': float(np.mean(ref)),
+                          'candidate_mean': float(np.mean(cand)),
+                          'ks_p': float(stats.ks_2samp(ref, cand).pvalue),
+                          'z_p': float(z_test(ref, cand))})
+    level = alpha / (2 * len(tests))
+    for test in tests:
+        test['passed'] = test['ks_p'] > level and test['z_p'] > level
+    return {'passed': all(test['passed'] for test in tests), 'level': level, 'tests': tests}
+
+
+def validate(candidate, reference=Island, scenarios=None, num_seeds=50, alpha=0.01,
+             processes=None):
+    """
+    Compares a candidate engine with a reference engine on the standard scenarios.
+
+    The two engines are run with different seeds, so that an engine compared with itself gives
+    independent samples.
+
+    :param candidate: The candidate engine class.
+    :param reference: The reference engine class, defaults to Island.
+    :param scenarios: Dictionary of scenarios, defaults to SCENARIOS.
+    :param num_seeds: Number of seeds per engine and scenario.
+    :param alpha: Significance level for each scenario.
+    :param processes: Number of processes, see run_ensemble.
+    :return: Dictionary with the overall outcome, and the outcome of each scenario.
+    """
+    if scenarios is None:
+        scenarios = SCENARIOS
+    report = {'passed': True, 'scenarios': {}}
+    for name, scenario in scenarios.items():
+        ref = run_ensemble(reference, scenario, range(num_seeds), processes)
+        cand = run_ensemble(candidate, scenario,
+                            range(CANDIDATE_SEED_OFFSET, CANDIDATE_SEED_OFFSET + num_seeds),
+                            processes)
+        result = compare_counts(ref, cand, scenario['check_years'], alpha)
+        report['scenarios'][name] = result
+        report['passed'] = report['passed'] and result['passed']
+    return report
+
+
+def format_validation_report(report):
+    """
+    Makes a readable table of a report from validate.
+
+    :param report: The report.
+    :return: The table as a string.
+    """
+    lines = []
+    for name, result in report['scenarios'].items():
+        lines.append('{}: {}'.format(name, 'PASS' if result['passed'] else 'FAIL'))
+        for test in result['tests']:
+            lines.append('  {:<10} year {:>4}  mean {:>9.2f} vs {:>9.2f}  KS p={:.3g}  z p={:.3g}'
+                         '{}'.format(test['species'], test['year'], test['reference_mean'],
+                                     test['candidate_mean'], test['ks_p'], test['z_p'],
+                                     '' if test['passed'] else '  <--'))
+    lines.append('PASS' if report['passed'] else 'FAIL')
+    return '\n'.join(lines)
+
+
+def load_engine(name):
+    """
+    Imports an engine class given on the form 'module:Class'.
+
+    :param name: The module and class name.
+    :return: The class.
+    """
+    module, _, cls = name.partition(':')
+    return getattr(importlib.import_module(module), cls)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m biosim.validation',
+                                     description='Compare a simulation engine with Island.')
+    parser.add_argument('--candidate', required=True, help='engine on the form module:Class')
+    parser.add_argument('--reference', default='biosim.island:Island')
+    parser.add_argument('--scenarios', nargs='*', choices=sorted(SCENARIOS))
+    parser.add_argument('--seeds', type=int, default=50, help='number of seeds per engine')
+    parser.add_argument('--alpha', type=float, default=0.01)
+    parser.add_argument('--processes', type=int)
+    args = parser.parse_args(argv)
+
+    scenarios = SCENARIOS
+    if args.scenarios:
+        scenarios = {name: SCENARIOS[name] for name in args.scenarios}
+    report = validate(load_engine(args.candidate), load_engine(args.reference), scenarios,
+                      args.seeds, args.alpha, args.processes)
+    print(format_validation_report(report))
+    return report
+
+
+if __name__ == '__main__':
+    if not main()['passed']:
+        raise SystemExit(1)
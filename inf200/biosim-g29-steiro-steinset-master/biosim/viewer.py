@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+"""
+Live view of a simulation in a separate process.
+
+The figure is drawn by a viewer process, which gets frames, see biosim.frames, through a bounded
+queue. The simulation never waits for the figure: when the queue is full because the viewer has
+fallen behind, the new frame is dropped, and when the viewer finds several frames waiting it only
+draws the newest one. The number of animals of the dropped years is still sent with the next frame
+that gets through, so the population lines have no gaps.
+"""
+
+from .frames import make_frame, make_graphics
+import matplotlib.pyplot as plt
+import multiprocessing
+import queue
+import numpy as np
+
+
+def view_frames(frames, header, poll_interval=0.02):
+    """
+    Draws the newest frame in the queue until it gets None, or the window is closed. Runs in the
+    viewer process.
+
+    :param frames: The queue of frames.
+    :param header: Dictionary with the island map, histogram specs, cmax_animals and ymax_animals.
+    :param poll_interval: Seconds to run the event loop of the window between looks at the queue.
+    """
+    graphics = make_graphics(header)
+    history = []
+    while plt.fignum_exists(graphics.fig.number):
+        latest = None
+        try:
+            while True:
+                frame = frames.get_nowait()
+                if frame is None:
+                    plt.close(graphics.fig)
+                    return
+                history.append(frame.pop('history'))
+                latest = frame
+        except queue.Empty:
+            pass
+        if latest is not None:
+            rows = np.concatenate(history)
+            graphics.draw_frame(latest, rows[:, 0], rows[:, 1:])
+        plt.pause(poll_interval)
+
+
+class FrameViewer:
+    """
+    Sends frames of a simulation to a viewer process.
+    """
+
+    def __init__(self, island_map, hist_specs=None, cmax_animals=None, ymax_animals=None,
+                 queue_size=2, start=True):
+        """
+        :param island_map: A string containing the structure of the island.
+        :param hist_specs: Dictionary with the dimensions of the histograms.
+        :param cmax_animals: Dictionary with the max values of the density maps of each species.
+        :param ymax_animals: Fixes a y value for the animal count visualization.
+        :param queue_size: Number of frames that can wait for the viewer.
+        :param start: If True, the viewer process is started at once, else by calling start.
+        """
+        self.header = {'island_map': island_map, 'hist_specs': hist_specs,
+                       'cmax_animals': cmax_animals, 'ymax_animals': ymax_animals}
+        context = multiprocessing.get_context('spawn')
+        self._frames = context.Queue(queue_size)
+        self._history = []
+        self.process = context.Process(target=view_frames, args=(self._frames, self.header),
+                                       daemon=True)
+        self.sent = 0
+        self.dropped = 0
+        if start:
+            self.start()
+
+    def start(self):
+        """Starts the viewer process"""
+        self.process.start()
+
+    def show(self, year, statistics, frame=True):
+        """
+        Sends the frame of a year to the viewer, unless the viewer is behind, in which case the
+        frame is dropped.
+
+        :param year: The year.
+        :param statistics: The dictionary returned by Island.get_statistics, with histograms if
+         frame is True.
+        :param frame: If False, only the number of animals is kept, to be sent with the next frame.
+        :return: True if the frame was sent.
+        """
+        self._history.append((year, statistics['num_herb'], statistics['num_carn']))
+        if not frame:
+            return False
+        if self._frames.full():
+            self.dropped += 1
+            return False
+        record = make_frame(year, statistics)
+        record['history'] = np.array(self._history, dtype=np.int64)
+        try:
+            self._frames.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self._history = []
+        self.sent += 1
+        return True
+
+    def close(self, timeout=10):
+        """
+        Tells the viewer to close the window, and waits for the viewer process to end.
+
+        :param timeout: Seconds to wait before the viewer process is terminated.
+        """
+        if self.process.is_alive():
+            try:
+                self._frames.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+        # Frames nobody will read must not keep this process from exiting
+        self._frames.cancel_join_thread()
+        self._frames.close()
@@ -64,7 +64,7 @@ setup(
       long_description=read_readme(),
       author='Sunniva Steiro and August Steinset, NMBU',
       author_email='sunnivas@nmbu.no and augustei@nmbu.no',
-      requires=['matplotlib'],
+      requires=['matplotlib', 'numpy'],
       scripts=['examples/run_sim.py'],
       keywords='simulation',
       license='MIT License',
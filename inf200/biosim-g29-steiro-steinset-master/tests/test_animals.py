@@ -3,7 +3,7 @@
 __author__ = 'August N Steinset and Sunniva E Daae Steiro'
 __email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
 
-from biosim.animals import Herbivore, Carnivore
+from biosim.animals import Herbivore, Carnivore, compile_parameters
 import pytest
 import scipy.stats as stats
 import random
@@ -65,6 +65,15 @@ def test_set_animal_parameters(set_animal_parameters):
     assert h.parameter['omega'] == 10 and c.parameter['mu'] == 10
 
 
+@pytest.mark.parametrize('set_animal_parameters', [{'zeta': 2, 'beta': 0.5}], indirect=True)
+def test_parameter_table_rebuilt(set_animal_parameters):
+    """Tests that the derived constants of the parameter table follow the changed parameters"""
+    h = Herbivore(5)
+    assert h.table['birth_weight_limit'] == 2 * (h.parameter['w_birth'] +
+                                                 h.parameter['sigma_birth'])
+    assert h.table['beta_F'] == 0.5 * h.parameter['F']
+
+
 def test_misspelled_parameter():
     c = Carnivore(5)
     with pytest.raises(ValueError):
@@ -89,6 +98,18 @@ def test_illegal_deltaphimax():
         c.set_animal_parameters({'DeltaPhiMax': 0})
 
 
+def test_parameters_need_table():
+    """Tests that parameters given without their table are refused before they are changed, and
+    that the table given is rebuilt"""
+    parameter = dict(Herbivore.parameter)
+    with pytest.raises(ValueError):
+        Herbivore.set_animal_parameters({'F': 3}, parameter)
+    assert parameter['F'] == Herbivore.parameter['F']
+    table = compile_parameters(parameter)
+    Herbivore.set_animal_parameters({'F': 3}, parameter, table)
+    assert table['F'] == 3 and table['beta_F'] == 3 * parameter['beta']
+
+
 def test_eq():
     """
     Tests the overriding __eq__ function in animals.py 
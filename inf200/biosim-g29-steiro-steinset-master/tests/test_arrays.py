@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim.arrays import ArrayIsland, hunt_aggregated
+from biosim import arrays
+from biosim.kernels import NUMPY_KERNELS, species_constants
+from biosim.animals import Carnivore
+from biosim.island import Island
+from biosim.meanfield import MeanFieldIsland
+from biosim.simulation import BioSim
+from biosim import validation
+import numpy as np
+import textwrap
+import pickle
+import pytest
+
+"""
+Tests the island engine keeping the animals in arrays.
+"""
+
+geogr = textwrap.dedent("""\
+                        WWWWW
+                        WLLLW
+                        WLLLW
+                        WLLHW
+                        WWWWW""")
+
+SEED = 124
+
+ini_pop = [{'loc': (3, 3),
+            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(40)] +
+                   [{'species': 'Carnivore', 'age': 5, 'weight': 20} for _ in range(10)]}]
+
+
+def simulate(island, years):
+    """Simulates the standard year on an engine, and returns its statistics"""
+    for _ in range(years):
+        island.all_eat()
+        island.all_breed()
+        island.all_migrate()
+        island.all_end_of_year()
+    return island.get_statistics()
+
+
+def test_spawn_animal():
+    """Tests that the animals are placed on their tile"""
+    island = ArrayIsland(geogr, SEED, ini_pop, backend='numpy')
+    statistics = island.get_statistics(histograms=False)
+    assert statistics['herb_map'][2, 2] == 40 and statistics['carn_map'][2, 2] == 10
+    assert statistics['num_herb'] == 40 and statistics['num_carn'] == 10
+    with pytest.raises(ValueError):
+        island.spawn_animal([{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': -1,
+                                                       'weight': 10}]}])
+
+
+def test_add_population_counts():
+    """Tests that the array engines place the same animals as Island from arrays and counts"""
+    counts = np.zeros((5, 5), dtype=int)
+    counts[1, 2], counts[3, 3] = 3, 5
+    for island in (Island(geogr, SEED), ArrayIsland(geogr, SEED), MeanFieldIsland(geogr, SEED)):
+        island.add_population_counts('Carnivore', counts, 2, 30)
+        island.add_population_arrays((2, 3), 'Herbivore', [1, 4], [10, 12])
+        maps = island.get_maps()
+        assert (np.array(maps[1]) == counts).all() and maps[0][1][2] == 2
+        assert sorted(maps[2][0]) == [1, 4] and sorted(maps[4][1]) == [30] * 8
+
+
+def test_add_population_tiles(monkeypatch):
+    """Tests that the animals of many tiles are placed with one append per species, as when they
+    are placed tile by tile"""
+    appends = []
+    append = arrays.Population.append
+    monkeypatch.setattr(arrays.Population, 'append', lambda population, *args: appends.append(
+        len(args[0])) or append(population, *args))
+    spread = [{'loc': (row, col), 'pop': ini_pop[0]['pop']} for row in (2, 3, 4)
+              for col in (2, 3, 4)]
+    island = ArrayIsland(geogr, SEED, spread)
+    assert appends == [360, 90]
+    for engine in (Island, MeanFieldIsland):
+        statistics = engine(geogr, SEED, spread).get_statistics()
+        for name in ('herb_map', 'carn_map', 'age', 'weight'):
+            assert (statistics[name] == island.get_statistics()[name]).all()
+
+
+def test_invalid_map():
+    """Tests that the map is checked as in Island"""
+    with pytest.raises(ValueError):
+        ArrayIsland('WWW\nWLL\nWWW', SEED)
+
+
+def test_backends_agree():
+    """Tests that the NumPy kernels and the loops give the same animals for the same seed"""
+    maps = [simulate(ArrayIsland(geogr, SEED, ini_pop, backend=backend), 10)
+            for backend in ('numpy', 'python')]
+    assert (maps[0]['herb_map'] == maps[1]['herb_map']).all()
+    assert (maps[0]['carn_map'] == maps[1]['carn_map']).all()
+    assert (maps[0]['weight'] == maps[1]['weight']).all()
+
+
+def test_events_add_up():
+    """Tests that the change of the population equals the births minus the deaths and kills"""
+    island = ArrayIsland(geogr, SEED, ini_pop, backend='numpy')
+    before = island.get_statistics(histograms=False)
+    after = simulate(island, 1)
+    events = island.collect_events()
+    change = after['num_herb'] + after['num_carn'] - before['num_herb'] - before['num_carn']
+    assert change == events['births'].sum() - events['deaths'].sum() - events['kills'].sum()
+    assert events['fodder_eaten'].shape == (5, 5)
+    assert events['migrations_completed'].sum() <= events['migrations_attempted'].sum()
+
+
+def test_fodder_parameters():
+    """Tests that herbivores on tiles without fodder gain no weight"""
+    island = ArrayIsland(geogr, SEED, ini_pop, backend='numpy')
+    island.set_params('L', {'f_max': 0})
+    weights = island.populations['Herbivore'].weights.copy()
+    island.all_herbivores_eat()
+    assert (island.populations['Herbivore'].weights == weights).all()
+    with pytest.raises(ValueError):
+        island.set_params('W', {'f_max': 10})
+
+
+def test_same_distribution_as_island():
+    """Tests that the array engine passes the comparison with Island"""
+    scenarios = {'single_tile_both': dict(validation.SCENARIOS['single_tile_both'], years=10,
+                                          check_years=[5, 10])}
+    report = validation.validate(ArrayIsland, scenarios=scenarios, num_seeds=20, processes=1)
+    assert report['passed']
+
+
+def test_hunt_exact_in_blocks(monkeypatch):
+    """Tests that the exact hunt draws no more than HUNT_DRAWS random numbers at a time, and that
+    the blocks hunt as one draw for all the carnivores would when every attempt succeeds"""
+    results = []
+    for hunt_draws in (arrays.HUNT_DRAWS, 30):
+        monkeypatch.setattr(arrays, 'HUNT_DRAWS', hunt_draws)
+        island = ArrayIsland(geogr, SEED, backend='numpy')
+        island.change_parameter('Carnivore', {'DeltaPhiMax': 0.5})
+        sizes = []
+        uniform = island._uniform
+        monkeypatch.setattr(island, '_uniform', lambda size: sizes.append(np.prod(size)) or
+                            uniform(size))
+        herb_fitness = np.linspace(0, 0.05, 50)
+        carn_weights = np.full(20, 20.)
+        carn_fitness = np.full(20, 0.95)
+        removed = island._hunt_exact(island.kernels['hunt'], herb_fitness, np.full(50, 10.),
+                                     np.full(20, 5.), carn_weights, carn_fitness,
+                                     island.tables['Carnivore'])
+        assert max(sizes) <= max(hunt_draws, 50)
+        results.append((removed, carn_weights))
+    assert len(sizes) > 1
+    assert results[0][0] == results[1][0] == 50
+    assert (results[0][1] == results[1][1]).all()
+
+
+class AggregatedIsland(ArrayIsland):
+    """The array engine drawing the kills of every hunt in aggregate"""
+
+    hunt_threshold = 0
+
+
+def test_hunt_aggregated():
+    """Tests that the aggregated hunt kills about as many herbivores as the exact kernel, and
+    that a carnivore kills no herbivore fitter than itself"""
+    rng = np.random.default_rng(7)
+    constants = species_constants(Carnivore.table)
+    herb_fitness = np.sort(rng.random(2000))
+    herb_weights = rng.uniform(5, 40, 2000)
+    removed = {'exact': [], 'aggregated': []}
+    for _ in range(30):
+        carn_fitness = -np.sort(-rng.random(40))
+        carn_weights = np.full(40, 20.)
+        args = (herb_fitness, herb_weights, np.full(40, 5.))
+        removed['exact'].append(NUMPY_KERNELS['hunt'](
+            *args, carn_weights.copy(), carn_fitness.copy(), rng.random((40, 2000)), 50., 0.75,
+            0.1, 10., constants))
+        removed['aggregated'].append(hunt_aggregated(
+            *args, carn_weights.copy(), carn_fitness.copy(), rng, 50., 0.75, 10., constants))
+    assert np.mean(removed['aggregated']) == pytest.approx(np.mean(removed['exact']), rel=0.1)
+    assert hunt_aggregated(herb_fitness, herb_weights, np.array([5.]), np.array([20.]),
+                           np.array([0.]), rng, 50., 0.75, 10., constants) == 0
+
+
+def test_aggregated_hunt_same_distribution():
+    """Tests that drawing the kills in aggregate on a crowded tile gives the same distribution of
+    populations as the exact hunt"""
+    scenarios = {'crowded_tile': {
+        'map': 'WWW\nWLW\nWWW',
+        'ini_pop': [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                            for _ in range(1000)] +
+                                           [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                                            for _ in range(50)]}],
+        'years': 6,
+        'check_years': [2, 4, 6]}}
+    report = validation.validate(AggregatedIsland, ArrayIsland, scenarios=scenarios,
+                                 num_seeds=20, processes=1)
+    assert report['passed']
+
+
+class SingleIsland(ArrayIsland):
+    """The array engine storing the animals in single precision"""
+
+    def __init__(self, island_text, seed, ini_pop=None):
+        super().__init__(island_text, seed, ini_pop, precision='single')
+
+
+def test_single_precision():
+    """Tests that single precision stores the animals in the compact types, and gives the same
+    distribution of populations as double precision"""
+    island = SingleIsland(geogr, SEED, ini_pop)
+    simulate(island, 3)
+    herbivores = island.populations['Herbivore']
+    assert (herbivores.ages.dtype, herbivores.weights.dtype, herbivores.fitness.dtype) == \
+        (np.uint16, np.float32, np.float32)
+    scenarios = {name: dict(validation.SCENARIOS[name], years=10, check_years=[5, 10])
+                 for name in ('single_tile_both', 'check_sim')}
+    report = validation.validate(SingleIsland, ArrayIsland, scenarios=scenarios, num_seeds=20,
+                                 processes=1)
+    assert report['passed']
+    with pytest.raises(ValueError):
+        ArrayIsland(geogr, SEED, precision='half')
+    for ages in ([70000], [-1], [2.5]):
+        with pytest.raises(ValueError):
+            arrays.Population('single').append([0], ages, [10.])
+
+
+def test_biosim_backend(tmpdir):
+    """Tests that BioSim runs on the array engine, and that it can be saved and loaded"""
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=SEED, headless=True, backend='numpy')
+    sim.simulate(5)
+    assert isinstance(sim.island, ArrayIsland)
+    assert sim.num_animals == sum(sim.num_animals_per_species.values()) > 0
+    sim.simulate_eruption(2)
+    island = pickle.loads(pickle.dumps(sim.island))
+    assert island.get_statistics()['num_herb'] == sim.num_animals_per_species['Herbivore']
+    assert isinstance(BioSim(island_map=geogr, ini_pop=[], seed=SEED, headless=True).island,
+                      Island)
+
+
+@pytest.mark.parametrize('cohorts', [False, True])
+def test_biosim_hunt_threshold(cohorts):
+    """Tests that BioSim passes hunt_threshold to the array and cohort engines, and that the
+    object engine refuses it and single precision"""
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=SEED, headless=True, backend='numpy',
+                 cohorts=cohorts, hunt_threshold=5)
+    assert sim.island.hunt_threshold == 5
+    assert ArrayIsland.hunt_threshold is None
+    sim.simulate(3)
+    assert sim.num_animals == sum(sim.num_animals_per_species.values()) > 0
+    with pytest.raises(ValueError):
+        BioSim(island_map=geogr, ini_pop=[], seed=SEED, headless=True, hunt_threshold=5)
+    with pytest.raises(ValueError):
+        BioSim(island_map=geogr, ini_pop=[], seed=SEED, headless=True, precision='single')
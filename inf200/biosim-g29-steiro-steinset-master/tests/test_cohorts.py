@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim.cohorts import CohortIsland, Cohorts, feeding_groups
+from biosim.simulation import BioSim
+from biosim import validation
+import numpy as np
+import textwrap
+
+"""
+Tests the island engine keeping equal animals together as cohorts.
+"""
+
+geogr = textwrap.dedent("""\
+                        WWWWW
+                        WLLLW
+                        WLLLW
+                        WLLHW
+                        WWWWW""")
+
+SEED = 124
+
+ini_pop = [{'loc': (3, 3),
+            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(150)] +
+                   [{'species': 'Carnivore', 'age': 5, 'weight': 20} for _ in range(20)]}]
+
+
+def test_feeding_groups():
+    """Tests the number of herbivores getting a full meal, the last full meal and the last bit of
+    fodder"""
+    assert feeding_groups(100, 800, 10) == (79, 1, 0)
+    assert feeding_groups(100, 805, 10) == (80, 0, 5)
+    assert feeding_groups(50, 800, 10) == (50, 0, 0)
+    assert feeding_groups(50, 0, 10) == (0, 0, 0)
+
+
+def test_merge():
+    """Tests that cohorts with the same tile and state are joined, and empty ones removed"""
+    cohorts = Cohorts()
+    cohorts.append([3, 3, 4, 3], [5, 5, 5, 6], [20, 20, 20, 20], [2, 3, 1, 0])
+    cohorts.merge()
+    assert list(cohorts.tiles) == [3, 4] and list(cohorts.sizes) == [5, 1]
+    assert list(cohorts.animal_values('ages')) == [5] * 6
+
+
+def test_equal_animals_one_cohort():
+    """Tests that equal animals are placed as one cohort of each species"""
+    island = CohortIsland(geogr, SEED, ini_pop)
+    assert [len(population) for population in island.populations.values()] == [1, 1]
+    assert island.get_statistics()['num_herb'] == 150
+
+
+def test_add_population_counts():
+    """Tests that the animals of a map of counts become one cohort per tile"""
+    island = CohortIsland(geogr, SEED)
+    counts = np.zeros((5, 5), dtype=int)
+    counts[1, 1], counts[3, 3] = 400, 700
+    island.add_population_counts('Herbivore', counts, 3, 25)
+    assert list(island.populations['Herbivore'].sizes) == [400, 700]
+    island.add_population_arrays((2, 2), 'Herbivore', [3, 3], [25, 25])
+    assert list(island.populations['Herbivore'].sizes) == [402, 700]
+    assert (island.get_statistics()['herb_map'][1, 1]) == 402
+
+
+def test_herbivores_eat():
+    """Tests that the fodder of a tile is shared out between the cohorts, without losing any
+    animals"""
+    island = CohortIsland(geogr, SEED, ini_pop)
+    island.spawn_animal([{'loc': (3, 3), 'pop': [{'species': 'Herbivore', 'age': 7,
+                                                   'weight': 10}] * 50}])
+    island.all_herbivores_eat()
+    herbivores = island.populations['Herbivore']
+    assert herbivores.num_animals == 200
+    assert island.events['fodder_eaten'].sum() == 800
+    gained = np.sum((herbivores.weights - np.where(herbivores.ages == 5, 20, 10)) *
+                    herbivores.sizes)
+    assert gained == 0.9 * 800
+
+
+def test_events_add_up():
+    """Tests that the change of the population equals the births minus the deaths and kills"""
+    island = CohortIsland(geogr, SEED, ini_pop)
+    for _ in range(5):
+        island.all_eat()
+        island.all_breed()
+        island.all_migrate()
+        island.all_end_of_year()
+    events = island.collect_events()
+    statistics = island.get_statistics()
+    assert statistics['num_herb'] + statistics['num_carn'] - 170 == \
+        events['births'].sum() - events['deaths'].sum() - events['kills'].sum()
+    assert statistics['age'].sum() == statistics['num_herb'] + statistics['num_carn']
+
+
+def test_same_distribution_as_island():
+    """Tests that the cohort engine passes the comparison with Island"""
+    scenarios = {'single_tile_both': dict(validation.SCENARIOS['single_tile_both'], years=10,
+                                          check_years=[5, 10])}
+    report = validation.validate(CohortIsland, scenarios=scenarios, num_seeds=20, processes=1)
+    assert report['passed']
+
+
+def test_biosim_cohorts():
+    """Tests that BioSim runs with cohorts"""
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=SEED, headless=True, cohorts=True)
+    sim.simulate(5)
+    assert isinstance(sim.island, CohortIsland)
+    assert sim.num_animals > 0
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim.density import DensityPyramid
+import numpy as np
+
+"""
+Tests the density pyramid.
+"""
+
+
+def test_levels_match_block_sums():
+    """Tests that incremental updates give the same levels as summing the blocks again"""
+    rng = np.random.default_rng(5)
+    pyramid = DensityPyramid((7, 10))
+    for _ in range(5):
+        density = rng.integers(0, 20, size=(7, 10))
+        density[rng.random((7, 10)) < 0.5] = 0
+        pyramid.update(density)
+        expected = density
+        for level in pyramid.levels:
+            assert np.array_equal(level, expected)
+            expected = DensityPyramid.block_sum(expected)
+    assert pyramid.levels[-1].shape == (1, 1)
+
+
+def test_update_counts_changed_tiles():
+    """Tests that only the tiles that changed are counted"""
+    pyramid = DensityPyramid((4, 4))
+    density = np.zeros((4, 4), dtype=int)
+    density[1, 2] = 3
+    assert pyramid.update(density) == 1
+    assert pyramid.update(density) == 0
+
+
+def test_query():
+    """Tests that a query gives the finest level that fits, of the whole island or a region"""
+    pyramid = DensityPyramid((8, 8))
+    pyramid.update(np.arange(64).reshape(8, 8))
+    grid, level = pyramid.query(max_size=4)
+    assert level == 1 and grid.shape == (4, 4)
+    assert grid[0, 0] == 0 + 1 + 8 + 9
+    grid, level = pyramid.query(max_size=4, region=(0, 4, 4, 8))
+    assert level == 0 and grid[0, 0] == 4
+    grid, level = pyramid.query(max_size=2, mean=True)
+    assert level == 2 and grid[0, 0] == np.arange(64).reshape(8, 8)[:4, :4].mean()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim.frames import make_frame, read_frame_log, render_frame_log
+from biosim.simulation import BioSim
+from biosim.island import Island
+import numpy as np
+import textwrap
+import pytest
+
+"""
+Tests the recording of frame logs and the rendering of them afterwards.
+"""
+
+geogr = textwrap.dedent("""\
+                        WWWWW
+                        WLLLW
+                        WLLHW
+                        WWWWW""")
+
+ini_pop = [{'loc': (2, 2),
+            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(20)] +
+                   [{'species': 'Carnivore', 'age': 5, 'weight': 20} for _ in range(5)]}]
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    """Return a simulation in record mode that has simulated 6 years, with an image every 2"""
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=124, img_base=str(tmp_path / 'sim'),
+                 frame_log=str(tmp_path / 'sim.frames'))
+    sim.simulate(6, vis_years=1, img_years=2)
+    sim.recorder.close()
+    return sim
+
+
+def test_make_frame():
+    """Tests that a frame holds the density maps and the histogram counts in compact arrays"""
+    island = Island(geogr, 124, ini_pop)
+    statistics = island.get_statistics()
+    frame = make_frame(4, statistics)
+    assert frame['year'] == 4
+    assert frame['herb_map'].tolist() == statistics['herb_map'].tolist()
+    assert frame['herb_map'].dtype == np.uint8
+    assert frame['age'].shape == (2, 30)
+    assert frame['age'][0].sum() == 20 and frame['fitness'][1].sum() == 5
+
+
+def test_record_mode(recorded):
+    """Tests that the log holds a frame for every image and the counts of every year"""
+    header, frames, years, counts = read_frame_log(recorded.recorder.path)
+    assert header['island_map'] == geogr
+    assert [frame['year'] for frame in frames] == [0, 2, 4, 6]
+    assert list(years) == list(range(7))
+    assert counts[-1].tolist() == list(recorded._animal_count_history[6])
+    assert recorded.graphics is None
+
+
+@pytest.mark.parametrize('processes, chunk_size', [(1, None), (2, 1)])
+def test_render_frame_log(recorded, tmp_path, processes, chunk_size):
+    """Tests that every frame is drawn into an image numbered in order"""
+    img_base = str(tmp_path / 'render')
+    assert render_frame_log(recorded.recorder.path, img_base, processes=processes,
+                            chunk_size=chunk_size) == 4
+    names = sorted(path.name for path in tmp_path.glob('render_*.png'))
+    assert names == ['render_{:05d}.png'.format(k) for k in range(4)]
+
+
+def test_render(recorded, tmp_path):
+    """Tests that a simulation in record mode renders its images to img_base"""
+    assert recorded.render(processes=1) == 4
+    assert len(list(tmp_path.glob('sim_*.png'))) == 4
+
+
+def test_simulate_after_render(recorded):
+    """Tests that a simulation whose frame log was closed by render refuses to go on, without
+    simulating another year"""
+    recorded.render(processes=1)
+    with pytest.raises(RuntimeError, match='closed by render'):
+        recorded.simulate(1)
+    assert recorded.year == 6
+    with pytest.raises(RuntimeError):
+        recorded.recorder.record(7, recorded.island.get_statistics())
+
+
+def test_render_needs_frame_log():
+    """Tests that only a simulation in record mode can be rendered"""
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=124, headless=True)
+    with pytest.raises(RuntimeError):
+        sim.render('images')
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim.graphics import Graphics
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+"""
+Tests the parts of the graphics that can be checked without looking at the figure.
+"""
+
+
+@pytest.fixture
+def graphics():
+    """Return graphics for a small island with a few animals, and close the figure afterwards"""
+    g = Graphics("WWW\nWLW\nWWW", herb_map=[[0, 0, 0], [0, 3, 0], [0, 0, 0]],
+                 carn_map=[[0, 0, 0], [0, 1, 0], [0, 0, 0]], age_map=[[1, 2, 3], [4]],
+                 fitness_map=[[0.5, 0.6, 0.7], [0.9]], weight_map=[[10, 20, 30], [40]],
+                 hist_specs=None, animal_count_history={0: [3, 1]}, img_base=None,
+                 img_fmt=None)
+    yield g
+    plt.close(g.fig)
+
+
+def test_histogram_counts(graphics):
+    """Tests that the step lines hold the histogram counts of each species"""
+    graphics.update_weight_map([[1, 1, 3, 59], [30]])
+    herb_counts = graphics.weight_lines[0].get_ydata()[:-1]
+    carn_counts = graphics.weight_lines[1].get_ydata()[:-1]
+    assert list(herb_counts) == list(np.histogram([1, 1, 3, 59], bins=30, range=(0, 60))[0])
+    assert carn_counts.sum() == 1
+
+
+def test_histogram_rescale(graphics):
+    """Tests that the y axis of a histogram is only rescaled when the counts leave its range"""
+    assert not graphics.update_age_map([[1, 2, 3], [5]])
+    assert graphics.update_age_map([[1] * 100, []])
+    assert not graphics.update_age_map([[1] * 90, []])
+
+
+def test_num_animals_lines(graphics):
+    """Tests that the population lines follow the count history"""
+    graphics.update_num_animals({0: [3, 1], 1: [5, 2], 2: [8, 0]})
+    assert list(graphics.count_lines[0].get_ydata()) == [3, 5, 8]
+    assert list(graphics.count_lines[1].get_xdata()) == [0, 1, 2]
+
+
+def test_get_map():
+    """Tests that the map is colored by terrain, and downsampled to at most max_size pixels"""
+    island_map = '\n'.join(['W' * 10] + ['W' + 'L' * 8 + 'W'] * 8 + ['W' * 10])
+    map_rgb = Graphics.get_map(island_map)
+    assert map_rgb.shape == (10, 10, 3)
+    assert tuple(map_rgb[0, 0]) == (0.0, 0.0, 1.0)
+    assert tuple(map_rgb[1, 1]) == (0.0, 0.6, 0.0)
+    assert Graphics.get_map(island_map, max_size=4).shape == (4, 4, 3)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim.histograms import StreamingHistogram, complete_specs
+import numpy as np
+
+"""
+Tests the streaming histograms.
+"""
+
+
+def test_same_counts_as_numpy():
+    """Tests that values added in many small parts are counted as numpy counts them at once"""
+    rng = np.random.default_rng(3)
+    values = rng.uniform(-0.1, 1.1, size=1000)
+    values[:10] = 1.0
+    histogram = StreamingHistogram(20, 1.0, num_species=1, chunk_size=64)
+    for start in range(0, len(values), 7):
+        histogram.add(0, values[start:start + 7].tolist())
+    assert list(histogram.counts[0]) == list(np.histogram(values, bins=20, range=(0, 1))[0])
+
+
+def test_complete_specs():
+    """Tests that missing histogram specifications get the defaults"""
+    specs = complete_specs({'age': {'max': 100, 'delta': 5}})
+    assert specs['age'] == {'max': 100, 'delta': 5}
+    assert specs['fitness'] == {'max': 1.0, 'delta': 0.05}
+    assert StreamingHistogram.from_spec(specs['age']).counts.shape == (2, 20)
@@ -3,8 +3,9 @@
 __author__ = 'August N Steinset and Sunniva E Daae Steiro'
 __email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
 
-from biosim.island import Island
+from biosim.island import Island, terrain_grid
 import textwrap
+import numpy as np
 import pytest
 from biosim import terrain
 
@@ -49,7 +50,7 @@ carnivore_parameter = {'w_birth': 6.0, 'sigma_birth': 1.0, 'beta': 0.75, 'eta':
 @pytest.fixture
 def set_animal_parameters(request):
     """
-    Fixture setting class parameters on Animal.
+    Fixture setting the default class parameters of the animals, which every new island copies.
 
     The fixture sets Animal parameters when called for setup,
     and resets them when called for teardown. This ensures that modified
@@ -72,15 +73,15 @@ def set_animal_parameters(request):
         p_dict1 = request.param[1][0]
         species2 = request.param[0][1]
         p_dict2 = request.param[1][1]
-        Island.change_parameter(species1, p_dict1)
-        Island.change_parameter(species2, p_dict2)
+        Island.species[species1].set_animal_parameters(p_dict1)
+        Island.species[species2].set_animal_parameters(p_dict2)
     else:
         species = request.param[0]
         p_dict = request.param[1]
-        Island.change_parameter(species, p_dict)
+        Island.species[species].set_animal_parameters(p_dict)
     yield
-    Island.change_parameter('Herbivore', herbivore_parameter)
-    Island.change_parameter('Carnivore', carnivore_parameter)
+    Island.species['Herbivore'].set_animal_parameters(herbivore_parameter)
+    Island.species['Carnivore'].set_animal_parameters(carnivore_parameter)
 
 
 @pytest.mark.parametrize('set_animal_parameters', [['Herbivore', {'zeta': 0}]], indirect=True)
@@ -97,12 +98,31 @@ def test_change_animal_parameter(set_animal_parameters):
     assert 100 == island.island[2][2].herbivores_on_tile[0].parameter['zeta']
 
 
+def test_change_parameter_independent_islands():
+    """
+    Tests that changing the animal parameters of one island leaves the parameters of another
+    island, and the default parameters of the species, untouched.
+    """
+    island1 = Island(geogr, SEED, ini_herbs)
+    island2 = Island(geogr, SEED, ini_herbs)
+    island1.change_parameter('Herbivore', {'zeta': 100})
+    assert island1.island[2][2].herbivores_on_tile[0].parameter['zeta'] == 100
+    assert island2.island[2][2].herbivores_on_tile[0].parameter['zeta'] == 3.5
+    assert Island.species['Herbivore'].parameter['zeta'] == 3.5
+
+
+def test_change_parameter_rebuilds_table():
+    """Tests that the parameter table the animals read from is rebuilt when parameters change"""
+    island = Island(geogr, SEED, ini_carns)
+    island.change_parameter('Carnivore', {'DeltaPhiMax': 4})
+    assert island.island[2][2].carnivores_on_tile[0].table['inv_DeltaPhiMax'] == 0.25
+
+
 def test_change_landscape_parameter():
     """
     Tests that landscape parameters are changed correctly for highland and lowland, and that
-    the set_params function raises a valueError for illegal landscape types. The amount of fodder
-    on the island is not reset after testing, since the other tests will function
-    with the new values as well.
+    the set_params function raises a valueError for illegal landscape types. Only the tiles of
+    the island are changed, the default values of the terrain classes are left as they are.
     """
     island = Island(geogr, SEED)
     with pytest.raises(ValueError):
@@ -110,8 +130,9 @@ def test_change_landscape_parameter():
     island.set_params('H', {'f_max': 50})
     island.set_params('L', {'f_max': 1000})
     island.set_params('D', {'f_max': 1})
-    assert 50 == terrain.Highland.F_max and 1000 == terrain.Lowland.F_max and \
-           terrain.Desert.F_max == 1
+    assert 50 == island.island[3][3].F_max and 1000 == island.island[1][1].F_max
+    assert 300 == terrain.Highland.F_max and 800 == terrain.Lowland.F_max and \
+           terrain.Desert.F_max == 0
 
 
 @pytest.mark.parametrize('bad_boundary', ['L', 'H', 'D'])
@@ -148,6 +169,55 @@ def test_spawn_animal():
         maps = island.get_maps()
         assert maps[5]+maps[6] == len(ini_herbs[0]['pop']) + \
                (n+1)*len(ini_herbs[0]['pop'])
+    assert island.island[2][2].herbivores_on_tile[0].age == 5
+    assert type(island.island[2][2].herbivores_on_tile[0].age) is int
+
+
+def test_add_population_arrays():
+    """Tests that animals given as arrays are placed on their tile, and that bad populations are
+    refused before any animal is placed"""
+    island = Island(geogr, SEED)
+    island.add_population_arrays((3, 3), 'Carnivore', np.array([1, 2, 3]), np.array([10, 20, 30]))
+    carnivores = island.island[2][2].carnivores_on_tile
+    assert [(animal.age, animal.weight) for animal in carnivores] == [(1, 10), (2, 20), (3, 30)]
+    assert all(type(animal.age) is int for animal in carnivores)
+    with pytest.raises(ValueError):
+        island.add_population_arrays((3, 3), 'Herbivore', [1, 2], [10, -1])
+    with pytest.raises(ValueError):
+        island.add_population_arrays((3, 3), 'Omnivore', [1], [10])
+    with pytest.raises(IndexError):
+        island.add_population_arrays((6, 3), 'Herbivore', [1], [10])
+    with pytest.raises(ValueError):
+        island.add_population_arrays((3, 3), 'Herbivore', [1.5], [10])
+    assert island.get_maps()[5:7] == [0, 3]
+
+
+def test_add_population_tiles():
+    """Tests that animals given with the tile of each animal are placed on their tiles, in the
+    order given"""
+    island = Island(geogr, SEED)
+    island.add_population_tiles('Herbivore', [2, 3, 2], [2, 4, 2], [1, 2, 3], [10, 20, 30])
+    assert [animal.weight for animal in island.island[1][1].herbivores_on_tile] == [10, 30]
+    assert [animal.weight for animal in island.island[2][3].herbivores_on_tile] == [20]
+    with pytest.raises(ValueError):
+        island.add_population_tiles('Herbivore', [2, 3], [2], [1, 2], [10, 20])
+    with pytest.raises(IndexError):
+        island.add_population_tiles('Herbivore', [2, 0], [2, 2], [1, 2], [10, 20])
+    assert island.get_maps()[5] == 3
+
+
+def test_add_population_counts():
+    """Tests that a map of counts places that many equal animals on each tile"""
+    island = Island(geogr, SEED)
+    counts = np.zeros((5, 5), dtype=int)
+    counts[1, 1], counts[3, 3] = 4, 7
+    island.add_population_counts('Herbivore', counts, 3, 25)
+    assert (island.get_statistics()['herb_map'] == counts).all()
+    assert island.island[3][3].herbivores_on_tile[0].weight == 25
+    with pytest.raises(ValueError):
+        island.add_population_counts('Herbivore', counts[:4], 3, 25)
+    with pytest.raises(ValueError):
+        island.add_population_counts('Herbivore', -counts, 3, 25)
 
 
 @pytest.mark.parametrize('set_animal_parameters', [[['Herbivore', 'Carnivore'],
@@ -253,19 +323,55 @@ def test_all_migrate(set_animal_parameters, mocker):
     """
     Checks that there are no animals on the tile where they are spawned after calling
     all_migrate_herb, while mu (migration parameter) is set to 10 to ensure migration. By using
-    mocker, the direction of migration will be set to up every time, and the test therefore
-    asserts wether all animals have moved one tile up.
+    mocker on the random number generator of the island, the direction of migration will be set
+    to up every time, and the test therefore asserts wether all animals have moved one tile up.
     """
     for _ in range(10):
         island = Island(geogr, SEED)
         island.spawn_animal(ini_herbs)
         island.spawn_animal(ini_carns)
-        mocker.patch('random.randrange', return_value=0)
+        mocker.patch.object(island.rng, 'randrange', return_value=0)
         island.all_migrate()
         assert len(island.island[1][2].herbivores_on_tile) == 5 and \
                len(island.island[1][2].carnivores_on_tile) == 5
 
 
+def test_independent_random_streams():
+    """
+    Tests that two islands with the same seed develop in the same way, even when they are
+    simulated in turns, since every island draws from its own random number generator.
+    """
+    island1 = Island(geogr, SEED, ini_herbs)
+    island2 = Island(geogr, SEED, ini_herbs)
+    for island in [island1, island2]:
+        island.spawn_animal(ini_carns)
+    for _ in range(10):
+        for island in [island1, island2]:
+            island.all_eat()
+            island.all_breed()
+            island.all_migrate()
+            island.all_age()
+            island.all_lose_weight()
+            island.all_die()
+    assert island1.get_maps() == island2.get_maps()
+
+
+def test_collect_events():
+    """
+    Tests that the event counters of the tiles are gathered into arrays of the same shape as the
+    island, and that they are reset once collected.
+    """
+    island = Island(geogr, SEED, ini_herbs)
+    island.spawn_animal(ini_carns)
+    island.all_eat()
+    island.all_migrate()
+    events = island.collect_events()
+    assert events['fodder_eaten'].shape == (5, 5)
+    assert events['fodder_eaten'][2, 2] == 5 * herbivore_parameter['F']
+    assert events['migrations_attempted'].sum() >= events['migrations_completed'].sum()
+    assert all(counts.sum() == 0 for counts in island.collect_events().values())
+
+
 def test_get_maps():
     """
     Tests that all maps given by the get_maps function are correct when spawning a known
@@ -291,3 +397,39 @@ def test_get_maps():
                         [[5, 5, 5, 5, 5], [5, 5, 5, 5, 5]],
                         [[0.8, 0.8, 0.8, 0.8, 0.8], [0.8, 0.8, 0.8, 0.8, 0.8]],
                         [[10, 10, 10, 10, 10], [50, 50, 50, 50, 50]], 5, 5]
+
+
+def test_terrain_grid():
+    """Tests that the terrain grid holds the terrain codes, and is shared by equal maps"""
+    grid = terrain_grid('WWWW\nWLHW\nWDLW\nWWWW')
+    assert grid.tolist() == [[0, 0, 0, 0], [0, 1, 2, 0], [0, 3, 1, 0], [0, 0, 0, 0]]
+    assert Island('WWWW\nWLHW\nWDLW\nWWWW', 1).terrain is grid
+    with pytest.raises(ValueError):
+        terrain_grid('WWW\nWXW\nWWW')
+
+
+def test_density_map():
+    """Tests that the density map of the pyramid follows the density from get_maps"""
+    island = Island(geogr, SEED, ini_herbs)
+    island.all_migrate()
+    maps = island.get_maps()
+    assert island.density_map('Herbivore')[0].tolist() == maps[0]
+    coarse, level = island.density_map('Herbivore', max_size=2)
+    assert coarse.sum() == maps[5] and level > 0
+
+
+def test_get_statistics():
+    """Tests that the statistics agree with the maps, with the histograms binned as numpy does"""
+    island = Island(geogr, SEED, ini_herbs + ini_carns)
+    island.all_breed()
+    island.all_age()
+    maps = island.get_maps()
+    statistics = island.get_statistics({'weight': {'max': 100, 'delta': 5}})
+    assert statistics['herb_map'].tolist() == maps[0]
+    assert (statistics['num_herb'], statistics['num_carn']) == (maps[5], maps[6])
+    for k in range(2):
+        assert list(statistics['weight'][k]) == list(np.histogram(maps[4][k], bins=20,
+                                                                  range=(0, 100))[0])
+        assert list(statistics['age'][k]) == list(np.histogram(maps[2][k], bins=30,
+                                                               range=(0, 60))[0])
+    assert 'age' not in island.get_statistics(histograms=False)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim import kernels
+from biosim.arrays import PRECISIONS
+from biosim.animals import Herbivore, Carnivore
+import numpy as np
+import pytest
+
+"""
+Tests that the loop and NumPy versions of the kernels give the same animals for the same random
+numbers. The loops run uncompiled, which is what Numba compiles.
+"""
+
+herb_constants = kernels.species_constants(Herbivore.table)
+carn_constants = kernels.species_constants(Carnivore.table)
+
+
+def animals(rng, n):
+    """Returns ages, weights and fitness of n random animals"""
+    ages = rng.integers(0, 30, n).astype(float)
+    weights = rng.integers(0, 40, n).astype(float)
+    return ages, weights, kernels.fitness_numpy(ages, weights, herb_constants)
+
+
+def run_both(name, make_args, versions=(kernels.LOOP_KERNELS, kernels.NUMPY_KERNELS)):
+    """Runs two versions of a kernel, by default the loop and the NumPy version, on copies of the
+    same arguments, and returns the results together with the arguments after the call"""
+    outcomes = []
+    for version in versions:
+        args = make_args()
+        outcomes.append((version[name](*args), args))
+    return outcomes
+
+
+def assert_same(outcomes, rtol=1e-7):
+    """Asserts that the results and the changed arguments of the two versions are the same"""
+    (result1, args1), (result2, args2) = outcomes
+    np.testing.assert_allclose(result1, result2, rtol=rtol)
+    for arg1, arg2 in zip(args1, args2):
+        if isinstance(arg1, np.ndarray):
+            np.testing.assert_allclose(arg1, arg2, rtol=rtol)
+
+
+def kernel_args(name, precision):
+    """
+    Makes the arguments of a kernel with the animals stored in the types of a precision, as the
+    array engine hands them over.
+
+    :param name: The name of the kernel, a key of LOOP_KERNELS.
+    :param precision: A key of PRECISIONS.
+    :return: A function returning fresh copies of the arguments.
+    """
+    dtypes = PRECISIONS[precision]
+    rng = np.random.default_rng(7)
+    ages, weights, fitness = animals(rng, 300)
+    ages = ages.astype(dtypes['ages'])
+    weights = weights.astype(dtypes['weights'])
+    fitness = fitness.astype(dtypes['fitness'])
+    uniform = rng.random(300).astype(dtypes['fitness'])
+    tiles = np.sort(rng.integers(0, 4, 300)).astype(dtypes['tiles'])
+    if name == 'feed':
+        fodder = np.array([0., 300., 800., 1000.])
+        return lambda: (tiles, ages, weights.copy(), fitness.copy(), fodder, 10., 0.9, 9.,
+                        herb_constants)
+    if name == 'hunt':
+        herb_fitness = np.sort(fitness)
+        carn_fitness = -np.sort(-rng.random(10).astype(dtypes['fitness']))
+        draws = rng.random((10, 300)).astype(dtypes['fitness'])
+        return lambda: (herb_fitness, weights, ages[:10], weights[:10].copy(),
+                        carn_fitness.copy(), draws, 50., 0.75, 1 / 0.5, 0.5, carn_constants)
+    if name == 'breed':
+        counts = np.bincount(tiles)[tiles]
+        newborn = rng.normal(8, 1.5, 300)
+        return lambda: (counts, weights.copy(), fitness, uniform, newborn, 0.2, 33.25, 1.2)
+    if name == 'migrate':
+        movable = np.array([False, False, False, False, True, True, False, True, False]
+                           + [False] * 3)
+        inner = np.zeros(12, dtype=bool)
+        inner[[4, 5, 7]] = True
+        tiles = rng.choice([0, 4, 5, 7], 300).astype(dtypes['tiles'])
+        directions = rng.integers(4, size=300)
+        return lambda: (tiles.copy(), fitness, uniform, directions, 0.9, movable, inner, 3)
+    return lambda: (ages.copy(), weights.copy(), fitness.copy(), uniform, 0.05, 0.4,
+                    herb_constants)
+
+
+def test_fitness_numpy():
+    """Tests that the fitness is the one found by the animals"""
+    herbivore = Herbivore(20, 5)
+    herbivore.find_fitness()
+    fitness = kernels.fitness_numpy(np.array([5., 5.]), np.array([20., 0.]), herb_constants)
+    assert fitness[0] == pytest.approx(herbivore.fitness)
+    assert fitness[1] == 0
+
+
+def test_feed():
+    """Tests feeding of herbivores on tiles with plenty, some and no fodder"""
+    rng = np.random.default_rng(1)
+    tiles = np.sort(rng.integers(0, 4, 200))
+    ages, weights, fitness = animals(rng, 200)
+    fodder = np.array([0., 300., 800., 1000.])
+    outcomes = run_both('feed', lambda: (tiles, ages, weights.copy(), fitness.copy(), fodder,
+                                         10., 0.9, 9., herb_constants))
+    assert_same(outcomes)
+    assert list(outcomes[0][0]) == list(np.minimum(fodder, 10 * np.bincount(tiles)))
+
+
+def test_hunt():
+    """Tests that the carnivores of a tile kill the same herbivores"""
+    rng = np.random.default_rng(2)
+    herb_fitness = np.sort(rng.random(50))
+    herb_weights = rng.integers(1, 40, 50).astype(float)
+    carn_ages, carn_weights, _ = animals(rng, 10)
+    carn_fitness = -np.sort(-rng.random(10))
+    draws = rng.random((10, 50))
+    outcomes = run_both('hunt', lambda: (herb_fitness, herb_weights, carn_ages,
+                                         carn_weights.copy(), carn_fitness.copy(), draws, 50.,
+                                         0.75, 1 / 0.5, 0.5, carn_constants))
+    assert_same(outcomes)
+    assert outcomes[0][0] > 0
+
+
+def test_breed():
+    """Tests that the same animals give birth to the same newborn"""
+    rng = np.random.default_rng(3)
+    counts = rng.integers(1, 50, 300)
+    _, weights, fitness = animals(rng, 300)
+    uniform = rng.random(300)
+    newborn = rng.normal(8, 1.5, 300)
+    outcomes = run_both('breed', lambda: (counts, weights.copy(), fitness, uniform, newborn, 0.2,
+                                          33.25, 1.2))
+    assert_same(outcomes)
+    assert (outcomes[0][0] > 0).any()
+    assert not (outcomes[0][0][counts < 2] > 0).any()
+
+
+def test_migrate():
+    """Tests that the same animals move to the same tiles, and that they neither leave the border
+    nor enter water"""
+    rng = np.random.default_rng(4)
+    movable = np.array([False, False, False, False, True, True, False, True, False]
+                       + [False] * 3)
+    inner = np.zeros(12, dtype=bool)
+    inner[[4, 5, 7]] = True
+    tiles = rng.choice([0, 4, 5, 7], 400)
+    fitness = rng.random(400)
+    uniform = rng.random(400)
+    directions = rng.integers(4, size=400)
+    outcomes = run_both('migrate', lambda: (tiles.copy(), fitness, uniform, directions, 0.9,
+                                            movable, inner, 3))
+    assert_same(outcomes)
+    moves, (new_tiles, *_) = outcomes[0]
+    assert (moves == 2).any() and (moves == 1).any()
+    assert movable[new_tiles[tiles != 0]].all()
+    assert (new_tiles[tiles == 0] == 0).all()
+
+
+def test_end_of_year():
+    """Tests that the same animals age, lose weight and die"""
+    rng = np.random.default_rng(5)
+    ages, weights, fitness = animals(rng, 500)
+    uniform = rng.random(500)
+    outcomes = run_both('end_of_year', lambda: (ages.copy(), weights.copy(), fitness.copy(),
+                                                uniform, 0.05, 0.4, herb_constants))
+    assert_same(outcomes)
+    alive, (new_ages, new_weights, *_) = outcomes[0]
+    assert (new_ages == ages + 1).all()
+    assert not alive[weights == 0].any()
+    assert 0 < alive.sum() < 500
+
+
+def test_resolve_backend(monkeypatch):
+    """Tests that asking for Numba without Numba installed falls back to NumPy with a warning"""
+    with pytest.raises(ValueError):
+        kernels.resolve_backend('fortran')
+    assert kernels.resolve_backend('python') == 'python'
+    monkeypatch.setattr(kernels, 'numba', None)
+    assert kernels.resolve_backend('auto') == 'numpy'
+    with pytest.warns(UserWarning):
+        assert kernels.resolve_backend('numba') == 'numpy'
+
+
+@pytest.mark.parametrize('name', list(kernels.LOOP_KERNELS))
+def test_single_precision(name):
+    """Tests that the loop and NumPy versions agree on animals stored in single precision"""
+    assert_same(run_both(name, kernel_args(name, 'single')), rtol=1e-5)
+
+
+@pytest.mark.parametrize('precision', list(PRECISIONS))
+@pytest.mark.parametrize('name', list(kernels.LOOP_KERNELS))
+def test_numba_kernels(name, precision):
+    """Tests that every kernel compiles with Numba, for the types of both precisions, and gives
+    the same animals as the loop, if Numba is installed"""
+    pytest.importorskip('numba')
+    outcomes = run_both(name, kernel_args(name, precision),
+                        (kernels.LOOP_KERNELS, kernels.get_kernels('numba')))
+    assert_same(outcomes, rtol=1e-7 if precision == 'double' else 1e-5)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim.meanfield import MeanFieldIsland
+from biosim import meanfield
+from biosim.island import Island
+from biosim.simulation import BioSim
+from biosim.pipeline import Breed
+import numpy as np
+import textwrap
+import pytest
+
+"""
+Tests the deterministic engine following the expected number of animals.
+"""
+
+geogr = textwrap.dedent("""\
+                        WWWWW
+                        WLLLW
+                        WLLLW
+                        WLLHW
+                        WWWWW""")
+
+ini_pop = [{'loc': (3, 3),
+            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(40)] +
+                   [{'species': 'Carnivore', 'age': 5, 'weight': 20} for _ in range(10)]}]
+
+
+def simulate(island, years):
+    """Simulates the standard year on an engine, and returns its statistics"""
+    for _ in range(years):
+        island.all_eat()
+        island.all_breed()
+        island.all_migrate()
+        island.all_end_of_year()
+    return island.get_statistics()
+
+
+def test_spawn_animal():
+    """Tests that the animals are placed in the age class of their age on their tile"""
+    island = MeanFieldIsland(geogr, None, ini_pop, max_age=3)
+    assert island.age_classes('Herbivore')[0][12, 3] == 40
+    assert island.age_classes('Carnivore')[1][12, 3] == 20
+    statistics = island.get_statistics()
+    assert statistics['num_herb'] == 40 and statistics['num_carn'] == 10
+    assert statistics['age'].sum() == 50
+    with pytest.raises(IndexError):
+        island.spawn_animal([{'loc': (9, 9), 'pop': ini_pop[0]['pop']}])
+
+
+def test_deterministic():
+    """Tests that the seed makes no difference"""
+    maps = [simulate(MeanFieldIsland(geogr, seed, ini_pop), 20) for seed in (1, 2)]
+    assert (maps[0]['herb_map'] == maps[1]['herb_map']).all()
+    assert (maps[0]['weight'] == maps[1]['weight']).all()
+
+
+def test_events_add_up():
+    """Tests that the expected change of the population equals the expected births minus the
+    deaths and kills, and that no animals are placed in water"""
+    island = MeanFieldIsland(geogr, None, ini_pop)
+    for _ in range(5):
+        before = sum(numbers.sum() for numbers in island.numbers.values())
+        simulate(island, 1)
+        after = sum(numbers.sum() for numbers in island.numbers.values())
+        events = island.collect_events()
+        change = events['births'].sum() - events['deaths'].sum() - events['kills'].sum()
+        assert after - before == pytest.approx(change, abs=1e-3)
+    water = island.terrain.ravel() == 0
+    assert not island.age_classes('Herbivore')[0][water].any()
+
+
+def test_oldest_age_class():
+    """Tests that animals older than max_age stay in the last age class"""
+    island = MeanFieldIsland(geogr, None, [{'loc': (2, 2), 'pop': [
+        {'species': 'Herbivore', 'age': 2, 'weight': 50}] * 10}], max_age=3)
+    island.all_age()
+    island.all_age()
+    numbers, weights = island.age_classes('Herbivore')
+    assert numbers[6, 3] == 10 and weights[6, 3] == 50
+
+
+def test_close_to_island():
+    """Tests that the expected number of herbivores alone is close to the mean of stochastic
+    runs"""
+    herbivores = [{'loc': (3, 3), 'pop': ini_pop[0]['pop'][:40]}]
+    expected = simulate(MeanFieldIsland(geogr, None, herbivores), 15)['num_herb']
+    runs = [simulate(Island(geogr, seed, herbivores), 15)['num_herb'] for seed in range(5)]
+    assert expected == pytest.approx(np.mean(runs), rel=0.15)
+
+
+def test_biosim_backend():
+    """Tests that BioSim runs on the mean field engine"""
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=1, headless=True, backend='mean_field')
+    sim.simulate(5)
+    assert isinstance(sim.island, MeanFieldIsland)
+    assert sim.num_animals == sum(sim.num_animals_per_species.values()) > 0
+    assert sim.event_history[5]['births'] > 0
+
+
+def test_census_unrounded():
+    """Tests that an island whose expected animals round to none is not fast-forwarded, and that
+    breeding is only left out when neither species has more than one expected animal"""
+    one_herbivore = [{'loc': (3, 3), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}]}]
+    sim = BioSim(island_map=geogr, ini_pop=one_herbivore, seed=1, headless=True,
+                 backend='mean_field')
+    while sim.num_animals > 0:
+        sim.simulate(1)
+    remaining = sim.island.numbers['Herbivore'].sum()
+    sim.simulate(5)
+    assert 0 < sim.island.numbers['Herbivore'].sum() < remaining
+    assert sim.event_history[sim.year]['deaths'] > 0
+    assert not Breed().is_noop(1.4, 0) and Breed().is_noop(1, 0.5)
+
+
+def test_hunt_chunks(monkeypatch):
+    """Tests that hunting a few tiles at a time gives the same island as hunting all at once"""
+    spread = [{'loc': (row, col), 'pop': ini_pop[0]['pop']} for row in (2, 3) for col in (2, 3)]
+    islands = []
+    for elements in (meanfield.HUNT_ELEMENTS, 1):
+        monkeypatch.setattr(meanfield, 'HUNT_ELEMENTS', elements)
+        island = MeanFieldIsland(geogr, None, spread)
+        island.all_eat()
+        islands.append(island)
+    for species in island.species:
+        assert islands[0].numbers[species] == pytest.approx(islands[1].numbers[species])
+        assert islands[0].weights[species] == pytest.approx(islands[1].weights[species])
+
+
+def test_occupied_storage():
+    """Tests that only the tiles and the age classes holding animals are stored, and that the
+    storage grows with the migrations and the ageing and shrinks again"""
+    island = MeanFieldIsland(geogr, None, ini_pop)
+    assert island.tiles['Herbivore'].tolist() == [12]
+    assert island.numbers['Herbivore'].shape == (1, 6)
+    island.all_migrate()
+    assert island.tiles['Herbivore'].tolist() == [7, 11, 12, 13, 17]
+    island.all_age()
+    assert island.numbers['Herbivore'].shape == (5, 7)
+    numbers, weights = island.age_classes('Herbivore')
+    assert numbers.sum() == pytest.approx(40)
+    assert (numbers[island.tiles['Herbivore'], 6] > 0).all()
+    assert weights[17, 6] == pytest.approx(20)
+    island.numbers['Herbivore'][:2] = 0.
+    island._clean('Herbivore')
+    assert island.tiles['Herbivore'].tolist() == [12, 13, 17]
+
+
+def test_hunt_bins(monkeypatch):
+    """Tests that gathering the age classes in bins of fitness for the hunt kills about as many
+    herbivores, and feeds the carnivores about as much, as hunting with every age class on its
+    own"""
+    spread = [{'loc': (3, 3), 'pop': [{'species': species, 'age': age, 'weight': 2 + age * gain}
+                                      for species, gain in (('Herbivore', 1.5), ('Carnivore', 0.8))
+                                      for age in range(30)] * 3}]
+    islands = []
+    for bins in (meanfield.HUNT_BINS, 10 ** 9):
+        monkeypatch.setattr(meanfield, 'HUNT_BINS', bins)
+        island = MeanFieldIsland(geogr, None, spread)
+        island.change_parameter('Carnivore', {'DeltaPhiMax': 0.5})
+        island.all_carnivores_eat()
+        islands.append(island)
+    kills = [island.collect_events()['kills'].sum() for island in islands]
+    assert 0 < kills[0] == pytest.approx(kills[1], rel=0.002)
+    assert islands[0].weights['Carnivore'] == pytest.approx(islands[1].weights['Carnivore'],
+                                                            rel=0.01)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim.pipeline import (standard_year, eruption_year, Pipeline, Hunt, Breed, Die,
+                             AddPopulation)
+from biosim.simulation import BioSim
+import textwrap
+import pytest
+
+"""
+Tests the pipeline of phases making up a year.
+"""
+
+geogr = textwrap.dedent("""\
+                        WWWWW
+                        WLLLW
+                        WLLHW
+                        WWWWW""")
+
+herbivores = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                      for _ in range(20)]}]
+
+
+class Recorder:
+    """Records the order the phases are called in"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append(name)
+
+
+def test_standard_and_eruption_year():
+    """Tests that the eruption year hunts instead of letting all the animals eat"""
+    assert standard_year().names == ['all_eat', 'all_breed', 'all_migrate', 'all_end_of_year']
+    assert eruption_year().names[0] == 'all_carnivores_eat'
+    assert isinstance(eruption_year().phases[0], Hunt)
+
+
+def test_swap_skip_schedule():
+    """Tests that phases can be swapped, skipped and scheduled to some years"""
+    pipeline = standard_year().skip('all_migrate').schedule('all_breed', range(0, 10, 2))
+    island = Recorder()
+    compiled = pipeline.compile(island)
+    pipeline.run(compiled, 1)
+    pipeline.run(compiled, 2)
+    assert island.calls == ['all_eat', 'all_end_of_year',
+                            'all_eat', 'all_breed', 'all_end_of_year']
+    assert standard_year().names == Pipeline(standard_year().phases).names
+    with pytest.raises(ValueError):
+        standard_year().skip('all_sleep')
+
+
+def test_no_ops_elided():
+    """Tests that phases are left out when they cannot change the island, until animals may have
+    been added"""
+    pipeline = Pipeline([Breed(), Die(), AddPopulation([]), Breed(name='breed_again')])
+    island = Recorder()
+    pipeline.run(pipeline.compile(island), 1, census=(0, 0))
+    assert island.calls == ['spawn_animal', 'all_breed']
+    assert pipeline.elided == {'all_breed': 1, 'all_die': 1}
+
+
+def test_simulate_with_pipeline():
+    """Tests that a simulation can run a scenario adding animals in a scheduled year"""
+    pipeline = standard_year().insert('all_eat', AddPopulation(herbivores, years={3}))
+    sim = BioSim(island_map=geogr, ini_pop=[], seed=1, headless=True)
+    sim.simulate(2, pipeline=pipeline)
+    assert sim.num_animals == 0
+    sim.simulate(1, pipeline=pipeline)
+    assert sim.num_animals_per_species['Herbivore'] > 0
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim.populations import (write_population, read_population, add_population_file,
+                                file_statistics)
+from biosim.island import Island
+from biosim.arrays import ArrayIsland
+from biosim.cohorts import CohortIsland
+from biosim.simulation import BioSim
+import numpy as np
+import textwrap
+import pytest
+
+"""
+Tests writing and reading population files.
+"""
+
+geogr = textwrap.dedent("""\
+                        WWWWW
+                        WLLLW
+                        WLLLW
+                        WLLHW
+                        WWWWW""")
+
+SEED = 124
+
+ini_pop = [{'loc': (3, 3),
+            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(40)] +
+                   [{'species': 'Carnivore', 'age': 5, 'weight': 20} for _ in range(10)]}]
+
+
+def simulated(engine):
+    """Returns an island of the engine with animals of different tiles, ages and weights"""
+    island = engine(geogr, SEED, ini_pop)
+    for _ in range(4):
+        island.all_eat()
+        island.all_breed()
+        island.all_migrate()
+        island.all_end_of_year()
+    return island
+
+
+@pytest.mark.parametrize('suffix', ['csv', 'npz'])
+@pytest.mark.parametrize('engine', [Island, ArrayIsland, CohortIsland])
+def test_round_trip(tmp_path, suffix, engine):
+    """Tests that an island written to a file and loaded on a new island gives the same
+    statistics, also when read in other chunks than it was written in"""
+    island = simulated(engine)
+    path = tmp_path / 'population.{}'.format(suffix)
+    statistics = island.get_statistics()
+    assert write_population(path, island.animal_chunks(30)) == \
+        statistics['num_herb'] + statistics['num_carn']
+    assert file_statistics(path, (5, 5), chunk_size=17)['num_herb'] == statistics['num_herb']
+    loaded = engine(geogr, SEED)
+    add_population_file(loaded, path, chunk_size=17)
+    new_statistics = loaded.get_statistics()
+    for name in ('herb_map', 'carn_map', 'age', 'weight'):
+        assert (new_statistics[name] == statistics[name]).all()
+
+
+def test_one_call_per_species_and_chunk(tmp_path):
+    """Tests that the animals of a chunk are placed with one call per species, whatever the
+    number of tiles they are spread over"""
+    island = simulated(ArrayIsland)
+    assert (island.get_statistics()['herb_map'] > 0).sum() > 1
+    path = tmp_path / 'population.npz'
+    write_population(path, island.animal_chunks(1000))
+    calls = []
+    loaded = ArrayIsland(geogr, SEED)
+    add_tiles = loaded.add_population_tiles
+    loaded.add_population_tiles = lambda species, *args: calls.append(species) or add_tiles(
+        species, *args)
+    add_population_file(loaded, path)
+    assert sorted(calls) == ['Carnivore', 'Herbivore']
+    assert (loaded.get_statistics()['herb_map'] == island.get_statistics()['herb_map']).all()
+
+
+def test_read_chunks(tmp_path):
+    """Tests that the chunks of a file hold the values written"""
+    chunk = {'row': np.array([2, 3]), 'col': np.array([2, 4]), 'species': np.array([1, 0]),
+             'age': np.array([3., 4.]), 'weight': np.array([12.5, 0.1]),
+             'fitness': np.array([0.5, 0.25])}
+    for suffix in ('csv', 'npz'):
+        path = tmp_path / 'population.{}'.format(suffix)
+        write_population(path, [chunk, chunk])
+        chunks = list(read_population(path, chunk_size=3))
+        assert [len(read['row']) for read in chunks] == ([3, 1] if suffix == 'csv' else [2, 2])
+        for name, values in chunk.items():
+            assert list(np.concatenate([read[name] for read in chunks])) == list(values) * 2
+    with pytest.raises(ValueError):
+        write_population(tmp_path / 'population.txt', [chunk])
+
+
+def test_biosim_population_file(tmp_path):
+    """Tests that BioSim saves its animals to a file and adds animals from one"""
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=SEED, headless=True)
+    sim.simulate(3)
+    path = str(tmp_path / 'population.npz')
+    assert sim.save_population(path) == sim.num_animals
+    other = BioSim(island_map=geogr, ini_pop=[], seed=SEED, headless=True, backend='numpy')
+    other.add_population(path)
+    other.simulate(1)
+    assert other.year == 1 and other.num_animals > 0
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim.simulation import BioSim, VisualizationBudget
+from biosim.pipeline import standard_year, AddPopulation
+import textwrap
+import sys
+import pytest
+
+"""
+Tests the features of the BioSim class that go beyond the interface given in
+test_biosim_interface.py.
+"""
+
+geogr = """\
+           WWWWW
+           WLLLW
+           WLLLW
+           WLLHW
+           WWWWW
+           """
+geogr = textwrap.dedent(geogr)
+
+SEED = 124
+
+ini_pop = [{'loc': (3, 3),
+            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(20)] +
+                   [{'species': 'Carnivore', 'age': 5, 'weight': 20} for _ in range(5)]}]
+
+phases = ['all_eat', 'all_breed', 'all_migrate', 'all_end_of_year', 'get_statistics',
+          'update_graphics']
+
+
+@pytest.fixture
+def sim():
+    """Return a small simulation with both species for use in the tests below"""
+    return BioSim(island_map=geogr, ini_pop=ini_pop, seed=SEED)
+
+
+def test_timing_off_by_default(sim):
+    """Tests that no phase times are recorded unless timing is turned on"""
+    sim.simulate(3, vis_years=100)
+    assert sim.phase_times == {}
+
+
+def test_phase_times(sim):
+    """Tests that every phase of every simulated year is timed when timing is turned on"""
+    sim.timing = True
+    sim.simulate(3, vis_years=100)
+    assert list(sim.phase_times) == [1, 2, 3]
+    for times in sim.phase_times.values():
+        assert list(times) == phases
+        assert all(seconds >= 0 for seconds in times.values())
+
+
+def test_timing_report(sim):
+    """Tests that the timing report sums up the phase times over all the timed years"""
+    sim.timing = True
+    sim.simulate(4, vis_years=100)
+    report = sim.timing_report()
+    assert report['years'] == 4
+    assert report['total']['all_eat'] == pytest.approx(
+        sum(times['all_eat'] for times in sim.phase_times.values()))
+    assert sum(report['share'].values()) == pytest.approx(1)
+
+
+def test_timing_callback():
+    """Tests that the timing callback is called once for every simulated year"""
+    calls = []
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=SEED,
+                 timing_callback=lambda year, times: calls.append((year, times)))
+    sim.simulate_eruption(2, vis_years=100)
+    assert [year for year, _ in calls] == [1, 2]
+    assert 'all_carnivores_eat' in calls[0][1]
+
+
+def test_event_history(sim):
+    """
+    Tests that the change in population each year equals the number of births minus the number
+    of deaths and kills, since migrations only move animals around on the island.
+    """
+    sim.simulate(10, vis_years=100)
+    history = sim.event_history
+    for year in range(1, 11):
+        change = sum(sim._animal_count_history[year]) - sum(sim._animal_count_history[year - 1])
+        assert change == history[year]['births'] - history[year]['deaths'] - history[year]['kills']
+    assert sim.event_maps['births'].sum() == sum(history[year]['births'] for year in history)
+
+
+def test_headless():
+    """Tests that a headless simulation runs without creating any graphics"""
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=SEED, headless=True, timing=True)
+    sim.simulate(3)
+    assert sim.graphics is None and sim.year == 3
+    assert 'update_graphics' not in sim.phase_times[3]
+
+
+@pytest.mark.parametrize('profiler, suffix', [('sampling', '.collapsed'), ('cprofile', '.prof')])
+def test_profile(tmp_path, profiler, suffix):
+    """Tests that profiling writes the profile and the phase summary for the profiled years"""
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=SEED, headless=True)
+    sim.simulate(2)
+    output = str(tmp_path / 'sim')
+    report = sim.profile(5, output=output, profiler=profiler)
+    assert report['years'] == 5 and sim.year == 7 and not sim.timing
+    assert (tmp_path / ('sim' + suffix)).is_file()
+    assert (tmp_path / 'sim.phases.json').is_file()
+
+
+def test_profile_command(tmp_path, capsys):
+    """Tests that the profiling command prints the per phase summary"""
+    from biosim.profile import main
+    main(['--years', '3', '--output', str(tmp_path / 'cmd')])
+    assert 'all_eat' in capsys.readouterr().out
+
+
+def test_stream_movie(tmp_path, monkeypatch):
+    """
+    Tests that streamed frames are piped to the encoder without writing any images, using a
+    stand-in encoder that copies the raw frames from stdin to the output file.
+    """
+    encoder = tmp_path / 'encoder.py'
+    encoder.write_text('#!{}\nimport shutil, sys\n'
+                       'with open(sys.argv[-1], "wb") as f:\n'
+                       '    shutil.copyfileobj(sys.stdin.buffer, f)\n'.format(sys.executable))
+    encoder.chmod(0o755)
+    monkeypatch.setattr('biosim.graphics._FFMPEG_BINARY', str(encoder))
+    img_base = str(tmp_path / 'sim')
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=SEED, img_base=img_base,
+                 stream_movie=True)
+    sim.simulate(4, vis_years=1, img_years=2)
+    sim.make_movie()
+    # The first frame, year 0, is written when the graphics are set up
+    width, height = sim.graphics.fig.canvas.get_width_height()
+    assert (tmp_path / 'sim.output.mp4').stat().st_size == 3 * width * height * 4
+    assert not list(tmp_path.glob('*.png'))
+
+
+def test_visualization_budget(mocker):
+    """Tests that the figure is updated once the time since the last update is long enough"""
+    clock = mocker.patch('biosim.simulation.perf_counter', return_value=0.0)
+    budget = VisualizationBudget(0.1)
+    assert budget.due()
+    budget.drawn(0.5)
+    clock.return_value = 4.0
+    assert not budget.due()
+    clock.return_value = 4.5
+    assert budget.due()
+
+
+def test_adaptive_visualization(tmp_path, mocker):
+    """
+    Tests that with a share of time for drawing, years are skipped while drawing is expensive,
+    but images are still saved exactly every img_years.
+    """
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=SEED, img_base=str(tmp_path / 'sim'),
+                 img_fmt='png')
+    show_frame = mocker.spy(sim.graphics, 'show_frame')
+    sim.simulate(30, img_years=10, vis_share=0.01)
+    drawn = [call.args[0]['year'] for call in show_frame.call_args_list]
+    assert {10, 20, 30} <= set(drawn) and len(drawn) < 30
+    assert sum(call.kwargs['save'] for call in show_frame.call_args_list) == 3
+    assert len(list(tmp_path.glob('sim_*.png'))) == 4
+
+
+def test_fast_forward_empty_island(mocker):
+    """Tests that the years of an empty island are filled in without running the phases, and
+    that only the frames asked for are drawn"""
+    sim = BioSim(island_map=geogr, ini_pop=[], seed=SEED)
+    all_eat = mocker.spy(sim.island, 'all_eat')
+    show_frame = mocker.spy(sim.graphics, 'show_frame')
+    sim.simulate(1000, vis_years=250)
+    assert sim.year == 1000 and all_eat.call_count == 0
+    assert len(sim._animal_count_history) == 1001 and sim._animal_count_history[1000] == [0, 0]
+    assert sim.event_history[1000]['births'] == 0 and sim.event_history[1000]['fodder_eaten'] == 0
+    assert [call.args[0]['year'] for call in show_frame.call_args_list] == [250, 500, 750, 1000]
+
+
+def test_fast_forward_until_animals_added():
+    """Tests that fast-forwarding stops before a phase that adds animals"""
+    pipeline = standard_year().insert('all_eat', AddPopulation(ini_pop, years=[50]))
+    sim = BioSim(island_map=geogr, ini_pop=[], seed=SEED, headless=True, timing=True)
+    sim.simulate(60, pipeline=pipeline)
+    assert list(sim.phase_times) == list(range(50, 61))
+    assert sim._animal_count_history[49] == [0, 0] and sim.num_animals > 0
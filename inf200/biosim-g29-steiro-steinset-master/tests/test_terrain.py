@@ -4,6 +4,7 @@ __author__ = 'August N Steinset and Sunniva E Daae Steiro'
 __email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
 
 from biosim.terrain import Lowland, Highland
+import random
 
 seed = 123
 
@@ -109,6 +110,28 @@ def test_age_on_tile():
     assert terrain.herbivores_on_tile[0].age == 3 and terrain.carnivores_on_tile[0].age == 5
 
 
+def test_end_of_year_on_tile():
+    """Checks that the fused end of the year gives the same animals as ageing, losing weight and
+    dying one after the other, with the same random numbers"""
+    tiles = []
+    for _ in range(2):
+        terrain = Lowland(rng=random.Random(3))
+        terrain.spawn_animal([{'species': 'Herbivore', 'age': age, 'weight': age % 20}
+                              for age in range(60)])
+        terrain.spawn_animal([{'species': 'Carnivore', 'age': age, 'weight': age % 15}
+                              for age in range(40)])
+        tiles.append(terrain)
+    tiles[0].age_on_tile()
+    tiles[0].lose_weight_on_tile()
+    tiles[0].die_on_tile()
+    tiles[1].end_of_year_on_tile()
+    for species in ['herbivores_on_tile', 'carnivores_on_tile']:
+        assert [(a.age, a.weight, a.fitness) for a in getattr(tiles[0], species)] == \
+            [(a.age, a.weight, a.fitness) for a in getattr(tiles[1], species)]
+    assert tiles[0].events == tiles[1].events
+    assert tiles[0].rng.random() == tiles[1].rng.random()
+
+
 def test_count_animals():
     """Tests if the counting of animals returns the right amount"""
     terrain = Lowland()
@@ -118,12 +141,12 @@ def test_count_animals():
 
 
 def test_set_terrain_param():
-    """Tests if setting the terrain parameter on one tile changes it on all similar, but not different"""
+    """Tests if setting the terrain parameter on one tile changes only that tile"""
     terrain1 = Lowland()
     terrain2 = Lowland()
     terrain3 = Highland()
     terrain1.set_params({'f_max': 100})
-    assert terrain2.F_max == 100 and terrain3.F_max != 100
+    assert terrain1.F_max == 100 and terrain2.F_max == 800 and terrain3.F_max != 100
 
 
 def test_loose_weight_on_tile():
@@ -140,3 +163,28 @@ def test_loose_weight_on_tile():
         if i.weight >= 10:
             num_no_change += 1
     assert num_no_change == 0
+
+
+def test_event_counters():
+    """Tests that the tile counts births, deaths, kills and fodder eaten in the phases"""
+    terrain = Lowland()
+    terrain.spawn_animal([{'species': 'Herbivore', 'age': 2, 'weight': 500} for _ in range(300)])
+    terrain.breed_on_tile()
+    terrain.spawn_animal([{'species': 'Herbivore', 'age': 5, 'weight': 0} for _ in range(10)])
+    terrain.die_on_tile()
+    terrain.herb_eat_on_tile()
+    events = terrain.reset_events()
+    assert events['births'] == 300 and events['deaths'] >= 10
+    assert events['fodder_eaten'] == terrain.F_max
+    assert terrain.events == dict.fromkeys(terrain.event_names, 0)
+
+
+def test_migration_counters():
+    """Tests that blocked migrations are counted as attempted, but not completed"""
+    terrain = Lowland()
+    terrain.spawn_animal([{'species': 'Carnivore', 'age': 1, 'weight': 500} for _ in range(200)])
+    terrain.migration_carn([False, False, False, False])
+    assert terrain.events['migrations_attempted'] > 0
+    assert terrain.events['migrations_completed'] == 0
+    terrain.migration_carn([True, True, True, True])
+    assert terrain.events['migrations_completed'] > 0
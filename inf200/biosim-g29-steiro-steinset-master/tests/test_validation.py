@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim.island import Island
+from biosim import validation
+import numpy as np
+
+"""
+Tests the harness comparing simulation engines. Short versions of the single tile scenarios are
+used to keep the tests fast.
+"""
+
+scenarios = {name: dict(validation.SCENARIOS[name], years=10, check_years=[5, 10])
+             for name in ['single_tile_herbivores', 'single_tile_both']}
+
+
+class ImmortalIsland(Island):
+    """An engine where no animals die, which the harness should tell apart from Island"""
+
+    def all_die(self):
+        pass
+
+
+def test_run_scenario_counts():
+    """Tests that the counts start with the initial population and have one row per year"""
+    counts = validation.run_scenario(Island, scenarios['single_tile_both'], 1)
+    assert counts.shape == (11, 2)
+    assert list(counts[0]) == [50, 20]
+
+
+def test_same_engine_passes():
+    """Tests that Island compared with itself passes, since the samples come from the same
+    distribution"""
+    report = validation.validate(Island, scenarios=scenarios, num_seeds=20, processes=1)
+    assert report['passed']
+
+
+def test_different_engine_fails():
+    """Tests that an engine where no animals die fails the comparison"""
+    report = validation.validate(ImmortalIsland, scenarios=scenarios, num_seeds=20, processes=1)
+    assert not report['passed']
+    assert 'FAIL' in validation.format_validation_report(report)
+
+
+def test_z_test_equal_constant_samples():
+    """Tests that the z-test handles samples without variance"""
+    assert validation.z_test(np.zeros(5), np.zeros(5)) == 1.0
+    assert validation.z_test(np.zeros(5), np.ones(5)) == 0.0
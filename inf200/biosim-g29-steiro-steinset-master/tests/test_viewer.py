@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'August N Steinset and Sunniva E Daae Steiro'
+__email__ = 'augustei@nmbu.no and sunnivas@nmbu.no'
+
+from biosim.simulation import BioSim
+from biosim.viewer import FrameViewer
+import numpy as np
+import textwrap
+import pytest
+
+"""
+Tests the live view of a simulation in a separate process.
+"""
+
+geogr = textwrap.dedent("""\
+                        WWWWW
+                        WLLLW
+                        WLLHW
+                        WWWWW""")
+
+ini_pop = [{'loc': (2, 2),
+            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(20)]}]
+
+statistics = {'herb_map': np.zeros((4, 5)), 'carn_map': np.zeros((4, 5)),
+              'age': np.zeros((2, 30)), 'fitness': np.zeros((2, 20)),
+              'weight': np.zeros((2, 30)), 'num_herb': 0, 'num_carn': 0}
+
+
+def test_stale_frames_dropped():
+    """Tests that frames are dropped instead of waiting while the queue is full"""
+    viewer = FrameViewer(geogr, queue_size=1, start=False)
+    assert viewer.show(1, statistics)
+    assert not viewer.show(2, statistics)
+    assert not viewer.show(3, statistics)
+    assert viewer.sent == 1 and viewer.dropped == 2
+    assert [year for year, _, _ in viewer._history] == [2, 3]
+    viewer.close()
+
+
+def test_viewer_process():
+    """Tests that a simulation runs with the viewer process, which ends when closed"""
+    sim = BioSim(island_map=geogr, ini_pop=ini_pop, seed=124, viewer_process=True)
+    sim.simulate(10, vis_years=2)
+    assert sim.graphics is None
+    assert sim.viewer.sent + sim.viewer.dropped == 6
+    sim.close()
+    assert sim.viewer.process.exitcode == 0
+
+
+def test_viewer_saves_no_images():
+    """Tests that images can only be asked for together with a frame log"""
+    with pytest.raises(ValueError):
+        BioSim(island_map=geogr, ini_pop=ini_pop, seed=124, viewer_process=True,
+               img_base='sim', img_fmt='png')